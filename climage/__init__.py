@@ -6,32 +6,95 @@ from .__version__ import __version__
 __author__ = "Patrick Nappa"
 __email__ = "patricknappa@gmail.com"
 
+import importlib
+
 from climage.__main__ import (
     convert,
+    iter_convert,
     to_file,
+    convert_many,
+    to_files,
     main,
     convert_pil,
+    iter_convert_pil,
     convert_array,
+    iter_convert_array,
+    convert_buffer,
+    iter_convert_buffer,
+    convert_frames,
+    animate,
+    convert_viewport,
+    iter_convert_viewport,
     color_to_flags,
-    get_ansi_pixel,
-    get_reset_code,
+)
+from climage.colors import (
     color_types,
-    get_dual_unicode_ansi_pixels,
+    dither_modes,
+    graphics_modes,
+    glyph_modes,
+    register_palette,
+    load_palette,
 )
 
+# these pull in numpy, so are only imported when first used
+_lazy_exports = {
+    "get_ansi_pixel": "climage.climage",
+    "get_reset_code": "climage.climage",
+    "get_dual_unicode_ansi_pixels": "climage.climage",
+    "RenderCache": "climage.cache",
+    "TilePyramid": "climage.viewport",
+    "set_palette_cache": "climage.climage",
+    "PaletteTables": "climage.climage",
+    "Renderer": "climage.renderer",
+    "RenderStats": "climage.stats",
+    "Canvas": "climage.canvas",
+}
+
+
+def __getattr__(name):
+    if name not in _lazy_exports:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(_lazy_exports[name]), name)
+    globals()[name] = value
+    return value
+
+
 __all__: list[str] = [
     "__author__",
     "__email__",
     "convert",
+    "iter_convert",
     "to_file",
+    "convert_many",
+    "to_files",
     "main",
     "convert_pil",
+    "iter_convert_pil",
     "convert_array",
+    "iter_convert_array",
+    "convert_buffer",
+    "iter_convert_buffer",
+    "convert_frames",
+    "animate",
+    "convert_viewport",
+    "iter_convert_viewport",
     "color_to_flags",
     "get_ansi_pixel",
     "get_reset_code",
     "color_types",
+    "dither_modes",
+    "graphics_modes",
+    "glyph_modes",
+    "register_palette",
+    "load_palette",
+    "set_palette_cache",
+    "PaletteTables",
+    "Renderer",
+    "RenderStats",
+    "Canvas",
     "get_dual_unicode_ansi_pixels",
+    "RenderCache",
+    "TilePyramid",
 ]
 
 if __name__ == "__main__":
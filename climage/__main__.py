@@ -2,42 +2,25 @@
 # -*- coding: utf-8 -*-
 
 from . import __version__
-from .climage import (
-    _toAnsi,
-    _best,
+from .colors import (
     palettes,
+    dither_modes,
+    graphics_modes,
+    glyph_modes,
     color_types,
-    get_dual_unicode_ansi_pixels,
-    get_reset_code,
-    get_ansi_pixel,
-    convert_pixel_color,
+    load_palette,
 )
 
-from PIL import Image
-import argparse
+from io import BytesIO
+import functools
+import itertools
+import os
 import sys
-from io import StringIO
+import time
 
-
-def _get_color_type(is_truecolor, is_256color, is_16color, is_8color):
-    """Return an enum depending on which color is toggled. Exactly one must be toggled"""
-    assert (
-        int(bool(is_8color))
-        + int(bool(is_16color))
-        + int(bool(is_256color))
-        + int(bool(is_truecolor))
-        == 1
-        and "only pick one colormode"
-    )
-
-    if is_truecolor:
-        return color_types.truecolor
-    if is_256color:
-        return color_types.color256
-    if is_16color:
-        return color_types.color16
-    if is_8color:
-        return color_types.color8
+# numpy, Pillow, the conversion code, and even the CLI's argument parsing are imported
+# by the functions that need them rather than here, so that the CLI starts quickly
+# (e.g. for --help or --version) and importing the library stays cheap
 
 
 def color_to_flags(color_type):
@@ -63,6 +46,14 @@ def convert_pil(
     is_8color=False,
     width=80,
     palette="default",
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    resample="default",
+    graphics="none",
+    glyphs="half",
+    threads=1,
+    on_stats=None,
 ):
     """
     Convert an image, and return the resulting string.
@@ -77,18 +68,77 @@ def convert_pil(
     is_16color      -- Whether to use only the 16 System colors. Default False
     is_8color       -- Whether to use only the first 8 of the System colors. Default False.
     width           -- Number of columns the output will use
-    palette         -- Determines which RGB colors the System colors map to. This only is relevant when using 8/16/256 color modes. This may be one of ["default", "xterm", "linuxconsole", "solarized", "rxvt", "tango", "gruvbox", "gruvboxdark"]
+    palette         -- Determines which RGB colors the System colors map to. This only is relevant when using 8/16/256 color modes. This may be one of ["default", "xterm", "linuxconsole", "solarized", "rxvt", "tango", "gruvbox", "gruvboxdark"], or a palette added with register_palette or load_palette.
+    is_compact      -- Whether to only emit color changes between neighbouring cells, combining background and foreground into a single sequence. Looks identical, but produces much smaller output. Default False.
+    is_perceptual   -- Whether to pick the palette color that looks most similar (smallest CIELAB difference), rather than the nearest RGB value. Only relevant for 8/16/256 color modes. Default False.
+    dither          -- Dithering to apply in 8/16/256 color modes, to reduce banding in gradients. One of ["none", "bayer", "floyd-steinberg"]. Bayer (ordered) dithering is fastest, Floyd-Steinberg (error diffusion) gives smoother results. Default "none".
+    resample        -- Speed/quality trade off when resizing the image. "fast" samples the nearest pixel (after decoding JPEGs at the smallest scale possible), cheapest for thumbnails. "default" uses a bicubic filter over the decoded image (JPEGs are decoded at a reduced scale, down to three times the output size). "quality" uses a Lanczos filter over the whole image, which is slowest. Default "default".
+    graphics        -- Draw the image with a terminal graphics protocol instead of colored character cells, at far higher resolution in fewer bytes, on terminals supporting it. One of ["none", "kitty", "sixel"]. Images are sized assuming 10 pixels per column. Kitty images are sent in full color, and scaled by the terminal to fill width columns. Sixel images use the color mode (truecolor picks the 256 colors best suited to the image). Default "none".
+    glyphs          -- The characters unicode output is drawn with, one of ["half", "quadrant", "sextant"]. "half" draws 1x2 pixels per character with half blocks. "quadrant" draws 2x2 pixels and "sextant" 2x3 pixels per character, with the two colors and the glyph that fit each character's pixels best, for more detail per byte of output. Sextants need a font with Unicode 13's legacy computing symbols. Only used with is_unicode. Default "half".
+    threads         -- Number of threads converting each image, each taking a band of rows, which speeds up very wide output on several cores. Color lookups and glyph fitting run in parallel, while building the escape sequences is partly held back by Python's GIL, and resizing and Floyd-Steinberg dithering stay on a single thread. The output is the same for any number of threads. Default 1.
+    on_stats        -- Function called with a RenderStats once the whole output has been produced, recording the time taken by each stage of the conversion (decoding, resizing, color lookup, output), and counts of the pixels, color lookup table hits and misses, and output bytes. Default None.
 
     """
-    ctype = _get_color_type(
+    return "".join(
+        iter_convert_pil(
+            img,
+            is_unicode=is_unicode,
+            is_truecolor=is_truecolor,
+            is_256color=is_256color,
+            is_16color=is_16color,
+            is_8color=is_8color,
+            width=width,
+            palette=palette,
+            is_compact=is_compact,
+            is_perceptual=is_perceptual,
+            dither=dither,
+            resample=resample,
+            graphics=graphics,
+            glyphs=glyphs,
+            threads=threads,
+            on_stats=on_stats,
+        )
+    )
+
+
+def iter_convert_pil(
+    img,
+    is_unicode=False,
+    is_truecolor=False,
+    is_256color=True,
+    is_16color=False,
+    is_8color=False,
+    width=80,
+    palette="default",
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    resample="default",
+    graphics="none",
+    glyphs="half",
+    threads=1,
+    on_stats=None,
+):
+    """
+    Convert an image, yielding the resulting string one terminal row at a time (each including its line ending). Accepts the same arguments as convert_pil.
+    """
+    return _renderer(
+        is_unicode=is_unicode,
         is_truecolor=is_truecolor,
         is_256color=is_256color,
         is_16color=is_16color,
         is_8color=is_8color,
-    )
-    return _toAnsi(
-        img, oWidth=width, is_unicode=is_unicode, color_type=ctype, palette=palette
-    )
+        width=width,
+        palette=palette,
+        is_compact=is_compact,
+        is_perceptual=is_perceptual,
+        dither=dither,
+        resample=resample,
+        graphics=graphics,
+        glyphs=glyphs,
+        threads=threads,
+        on_stats=on_stats,
+    ).iter_convert_pil(img)
 
 
 def convert(
@@ -100,12 +150,133 @@ def convert(
     is_8color=False,
     width=80,
     palette="default",
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    resample="default",
+    graphics="none",
+    glyphs="half",
+    threads=1,
+    on_stats=None,
+    max_memory=None,
+    cache=None,
 ):
     """
     Convert an image, and return the resulting string.
 
     Arguments:
-    infile          -- The name of the input file to load. Example: '/home/user/image.png'
+    infile          -- The name of the input file to load, "-" to read it from stdin, or a readable binary file object. Example: '/home/user/image.png'
+
+    Keyword Arguments:
+    is_unicode      -- whether to use unicode in generating output (default False, ASCII will be used)
+    is_truecolor    -- whether to use RGB colors in generation (few terminals support this). Exactly one color option must only be selected. Default False.
+    is_256color     -- whether to use 256 colors (16 system colors, 6x6x6 color cube, and 24 grayscale colors) for generating the output. This is the default color setting. Please run colortest-256 for a demonstration of colors. Default True.
+    is_16color      -- Whether to use only the 16 System colors. Default False
+    is_8color       -- Whether to use only the first 8 of the System colors. Default False.
+    width           -- Number of columns the output will use
+    palette         -- Determines which RGB colors the System colors map to. This only is relevant when using 8/16/256 color modes. This may be one of ["default", "xterm", "linuxconsole", "solarized", "rxvt", "tango", "gruvbox", "gruvboxdark"], or a palette added with register_palette or load_palette.
+    is_compact      -- Whether to only emit color changes between neighbouring cells, combining background and foreground into a single sequence. Looks identical, but produces much smaller output. Default False.
+    is_perceptual   -- Whether to pick the palette color that looks most similar (smallest CIELAB difference), rather than the nearest RGB value. Only relevant for 8/16/256 color modes. Default False.
+    dither          -- Dithering to apply in 8/16/256 color modes, to reduce banding in gradients. One of ["none", "bayer", "floyd-steinberg"]. Bayer (ordered) dithering is fastest, Floyd-Steinberg (error diffusion) gives smoother results. Default "none".
+    resample        -- Speed/quality trade off when resizing the image. "fast" samples the nearest pixel (after decoding JPEGs at the smallest scale possible), cheapest for thumbnails. "default" uses a bicubic filter over the decoded image (JPEGs are decoded at a reduced scale, down to three times the output size). "quality" uses a Lanczos filter over the whole image, which is slowest. Default "default".
+    graphics        -- Draw the image with a terminal graphics protocol instead of colored character cells, at far higher resolution in fewer bytes, on terminals supporting it. One of ["none", "kitty", "sixel"]. Images are sized assuming 10 pixels per column. Kitty images are sent in full color, and scaled by the terminal to fill width columns. Sixel images use the color mode (truecolor picks the 256 colors best suited to the image). Default "none".
+    glyphs          -- The characters unicode output is drawn with, one of ["half", "quadrant", "sextant"]. "half" draws 1x2 pixels per character with half blocks. "quadrant" draws 2x2 pixels and "sextant" 2x3 pixels per character, with the two colors and the glyph that fit each character's pixels best, for more detail per byte of output. Sextants need a font with Unicode 13's legacy computing symbols. Only used with is_unicode. Default "half".
+    threads         -- Number of threads converting each image, each taking a band of rows, which speeds up very wide output on several cores. Color lookups and glyph fitting run in parallel, while building the escape sequences is partly held back by Python's GIL, and resizing and Floyd-Steinberg dithering stay on a single thread. The output is the same for any number of threads. Default 1.
+    on_stats        -- Function called with a RenderStats once the whole output has been produced, recording the time taken by each stage of the conversion (decoding, resizing, color lookup, output), and counts of the pixels, color lookup table hits and misses, and output bytes. Default None.
+    max_memory      -- Refuse to decode images whose pixels would take more than this many bytes, raising ValueError instead. Large JPEGs are decoded at reduced scale first, so count towards this at that size. Default None (no limit).
+    cache           -- A RenderCache, or the path of a directory, used to reuse earlier conversions of the same image file with the same options. Default None (no caching).
+
+    """
+    return "".join(
+        iter_convert(
+            filename,
+            is_unicode=is_unicode,
+            is_truecolor=is_truecolor,
+            is_256color=is_256color,
+            is_16color=is_16color,
+            is_8color=is_8color,
+            width=width,
+            palette=palette,
+            is_compact=is_compact,
+            is_perceptual=is_perceptual,
+            dither=dither,
+            resample=resample,
+            graphics=graphics,
+            glyphs=glyphs,
+            threads=threads,
+            on_stats=on_stats,
+            max_memory=max_memory,
+            cache=cache,
+        )
+    )
+
+
+def iter_convert(
+    filename,
+    is_unicode=False,
+    is_truecolor=False,
+    is_256color=True,
+    is_16color=False,
+    is_8color=False,
+    width=80,
+    palette="default",
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    resample="default",
+    graphics="none",
+    glyphs="half",
+    threads=1,
+    on_stats=None,
+    max_memory=None,
+    cache=None,
+):
+    """
+    Convert an image, yielding the resulting string one terminal row at a time (each including its line ending). Accepts the same arguments as convert.
+    """
+    return _renderer(
+        is_unicode=is_unicode,
+        is_truecolor=is_truecolor,
+        is_256color=is_256color,
+        is_16color=is_16color,
+        is_8color=is_8color,
+        width=width,
+        palette=palette,
+        is_compact=is_compact,
+        is_perceptual=is_perceptual,
+        dither=dither,
+        resample=resample,
+        graphics=graphics,
+        glyphs=glyphs,
+        threads=threads,
+        on_stats=on_stats,
+        cache=cache,
+    ).iter_convert(filename, max_memory=max_memory)
+
+
+def convert_frames(
+    filename,
+    is_unicode=False,
+    is_truecolor=False,
+    is_256color=True,
+    is_16color=False,
+    is_8color=False,
+    width=80,
+    palette="default",
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    resample="default",
+    graphics="none",
+    glyphs="half",
+    threads=1,
+    on_stats=None,
+):
+    """
+    Convert each frame of an animated image (GIF, APNG, WebP), yielding (string, duration) pairs, where duration is how long the frame is shown for in seconds. Upcoming frames are decoded and converted on a background thread. Images with a single frame yield just that frame.
+
+    Arguments:
+    infile          -- The name of the input file to load, "-" to read it from stdin, or a readable binary file object. Example: '/home/user/image.gif'
 
     Keyword Arguments:
     is_unicode      -- whether to use unicode in generating output (default False, ASCII will be used)
@@ -114,22 +285,303 @@ def convert(
     is_16color      -- Whether to use only the 16 System colors. Default False
     is_8color       -- Whether to use only the first 8 of the System colors. Default False.
     width           -- Number of columns the output will use
-    palette         -- Determines which RGB colors the System colors map to. This only is relevant when using 8/16/256 color modes. This may be one of ["default", "xterm", "linuxconsole", "solarized", "rxvt", "tango", "gruvbox", "gruvboxdark"]
+    palette         -- Determines which RGB colors the System colors map to. This only is relevant when using 8/16/256 color modes. This may be one of ["default", "xterm", "linuxconsole", "solarized", "rxvt", "tango", "gruvbox", "gruvboxdark"], or a palette added with register_palette or load_palette.
+    is_compact      -- Whether to only emit color changes between neighbouring cells, combining background and foreground into a single sequence. Looks identical, but produces much smaller output. Default False.
+    is_perceptual   -- Whether to pick the palette color that looks most similar (smallest CIELAB difference), rather than the nearest RGB value. Only relevant for 8/16/256 color modes. Default False.
+    dither          -- Dithering to apply in 8/16/256 color modes, to reduce banding in gradients. One of ["none", "bayer", "floyd-steinberg"]. Bayer (ordered) dithering is fastest, Floyd-Steinberg (error diffusion) gives smoother results. Default "none".
+    resample        -- Speed/quality trade off when resizing the image. "fast" samples the nearest pixel (after decoding JPEGs at the smallest scale possible), cheapest for thumbnails. "default" uses a bicubic filter over the decoded image (JPEGs are decoded at a reduced scale, down to three times the output size). "quality" uses a Lanczos filter over the whole image, which is slowest. Default "default".
+    graphics        -- Draw the image with a terminal graphics protocol instead of colored character cells, at far higher resolution in fewer bytes, on terminals supporting it. One of ["none", "kitty", "sixel"]. Images are sized assuming 10 pixels per column. Kitty images are sent in full color, and scaled by the terminal to fill width columns. Sixel images use the color mode (truecolor picks the 256 colors best suited to the image). Default "none".
+    glyphs          -- The characters unicode output is drawn with, one of ["half", "quadrant", "sextant"]. "half" draws 1x2 pixels per character with half blocks. "quadrant" draws 2x2 pixels and "sextant" 2x3 pixels per character, with the two colors and the glyph that fit each character's pixels best, for more detail per byte of output. Sextants need a font with Unicode 13's legacy computing symbols. Only used with is_unicode. Default "half".
+    threads         -- Number of threads converting each image, each taking a band of rows, which speeds up very wide output on several cores. Color lookups and glyph fitting run in parallel, while building the escape sequences is partly held back by Python's GIL, and resizing and Floyd-Steinberg dithering stay on a single thread. The output is the same for any number of threads. Default 1.
+    on_stats        -- Function called with a RenderStats for each frame once it has been converted, see convert. Default None.
 
     """
-    # open the img, but convert to rgb because this fails if grayscale
-    # (assumes pixels are at least triplets)
-    im = Image.open(filename).convert("RGB")
-    return convert_pil(
-        im,
+    convert_frame = functools.partial(
+        convert_pil,
+        is_unicode=is_unicode,
         is_truecolor=is_truecolor,
         is_256color=is_256color,
         is_16color=is_16color,
         is_8color=is_8color,
         width=width,
+        palette=palette,
+        is_compact=is_compact,
+        is_perceptual=is_perceptual,
+        dither=dither,
+        resample=resample,
+        graphics=graphics,
+        glyphs=glyphs,
+        threads=threads,
+        on_stats=on_stats,
+    )
+    from PIL import Image
+    from .animation import iter_frames
+    from .climage import _open_input
+
+    with Image.open(_open_input(filename)) as img:
+        yield from iter_frames(img, convert_frame)
+
+
+def animate(
+    filename,
+    is_unicode=False,
+    is_truecolor=False,
+    is_256color=True,
+    is_16color=False,
+    is_8color=False,
+    width=80,
+    palette="default",
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    resample="default",
+    graphics="none",
+    glyphs="half",
+    threads=1,
+    on_stats=None,
+    loops=None,
+    outfile=None,
+):
+    """
+    Play an animated image (GIF, APNG, WebP) in the terminal, redrawing each frame in place. Frames are shown for their own durations, and are dropped rather than delayed if the terminal falls behind.
+
+    Arguments:
+    infile          -- The name of the input file to load, "-" to read it from stdin, or a readable binary file object. Example: '/home/user/image.gif'
+
+    Keyword Arguments:
+    is_unicode      -- whether to use unicode in generating output (default False, ASCII will be used)
+    is_truecolor    -- whether to use RGB colors in generation (few terminals support this). Exactly one color option must only be selected. Default False.
+    is_256color     -- whether to use 256 colors (16 system colors, 6x6x6 color cube, and 24 grayscale colors) for generating the output. This is the default color setting. Please run colortest-256 for a demonstration of colors. Default True.
+    is_16color      -- Whether to use only the 16 System colors. Default False
+    is_8color       -- Whether to use only the first 8 of the System colors. Default False.
+    width           -- Number of columns the output will use
+    palette         -- Determines which RGB colors the System colors map to. This only is relevant when using 8/16/256 color modes. This may be one of ["default", "xterm", "linuxconsole", "solarized", "rxvt", "tango", "gruvbox", "gruvboxdark"], or a palette added with register_palette or load_palette.
+    is_compact      -- Whether to only emit color changes between neighbouring cells, combining background and foreground into a single sequence. Looks identical, but produces much smaller output. Default False.
+    is_perceptual   -- Whether to pick the palette color that looks most similar (smallest CIELAB difference), rather than the nearest RGB value. Only relevant for 8/16/256 color modes. Default False.
+    dither          -- Dithering to apply in 8/16/256 color modes, to reduce banding in gradients. One of ["none", "bayer", "floyd-steinberg"]. Bayer (ordered) dithering is fastest, Floyd-Steinberg (error diffusion) gives smoother results. Default "none".
+    resample        -- Speed/quality trade off when resizing the image. "fast" samples the nearest pixel (after decoding JPEGs at the smallest scale possible), cheapest for thumbnails. "default" uses a bicubic filter over the decoded image (JPEGs are decoded at a reduced scale, down to three times the output size). "quality" uses a Lanczos filter over the whole image, which is slowest. Default "default".
+    graphics        -- Draw the image with a terminal graphics protocol instead of colored character cells, at far higher resolution in fewer bytes, on terminals supporting it. One of ["none", "kitty", "sixel"]. Images are sized assuming 10 pixels per column. Kitty images are sent in full color, and scaled by the terminal to fill width columns. Animations can only be played as character cells. Default "none".
+    glyphs          -- The characters unicode output is drawn with, one of ["half", "quadrant", "sextant"]. "half" draws 1x2 pixels per character with half blocks. "quadrant" draws 2x2 pixels and "sextant" 2x3 pixels per character, with the two colors and the glyph that fit each character's pixels best, for more detail per byte of output. Sextants need a font with Unicode 13's legacy computing symbols. Only used with is_unicode. Default "half".
+    threads         -- Number of threads converting each image, each taking a band of rows, which speeds up very wide output on several cores. Color lookups and glyph fitting run in parallel, while building the escape sequences is partly held back by Python's GIL, and resizing and Floyd-Steinberg dithering stay on a single thread. The output is the same for any number of threads. Default 1.
+    on_stats        -- Function called with a RenderStats for each frame once it has been converted, see convert. Default None.
+    loops           -- How many times to play the animation, 0 meaning forever. Defaults to the loop count stored in the image.
+    outfile         -- The text file object to draw onto. Defaults to stdout.
+
+    """
+    from PIL import Image
+    from .animation import play
+
+    if graphics != "none":
+        # frames are redrawn in place by moving back up over their rows
+        raise ValueError("animations can only be played with graphics='none'")
+
+    if filename == "-":
+        # stdin can only be read once, and it is needed twice
+        filename = BytesIO(sys.stdin.buffer.read())
+    if loops is None:
+        with Image.open(filename) as img:
+            # Pillow reports 0 for images that loop forever, and omits the key for
+            # images that play once
+            loops = img.info.get("loop", 1)
+
+    frames = convert_frames(
+        filename,
         is_unicode=is_unicode,
+        is_truecolor=is_truecolor,
+        is_256color=is_256color,
+        is_16color=is_16color,
+        is_8color=is_8color,
+        width=width,
         palette=palette,
+        is_compact=is_compact,
+        is_perceptual=is_perceptual,
+        dither=dither,
+        resample=resample,
+        graphics=graphics,
+        glyphs=glyphs,
+        threads=threads,
+        on_stats=on_stats,
     )
+    play(frames, outfile if outfile is not None else sys.stdout, loops=loops)
+
+
+def convert_viewport(
+    image,
+    x=0.5,
+    y=0.5,
+    zoom=1.0,
+    rows=None,
+    is_unicode=False,
+    is_truecolor=False,
+    is_256color=True,
+    is_16color=False,
+    is_8color=False,
+    width=80,
+    palette="default",
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    resample="default",
+    graphics="none",
+    glyphs="half",
+    threads=1,
+    on_stats=None,
+    max_memory=None,
+):
+    """
+    Convert part of an image, as seen through a viewport that can be moved and zoomed, and return the resulting string. Only the detail shown by the viewport is resampled from the image, using a TilePyramid.
+
+    Arguments:
+    image           -- The image to view. May be the name of an image file ("-" reads it from stdin), a readable binary file object, a Pillow image, or a TilePyramid. To pan and zoom around a large image, create a TilePyramid once and pass it to each call, so that tiles already resampled are reused.
+
+    Keyword Arguments:
+    x               -- Horizontal centre of the viewport, as a fraction of the image width. Default 0.5 (the middle).
+    y               -- Vertical centre of the viewport, as a fraction of the image height. Default 0.5 (the middle).
+    zoom            -- Magnification, where 1 fits the whole image width into the output columns, and 2 shows half of it. Default 1.
+    rows            -- Number of rows the output will use, or None to show the whole height of the image at this zoom. The viewport is kept within the image, so fewer rows are output if the image doesn't fill them. Default None.
+    is_unicode      -- whether to use unicode in generating output (default False, ASCII will be used)
+    is_truecolor    -- whether to use RGB colors in generation (few terminals support this). Exactly one color option must only be selected. Default False.
+    is_256color     -- whether to use 256 colors (16 system colors, 6x6x6 color cube, and 24 grayscale colors) for generating the output. This is the default color setting. Please run colortest-256 for a demonstration of colors. Default True.
+    is_16color      -- Whether to use only the 16 System colors. Default False
+    is_8color       -- Whether to use only the first 8 of the System colors. Default False.
+    width           -- Number of columns the output will use
+    palette         -- Determines which RGB colors the System colors map to. This only is relevant when using 8/16/256 color modes. This may be one of ["default", "xterm", "linuxconsole", "solarized", "rxvt", "tango", "gruvbox", "gruvboxdark"], or a palette added with register_palette or load_palette.
+    is_compact      -- Whether to only emit color changes between neighbouring cells, combining background and foreground into a single sequence. Looks identical, but produces much smaller output. Default False.
+    is_perceptual   -- Whether to pick the palette color that looks most similar (smallest CIELAB difference), rather than the nearest RGB value. Only relevant for 8/16/256 color modes. Default False.
+    dither          -- Dithering to apply in 8/16/256 color modes, to reduce banding in gradients. One of ["none", "bayer", "floyd-steinberg"]. Bayer (ordered) dithering is fastest, Floyd-Steinberg (error diffusion) gives smoother results. Default "none".
+    resample        -- Speed/quality trade off when resizing the image. "fast" samples the nearest pixel (after decoding JPEGs at the smallest scale possible), cheapest for thumbnails. "default" uses a bicubic filter over the decoded image (JPEGs are decoded at a reduced scale, down to three times the output size). "quality" uses a Lanczos filter over the whole image, which is slowest. Default "default".
+    graphics        -- Draw the image with a terminal graphics protocol instead of colored character cells, at far higher resolution in fewer bytes, on terminals supporting it. One of ["none", "kitty", "sixel"]. Images are sized assuming 10 pixels per column. Kitty images are sent in full color, and scaled by the terminal to fill width columns. Sixel images use the color mode (truecolor picks the 256 colors best suited to the image). Default "none".
+    glyphs          -- The characters unicode output is drawn with, one of ["half", "quadrant", "sextant"]. "half" draws 1x2 pixels per character with half blocks. "quadrant" draws 2x2 pixels and "sextant" 2x3 pixels per character, with the two colors and the glyph that fit each character's pixels best, for more detail per byte of output. Sextants need a font with Unicode 13's legacy computing symbols. Only used with is_unicode. Default "half".
+    threads         -- Number of threads converting each image, each taking a band of rows, which speeds up very wide output on several cores. Color lookups and glyph fitting run in parallel, while building the escape sequences is partly held back by Python's GIL, and resizing and Floyd-Steinberg dithering stay on a single thread. The output is the same for any number of threads. Default 1.
+    on_stats        -- Function called with a RenderStats once the whole output has been produced, recording the time taken by each stage of the conversion (decoding, resizing, color lookup, output), and counts of the pixels, color lookup table hits and misses, and output bytes. Default None.
+    max_memory      -- When image is a file name, refuse to decode it if its pixels would take more than this many bytes, raising ValueError instead. Default None (no limit).
+
+    """
+    return "".join(
+        iter_convert_viewport(
+            image,
+            x=x,
+            y=y,
+            zoom=zoom,
+            rows=rows,
+            is_unicode=is_unicode,
+            is_truecolor=is_truecolor,
+            is_256color=is_256color,
+            is_16color=is_16color,
+            is_8color=is_8color,
+            width=width,
+            palette=palette,
+            is_compact=is_compact,
+            is_perceptual=is_perceptual,
+            dither=dither,
+            resample=resample,
+            graphics=graphics,
+            glyphs=glyphs,
+            threads=threads,
+            on_stats=on_stats,
+            max_memory=max_memory,
+        )
+    )
+
+
+def iter_convert_viewport(
+    image,
+    x=0.5,
+    y=0.5,
+    zoom=1.0,
+    rows=None,
+    is_unicode=False,
+    is_truecolor=False,
+    is_256color=True,
+    is_16color=False,
+    is_8color=False,
+    width=80,
+    palette="default",
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    resample="default",
+    graphics="none",
+    glyphs="half",
+    threads=1,
+    on_stats=None,
+    max_memory=None,
+):
+    """
+    Convert part of an image, yielding the resulting string one terminal row at a time (each including its line ending). Accepts the same arguments as convert_viewport.
+    """
+    from PIL import Image
+    from .climage import _load
+    from .climage import _open_input
+    from .viewport import TilePyramid
+
+    renderer = _renderer(
+        is_unicode=is_unicode,
+        is_truecolor=is_truecolor,
+        is_256color=is_256color,
+        is_16color=is_16color,
+        is_8color=is_8color,
+        width=width,
+        palette=palette,
+        is_compact=is_compact,
+        is_perceptual=is_perceptual,
+        dither=dither,
+        resample=resample,
+        graphics=graphics,
+        glyphs=glyphs,
+        threads=threads,
+        on_stats=on_stats,
+    )
+    stats = renderer._new_stats()
+
+    # output pixels per column and per row: two columns per pixel in ascii, the
+    # glyph's pixels in unicode, and whole cells of pixels with graphics
+    if graphics != "none":
+        from .graphics import cell_size
+
+        column_pixels, row_pixels = cell_size
+    elif is_unicode:
+        from .glyphs import glyph_shapes
+
+        column_pixels, row_pixels = glyph_shapes[glyphs]
+    else:
+        column_pixels, row_pixels = 0.5, 1
+
+    start = time.perf_counter()
+    if isinstance(image, Image.Image):
+        image = TilePyramid(image)
+    elif not isinstance(image, TilePyramid):
+        # only decode as much detail as can be seen at this zoom
+        image = TilePyramid(
+            _load(
+                _open_input(image),
+                oWidth=max(1, int(width * max(1, column_pixels) * zoom)),
+                is_unicode=is_unicode or graphics != "none",
+                max_memory=max_memory,
+                resample=resample,
+            )
+        )
+        if stats is not None:
+            stats.add_time("decode", time.perf_counter() - start)
+            start = time.perf_counter()
+
+    pixels = image.view(
+        x,
+        y,
+        zoom,
+        int(width * column_pixels),
+        None if rows is None else rows * row_pixels,
+        resample=resample,
+        # cells are twice as tall as they are wide
+        aspect=2 * column_pixels / row_pixels,
+    )
+    if is_unicode and graphics == "none":
+        pixels = pixels[: len(pixels) - len(pixels) % row_pixels]
+    if stats is not None:
+        # tiles already resampled for an earlier view take no time here
+        stats.add_time("resize", time.perf_counter() - start)
+
+    return renderer._report(renderer._iter_array(pixels, stats, columns=width), stats)
 
 
 def convert_array(
@@ -140,6 +592,13 @@ def convert_array(
     is_16color=False,
     is_8color=False,
     palette="default",
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    graphics="none",
+    glyphs="half",
+    threads=1,
+    on_stats=None,
 ):
     """
     Convert an array representing an image, and return the resulting string. Expects a numpy array or multi-dimensional representing an image in row-major format, with elements representing RGB triplets.
@@ -153,46 +612,186 @@ def convert_array(
     is_256color     -- whether to use 256 colors (16 system colors, 6x6x6 color cube, and 24 grayscale colors) for generating the output. This is the default color setting. Please run colortest-256 for a demonstration of colors. Default True.
     is_16color      -- Whether to use only the 16 System colors. Default False
     is_8color       -- Whether to use only the first 8 of the System colors. Default False.
-    palette         -- Determines which RGB colors the System colors map to. This only is relevant when using 8/16/256 color modes. This may be one of ["default", "xterm", "linuxconsole", "solarized", "rxvt", "tango", "gruvbox", "gruvboxdark"]
+    palette         -- Determines which RGB colors the System colors map to. This only is relevant when using 8/16/256 color modes. This may be one of ["default", "xterm", "linuxconsole", "solarized", "rxvt", "tango", "gruvbox", "gruvboxdark"], or a palette added with register_palette or load_palette.
+    is_compact      -- Whether to only emit color changes between neighbouring cells, combining background and foreground into a single sequence. Looks identical, but produces much smaller output. Default False.
+    is_perceptual   -- Whether to pick the palette color that looks most similar (smallest CIELAB difference), rather than the nearest RGB value. Only relevant for 8/16/256 color modes. Default False.
+    dither          -- Dithering to apply in 8/16/256 color modes, to reduce banding in gradients. One of ["none", "bayer", "floyd-steinberg"]. Bayer (ordered) dithering is fastest, Floyd-Steinberg (error diffusion) gives smoother results. Default "none".
+    graphics        -- Draw the image with a terminal graphics protocol instead of colored character cells, one of ["none", "kitty", "sixel"], see convert. The array is drawn at its size in pixels. Default "none".
+    glyphs          -- The characters unicode output is drawn with, one of ["half", "quadrant", "sextant"]. "half" draws 1x2 pixels per character with half blocks. "quadrant" draws 2x2 pixels and "sextant" 2x3 pixels per character, with the two colors and the glyph that fit each character's pixels best, for more detail per byte of output. Sextants need a font with Unicode 13's legacy computing symbols. Only used with is_unicode. Default "half".
+    threads         -- Number of threads converting each image, each taking a band of rows, which speeds up very wide output on several cores. Color lookups and glyph fitting run in parallel, while building the escape sequences is partly held back by Python's GIL, and resizing and Floyd-Steinberg dithering stay on a single thread. The output is the same for any number of threads. Default 1.
+    on_stats        -- Function called with a RenderStats once the whole output has been produced, recording the time taken by each stage of the conversion (decoding, resizing, color lookup, output), and counts of the pixels, color lookup table hits and misses, and output bytes. Default None.
 
     """
-    ctype = _get_color_type(
+    return "".join(
+        iter_convert_array(
+            arr,
+            is_unicode=is_unicode,
+            is_truecolor=is_truecolor,
+            is_256color=is_256color,
+            is_16color=is_16color,
+            is_8color=is_8color,
+            palette=palette,
+            is_compact=is_compact,
+            is_perceptual=is_perceptual,
+            dither=dither,
+            graphics=graphics,
+            glyphs=glyphs,
+            threads=threads,
+            on_stats=on_stats,
+        )
+    )
+
+
+def iter_convert_array(
+    arr,
+    is_unicode=False,
+    is_truecolor=False,
+    is_256color=True,
+    is_16color=False,
+    is_8color=False,
+    palette="default",
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    graphics="none",
+    glyphs="half",
+    threads=1,
+    on_stats=None,
+):
+    """
+    Convert an array representing an image, yielding the resulting string one terminal row at a time (each including its line ending). Accepts the same arguments as convert_array.
+    """
+    return _renderer(
+        is_unicode=is_unicode,
         is_truecolor=is_truecolor,
         is_256color=is_256color,
         is_16color=is_16color,
         is_8color=is_8color,
+        palette=palette,
+        is_compact=is_compact,
+        is_perceptual=is_perceptual,
+        dither=dither,
+        graphics=graphics,
+        glyphs=glyphs,
+        threads=threads,
+        on_stats=on_stats,
+    ).iter_convert_array(arr)
+
+
+def convert_buffer(
+    buffer,
+    size,
+    channels="RGB",
+    stride=None,
+    is_unicode=False,
+    is_truecolor=False,
+    is_256color=True,
+    is_16color=False,
+    is_8color=False,
+    width=80,
+    palette="default",
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    resample="default",
+    graphics="none",
+    glyphs="half",
+    threads=1,
+    on_stats=None,
+):
+    """
+    Convert raw 8 bit pixels held in memory, and return the resulting string. Accepts anything supporting the buffer protocol (bytes, bytearray, memoryview, mmap, numpy arrays including numpy.memmap, multiprocessing.shared_memory buffers), and reads the pixels directly from it without intermediate copies.
+
+    Arguments:
+    buffer          -- The object holding the pixels, row by row from the top left.
+    size            -- The (width, height) of the image in pixels.
+
+    Keyword Arguments:
+    channels        -- Order of the channels of each pixel, one of ["RGB", "BGR", "RGBA", "RGBX", "BGRA", "BGRX", "ARGB", "XRGB", "ABGR", "XBGR"]. Alpha is ignored, as with other inputs. Default "RGB".
+    stride          -- Number of bytes from the start of one row to the start of the next, for rows that are padded. Default None (rows are packed together).
+    is_unicode      -- whether to use unicode in generating output (default False, ASCII will be used)
+    is_truecolor    -- whether to use RGB colors in generation (few terminals support this). Exactly one color option must only be selected. Default False.
+    is_256color     -- whether to use 256 colors (16 system colors, 6x6x6 color cube, and 24 grayscale colors) for generating the output. This is the default color setting. Please run colortest-256 for a demonstration of colors. Default True.
+    is_16color      -- Whether to use only the 16 System colors. Default False
+    is_8color       -- Whether to use only the first 8 of the System colors. Default False.
+    width           -- Number of columns the output will use
+    palette         -- Determines which RGB colors the System colors map to. This only is relevant when using 8/16/256 color modes. This may be one of ["default", "xterm", "linuxconsole", "solarized", "rxvt", "tango", "gruvbox", "gruvboxdark"], or a palette added with register_palette or load_palette.
+    is_compact      -- Whether to only emit color changes between neighbouring cells, combining background and foreground into a single sequence. Looks identical, but produces much smaller output. Default False.
+    is_perceptual   -- Whether to pick the palette color that looks most similar (smallest CIELAB difference), rather than the nearest RGB value. Only relevant for 8/16/256 color modes. Default False.
+    dither          -- Dithering to apply in 8/16/256 color modes, to reduce banding in gradients. One of ["none", "bayer", "floyd-steinberg"]. Bayer (ordered) dithering is fastest, Floyd-Steinberg (error diffusion) gives smoother results. Default "none".
+    resample        -- Speed/quality trade off when resizing the image. "fast" samples the nearest pixel (after decoding JPEGs at the smallest scale possible), cheapest for thumbnails. "default" uses a bicubic filter over the decoded image (JPEGs are decoded at a reduced scale, down to three times the output size). "quality" uses a Lanczos filter over the whole image, which is slowest. Default "default".
+    graphics        -- Draw the image with a terminal graphics protocol instead of colored character cells, at far higher resolution in fewer bytes, on terminals supporting it. One of ["none", "kitty", "sixel"]. Images are sized assuming 10 pixels per column. Kitty images are sent in full color, and scaled by the terminal to fill width columns. Sixel images use the color mode (truecolor picks the 256 colors best suited to the image). Default "none".
+    glyphs          -- The characters unicode output is drawn with, one of ["half", "quadrant", "sextant"]. "half" draws 1x2 pixels per character with half blocks. "quadrant" draws 2x2 pixels and "sextant" 2x3 pixels per character, with the two colors and the glyph that fit each character's pixels best, for more detail per byte of output. Sextants need a font with Unicode 13's legacy computing symbols. Only used with is_unicode. Default "half".
+    threads         -- Number of threads converting each image, each taking a band of rows, which speeds up very wide output on several cores. Color lookups and glyph fitting run in parallel, while building the escape sequences is partly held back by Python's GIL, and resizing and Floyd-Steinberg dithering stay on a single thread. The output is the same for any number of threads. Default 1.
+    on_stats        -- Function called with a RenderStats once the whole output has been produced, recording the time taken by each stage of the conversion (decoding, resizing, color lookup, output), and counts of the pixels, color lookup table hits and misses, and output bytes. Default None.
+
+    """
+    return "".join(
+        iter_convert_buffer(
+            buffer,
+            size,
+            channels=channels,
+            stride=stride,
+            is_unicode=is_unicode,
+            is_truecolor=is_truecolor,
+            is_256color=is_256color,
+            is_16color=is_16color,
+            is_8color=is_8color,
+            width=width,
+            palette=palette,
+            is_compact=is_compact,
+            is_perceptual=is_perceptual,
+            dither=dither,
+            resample=resample,
+            graphics=graphics,
+            glyphs=glyphs,
+            threads=threads,
+            on_stats=on_stats,
+        )
     )
 
-    assert (not is_unicode) or len(
-        arr
-    ) % 2 == 0, "Expecting even number of rows in array for unicode conversion"
-
-    # where the converted string will be put in
-    ansi_build = StringIO()
-
-    yit = iter(range(len(arr)))
-    for y in yit:
-        for col in range(len(arr[y])):
-            # Must be hashable for our kd-tree...
-            pix = tuple(arr[y][col])
-            assert len(pix) >= 3, "Expecting RGB or RGBA array"
-            if is_unicode:
-                bottom_pix = tuple(arr[y + 1][col])
-                ansi_build.write(
-                    get_dual_unicode_ansi_pixels(
-                        pix, bottom_pix, ctype=ctype, palette=palette
-                    )
-                )
-            else:
-                ansi_build.write(get_ansi_pixel(pix, ctype=ctype, palette=palette))
-        # Line ending, reset colours
-        # We do this not to affect the surrounding terminal content.
-        ansi_build.write("{}\n".format(get_reset_code()))
-        if is_unicode:
-            # skip a row because we do two rows at once
-            next(yit, None)
 
-    return ansi_build.getvalue()
+def iter_convert_buffer(
+    buffer,
+    size,
+    channels="RGB",
+    stride=None,
+    is_unicode=False,
+    is_truecolor=False,
+    is_256color=True,
+    is_16color=False,
+    is_8color=False,
+    width=80,
+    palette="default",
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    resample="default",
+    graphics="none",
+    glyphs="half",
+    threads=1,
+    on_stats=None,
+):
+    """
+    Convert raw pixels held in memory, yielding the resulting string one terminal row at a time (each including its line ending). Accepts the same arguments as convert_buffer.
+    """
+    return _renderer(
+        is_unicode=is_unicode,
+        is_truecolor=is_truecolor,
+        is_256color=is_256color,
+        is_16color=is_16color,
+        is_8color=is_8color,
+        width=width,
+        palette=palette,
+        is_compact=is_compact,
+        is_perceptual=is_perceptual,
+        dither=dither,
+        resample=resample,
+        graphics=graphics,
+        glyphs=glyphs,
+        threads=threads,
+        on_stats=on_stats,
+    ).iter_convert_buffer(buffer, size, channels=channels, stride=stride)
 
 
 def to_file(
@@ -205,13 +804,24 @@ def to_file(
     is_8color=False,
     width=80,
     palette="default",
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    resample="default",
+    graphics="none",
+    glyphs="half",
+    threads=1,
+    on_stats=None,
+    max_memory=None,
+    cache=None,
 ):
     """
-    Convert an image, and output to file.
+    Convert an image, and output to file. Rows are encoded as UTF-8 and written out
+    in large chunks as they are converted, rather than building the whole string first.
 
     Arguments:
-    infile          -- The name of the input file to load. Example: '/home/user/image.png'
-    outfile         -- The name of the output file that the string will be written into.
+    infile          -- The name of the input file to load, "-" to read it from stdin, or a readable binary file object. Example: '/home/user/image.png'
+    outfile         -- The name of the output file that the string will be written into, or a writable file object. Binary file objects (sys.stdout.buffer, pipes, socket.makefile("wb")) are written to directly, text ones through their underlying binary buffer. File objects are left open.
 
     Keyword Arguments:
     is_unicode      -- Whether to use unicode in generating output (default False, ASCII will be used)
@@ -220,28 +830,328 @@ def to_file(
     is_16color      -- Whether to use only the 16 System colors. Default False
     is_8color       -- Whether to use only the first 8 of the System colors. Default False.
     width           -- Number of columns the output will use
-    palette         -- Determines which RGB colors the System colors map to. This only is relevant when using 8/16/256 color modes. This may be one of ["default", "xterm", "linuxconsole", "solarized", "rxvt", "tango", "gruvbox", "gruvboxdark"]
+    palette         -- Determines which RGB colors the System colors map to. This only is relevant when using 8/16/256 color modes. This may be one of ["default", "xterm", "linuxconsole", "solarized", "rxvt", "tango", "gruvbox", "gruvboxdark"], or a palette added with register_palette or load_palette.
+    is_compact      -- Whether to only emit color changes between neighbouring cells, combining background and foreground into a single sequence. Looks identical, but produces much smaller output. Default False.
+    is_perceptual   -- Whether to pick the palette color that looks most similar (smallest CIELAB difference), rather than the nearest RGB value. Only relevant for 8/16/256 color modes. Default False.
+    dither          -- Dithering to apply in 8/16/256 color modes, to reduce banding in gradients. One of ["none", "bayer", "floyd-steinberg"]. Bayer (ordered) dithering is fastest, Floyd-Steinberg (error diffusion) gives smoother results. Default "none".
+    resample        -- Speed/quality trade off when resizing the image. "fast" samples the nearest pixel (after decoding JPEGs at the smallest scale possible), cheapest for thumbnails. "default" uses a bicubic filter over the decoded image (JPEGs are decoded at a reduced scale, down to three times the output size). "quality" uses a Lanczos filter over the whole image, which is slowest. Default "default".
+    graphics        -- Draw the image with a terminal graphics protocol instead of colored character cells, at far higher resolution in fewer bytes, on terminals supporting it. One of ["none", "kitty", "sixel"]. Images are sized assuming 10 pixels per column. Kitty images are sent in full color, and scaled by the terminal to fill width columns. Sixel images use the color mode (truecolor picks the 256 colors best suited to the image). Default "none".
+    glyphs          -- The characters unicode output is drawn with, one of ["half", "quadrant", "sextant"]. "half" draws 1x2 pixels per character with half blocks. "quadrant" draws 2x2 pixels and "sextant" 2x3 pixels per character, with the two colors and the glyph that fit each character's pixels best, for more detail per byte of output. Sextants need a font with Unicode 13's legacy computing symbols. Only used with is_unicode. Default "half".
+    threads         -- Number of threads converting each image, each taking a band of rows, which speeds up very wide output on several cores. Color lookups and glyph fitting run in parallel, while building the escape sequences is partly held back by Python's GIL, and resizing and Floyd-Steinberg dithering stay on a single thread. The output is the same for any number of threads. Default 1.
+    on_stats        -- Function called with a RenderStats once the whole output has been produced, recording the time taken by each stage of the conversion (decoding, resizing, color lookup, output), and counts of the pixels, color lookup table hits and misses, and output bytes. Default None.
+    max_memory      -- Refuse to decode images whose pixels would take more than this many bytes, raising ValueError instead. Large JPEGs are decoded at reduced scale first, so count towards this at that size. Default None (no limit).
+    cache           -- A RenderCache, or the path of a directory, used to reuse earlier conversions of the same image file with the same options. Default None (no caching).
 
     """
-    with open(outfile, "w") as ofile:
-        ansi_str = convert(
-            infile,
-            is_unicode=is_unicode,
-            is_truecolor=is_truecolor,
-            is_256color=is_256color,
-            is_16color=is_16color,
-            is_8color=is_8color,
-            width=width,
-            palette=palette,
-        )
-        ofile.write(ansi_str)
+    from .output import write_rows
+
+    rows = iter_convert(
+        infile,
+        is_unicode=is_unicode,
+        is_truecolor=is_truecolor,
+        is_256color=is_256color,
+        is_16color=is_16color,
+        is_8color=is_8color,
+        width=width,
+        palette=palette,
+        is_compact=is_compact,
+        is_perceptual=is_perceptual,
+        dither=dither,
+        resample=resample,
+        graphics=graphics,
+        glyphs=glyphs,
+        threads=threads,
+        on_stats=on_stats,
+        max_memory=max_memory,
+        cache=cache,
+    )
+    if hasattr(outfile, "write"):
+        write_rows(rows, outfile)
+        return
+    with open(outfile, "wb") as ofile:
+        write_rows(rows, ofile)
+
+
+def convert_many(
+    filenames,
+    jobs=None,
+    is_unicode=False,
+    is_truecolor=False,
+    is_256color=True,
+    is_16color=False,
+    is_8color=False,
+    width=80,
+    palette="default",
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    resample="default",
+    graphics="none",
+    glyphs="half",
+    threads=1,
+    on_stats=None,
+    max_memory=None,
+    cache=None,
+):
+    """
+    Convert many images across a pool of processes, yielding the resulting strings in the same order as the input files.
+
+    Arguments:
+    filenames       -- The names of the input files to load.
+
+    Keyword Arguments:
+    jobs            -- Number of worker processes to use. Defaults to the number of CPUs, 1 converts in this process.
+    is_unicode      -- whether to use unicode in generating output (default False, ASCII will be used)
+    is_truecolor    -- whether to use RGB colors in generation (few terminals support this). Exactly one color option must only be selected. Default False.
+    is_256color     -- whether to use 256 colors (16 system colors, 6x6x6 color cube, and 24 grayscale colors) for generating the output. This is the default color setting. Please run colortest-256 for a demonstration of colors. Default True.
+    is_16color      -- Whether to use only the 16 System colors. Default False
+    is_8color       -- Whether to use only the first 8 of the System colors. Default False.
+    width           -- Number of columns the output will use
+    palette         -- Determines which RGB colors the System colors map to. This only is relevant when using 8/16/256 color modes. This may be one of ["default", "xterm", "linuxconsole", "solarized", "rxvt", "tango", "gruvbox", "gruvboxdark"], or a palette added with register_palette or load_palette.
+    is_compact      -- Whether to only emit color changes between neighbouring cells, combining background and foreground into a single sequence. Looks identical, but produces much smaller output. Default False.
+    is_perceptual   -- Whether to pick the palette color that looks most similar (smallest CIELAB difference), rather than the nearest RGB value. Only relevant for 8/16/256 color modes. Default False.
+    dither          -- Dithering to apply in 8/16/256 color modes, to reduce banding in gradients. One of ["none", "bayer", "floyd-steinberg"]. Bayer (ordered) dithering is fastest, Floyd-Steinberg (error diffusion) gives smoother results. Default "none".
+    resample        -- Speed/quality trade off when resizing the image. "fast" samples the nearest pixel (after decoding JPEGs at the smallest scale possible), cheapest for thumbnails. "default" uses a bicubic filter over the decoded image (JPEGs are decoded at a reduced scale, down to three times the output size). "quality" uses a Lanczos filter over the whole image, which is slowest. Default "default".
+    graphics        -- Draw the image with a terminal graphics protocol instead of colored character cells, at far higher resolution in fewer bytes, on terminals supporting it. One of ["none", "kitty", "sixel"]. Images are sized assuming 10 pixels per column. Kitty images are sent in full color, and scaled by the terminal to fill width columns. Sixel images use the color mode (truecolor picks the 256 colors best suited to the image). Default "none".
+    glyphs          -- The characters unicode output is drawn with, one of ["half", "quadrant", "sextant"]. "half" draws 1x2 pixels per character with half blocks. "quadrant" draws 2x2 pixels and "sextant" 2x3 pixels per character, with the two colors and the glyph that fit each character's pixels best, for more detail per byte of output. Sextants need a font with Unicode 13's legacy computing symbols. Only used with is_unicode. Default "half".
+    threads         -- Number of threads converting each image, each taking a band of rows, which speeds up very wide output on several cores. Color lookups and glyph fitting run in parallel, while building the escape sequences is partly held back by Python's GIL, and resizing and Floyd-Steinberg dithering stay on a single thread. The output is the same for any number of threads. Default 1.
+    on_stats        -- Function called with a RenderStats for each image, in input order, see convert. Default None.
+    max_memory      -- Refuse to decode images whose pixels would take more than this many bytes, raising ValueError instead. Large JPEGs are decoded at reduced scale first, so count towards this at that size. Default None (no limit).
+    cache           -- A RenderCache, or the path of a directory, used to reuse earlier conversions of the same image file with the same options. Default None (no caching).
+
+    """
+    convert_one = functools.partial(
+        convert,
+        is_unicode=is_unicode,
+        is_truecolor=is_truecolor,
+        is_256color=is_256color,
+        is_16color=is_16color,
+        is_8color=is_8color,
+        width=width,
+        palette=palette,
+        is_compact=is_compact,
+        is_perceptual=is_perceptual,
+        dither=dither,
+        resample=resample,
+        graphics=graphics,
+        glyphs=glyphs,
+        threads=threads,
+        max_memory=max_memory,
+        cache=cache,
+    )
+    if on_stats is None:
+        yield from _pool_map(convert_one, jobs, filenames)
+        return
+    for ansi_str, stats in _pool_map(
+        functools.partial(_with_stats, convert_one), jobs, filenames
+    ):
+        on_stats(stats)
+        yield ansi_str
+
+
+def to_files(
+    infiles,
+    outfiles,
+    jobs=None,
+    is_unicode=False,
+    is_truecolor=False,
+    is_256color=True,
+    is_16color=False,
+    is_8color=False,
+    width=80,
+    palette="default",
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    resample="default",
+    graphics="none",
+    glyphs="half",
+    threads=1,
+    on_stats=None,
+    max_memory=None,
+    cache=None,
+):
+    """
+    Convert many images across a pool of processes, writing each to its own output file.
+
+    Arguments:
+    infiles         -- The names of the input files to load.
+    outfiles        -- The names of the output files, one for each input file.
+
+    Keyword Arguments:
+    jobs            -- Number of worker processes to use. Defaults to the number of CPUs, 1 converts in this process.
+    is_unicode      -- Whether to use unicode in generating output (default False, ASCII will be used)
+    is_truecolor    -- Whether to use RGB colors in generation (few terminals support this). Exactly one color option must only be selected. Default False.
+    is_256color     -- Whether to use 256 colors (16 system colors, 6x6x6 color cube, and 24 grayscale colors) for generating the output. This is the default color setting. Please run colortest-256 for a demonstration of colors. Default True.
+    is_16color      -- Whether to use only the 16 System colors. Default False
+    is_8color       -- Whether to use only the first 8 of the System colors. Default False.
+    width           -- Number of columns the output will use
+    palette         -- Determines which RGB colors the System colors map to. This only is relevant when using 8/16/256 color modes. This may be one of ["default", "xterm", "linuxconsole", "solarized", "rxvt", "tango", "gruvbox", "gruvboxdark"], or a palette added with register_palette or load_palette.
+    is_compact      -- Whether to only emit color changes between neighbouring cells, combining background and foreground into a single sequence. Looks identical, but produces much smaller output. Default False.
+    is_perceptual   -- Whether to pick the palette color that looks most similar (smallest CIELAB difference), rather than the nearest RGB value. Only relevant for 8/16/256 color modes. Default False.
+    dither          -- Dithering to apply in 8/16/256 color modes, to reduce banding in gradients. One of ["none", "bayer", "floyd-steinberg"]. Bayer (ordered) dithering is fastest, Floyd-Steinberg (error diffusion) gives smoother results. Default "none".
+    resample        -- Speed/quality trade off when resizing the image. "fast" samples the nearest pixel (after decoding JPEGs at the smallest scale possible), cheapest for thumbnails. "default" uses a bicubic filter over the decoded image (JPEGs are decoded at a reduced scale, down to three times the output size). "quality" uses a Lanczos filter over the whole image, which is slowest. Default "default".
+    graphics        -- Draw the image with a terminal graphics protocol instead of colored character cells, at far higher resolution in fewer bytes, on terminals supporting it. One of ["none", "kitty", "sixel"]. Images are sized assuming 10 pixels per column. Kitty images are sent in full color, and scaled by the terminal to fill width columns. Sixel images use the color mode (truecolor picks the 256 colors best suited to the image). Default "none".
+    glyphs          -- The characters unicode output is drawn with, one of ["half", "quadrant", "sextant"]. "half" draws 1x2 pixels per character with half blocks. "quadrant" draws 2x2 pixels and "sextant" 2x3 pixels per character, with the two colors and the glyph that fit each character's pixels best, for more detail per byte of output. Sextants need a font with Unicode 13's legacy computing symbols. Only used with is_unicode. Default "half".
+    threads         -- Number of threads converting each image, each taking a band of rows, which speeds up very wide output on several cores. Color lookups and glyph fitting run in parallel, while building the escape sequences is partly held back by Python's GIL, and resizing and Floyd-Steinberg dithering stay on a single thread. The output is the same for any number of threads. Default 1.
+    on_stats        -- Function called with a RenderStats for each image, in input order, see convert. Default None.
+    max_memory      -- Refuse to decode images whose pixels would take more than this many bytes, raising ValueError instead. Large JPEGs are decoded at reduced scale first, so count towards this at that size. Default None (no limit).
+    cache           -- A RenderCache, or the path of a directory, used to reuse earlier conversions of the same image file with the same options. Default None (no caching).
+
+    """
+    infiles = list(infiles)
+    outfiles = list(outfiles)
+    assert len(infiles) == len(outfiles), "Expecting an output file for each input"
+    to_file_one = functools.partial(
+        _to_file_pair,
+        is_unicode=is_unicode,
+        is_truecolor=is_truecolor,
+        is_256color=is_256color,
+        is_16color=is_16color,
+        is_8color=is_8color,
+        width=width,
+        palette=palette,
+        is_compact=is_compact,
+        is_perceptual=is_perceptual,
+        dither=dither,
+        resample=resample,
+        graphics=graphics,
+        glyphs=glyphs,
+        threads=threads,
+        max_memory=max_memory,
+        cache=cache,
+    )
+    if on_stats is None:
+        for _ in _pool_map(to_file_one, jobs, zip(infiles, outfiles)):
+            pass
+        return
+    for _, stats in _pool_map(
+        functools.partial(_with_stats, to_file_one), jobs, zip(infiles, outfiles)
+    ):
+        on_stats(stats)
+
+
+def _renderer(**kwargs):
+    """Return a Renderer using the palette tables shared by the module functions."""
+    from .climage import default_tables
+    from .renderer import Renderer
+
+    return Renderer(tables=default_tables, **kwargs)
+
+
+def _write_output(rows, outfile):
+    """Write the rows of a single image to the named file, or stdout for "-"."""
+    from .output import write_rows
+
+    if outfile != "-":
+        with open(outfile, "wb") as ofile:
+            write_rows(rows, ofile)
+    else:
+        # the output has always been followed by a blank line
+        write_rows(itertools.chain(rows, ["\n"]), sys.stdout)
+
+
+def _parse_size(text):
+    """Parse a WxH size given on the command line."""
+    import argparse
+
+    try:
+        width, height = (int(n) for n in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected WIDTHxHEIGHT, got {!r}".format(text))
+    return width, height
+
+
+def _positive_int(text):
+    """Parse a count given on the command line, which must be at least 1."""
+    import argparse
+
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected a number, got {!r}".format(text))
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, got {}".format(value))
+    return value
+
+
+def _to_file_pair(files, **kwargs):
+    to_file(*files, **kwargs)
+
+
+def _with_stats(func, *args):
+    """Call func, returning its result along with the RenderStats it reported."""
+    reported = []
+    result = func(*args, on_stats=reported.append)
+    return result, reported[0] if reported else None
+
+
+def _pool_map(func, jobs, items):
+    """Map func over items in a process pool, yielding results in order."""
+    items = list(items)
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(items))
+    if jobs <= 1:
+        yield from map(func, items)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    from . import climage, colors
+
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        # workers may not be forked from this process, so need telling what has
+        # been set up here
+        initargs=(dict(colors._custom_palettes), climage.default_tables.cache_dir),
+    ) as pool:
+        # hand out several images at a time, which matters for small thumbnails
+        # where the conversion is cheaper than the round trip to the worker
+        chunksize = max(1, len(items) // (jobs * 4))
+        yield from pool.map(func, items, chunksize=chunksize)
+
+
+def _init_worker(custom_palettes, palette_cache_dir):
+    from . import climage, colors
+
+    for name, palette_colors in custom_palettes.items():
+        colors.register_palette(name, palette_colors)
+    if palette_cache_dir is not None:
+        climage.set_palette_cache(palette_cache_dir)
+
+
+def _expand_inputs(patterns):
+    """Expand glob patterns in input names, keeping other names as is."""
+    import glob
+
+    infiles = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            infiles.extend(sorted(glob.glob(pattern)))
+        else:
+            infiles.append(pattern)
+    return infiles
+
+
+def _read_file_list(listfile):
+    """Read names of input files, one per line, ignoring blank lines."""
+    return [line.rstrip("\n") for line in listfile if line.strip()]
 
 
 def main():
+    if sys.argv[1:2] == ["serve"]:
+        from .server import main as serve
+
+        serve(sys.argv[2:])
+        return
+
+    import argparse
+
     arg_parser = argparse.ArgumentParser(
         prog="climage {0}".format(__version__),
         description="An easy way to convert images for display in terminals",
-        epilog="",
+        epilog="Run climage serve --help to see how to start a server for --connect.",
         add_help=True,
     )
 
@@ -263,6 +1173,12 @@ def main():
         action="store_true",
         default=True,
     )
+    arg_parser.add_argument(
+        "--glyphs",
+        choices=glyph_modes,
+        default="half",
+        help="The characters unicode output is drawn with (implies --unicode): half blocks drawing 1x2 pixels each (default), quadrants drawing 2x2, or sextants drawing 2x3, for more detail in the same output. Sextants need a recent font, such as Cascadia Code, Iosevka or Unifont.",
+    )
 
     color_type_group = arg_parser.add_mutually_exclusive_group()
     color_type_group.add_argument(
@@ -301,6 +1217,73 @@ def main():
         help="Choose a system color palette - only applies to 8, 16, or 256 color modes. This is especially helpful for terminal themes that drastically change the appearance of default collors, achieving more accurate colors on those terminals.",
     )
 
+    arg_parser.add_argument(
+        "--palette-file",
+        metavar="file",
+        help="Use the system colors in this file as the palette, either a JSON list of 16 [r, g, b] colors (as printed by extra/colorextract.py), or one #rrggbb color per line.",
+    )
+
+    arg_parser.add_argument(
+        "--palette-cache",
+        metavar="dir",
+        help="Keep the tables used to match colors to the palette in this directory, so later runs start with them already filled in.",
+    )
+
+    arg_parser.add_argument(
+        "--perceptual",
+        action="store_true",
+        default=False,
+        help="Match colors by how similar they look (CIELAB difference) rather than by RGB distance. Gives more faithful results with the 8 and 16 color palettes.",
+    )
+
+    arg_parser.add_argument(
+        "--dither",
+        "-d",
+        choices=dither_modes,
+        default="none",
+        help="Dither the colors to reduce banding - only applies to 8, 16, or 256 color modes. bayer is fastest, floyd-steinberg gives smoother results.",
+    )
+
+    arg_parser.add_argument(
+        "--graphics",
+        "-g",
+        choices=graphics_modes,
+        default="none",
+        help="Draw images with a terminal graphics protocol rather than colored characters, for far more detail in less output. kitty is supported by kitty, WezTerm and Konsole, sixel by xterm (-ti vt340), foot, mlterm and others. Images are sized assuming 10 pixels per column.",
+    )
+
+    resample_group = arg_parser.add_mutually_exclusive_group()
+    resample_group.add_argument(
+        "--fast",
+        dest="resample",
+        action="store_const",
+        const="fast",
+        default="default",
+        help="Resize images as cheaply as possible (nearest neighbour, and decoding JPEGs at the smallest scale), e.g. for thumbnails. Fine detail may shimmer or alias.",
+    )
+    resample_group.add_argument(
+        "--quality",
+        dest="resample",
+        action="store_const",
+        const="quality",
+        help="Resize images with a Lanczos filter over the whole image. Sharpest, but slowest for large images.",
+    )
+
+    arg_parser.add_argument(
+        "--compact",
+        "-c",
+        action="store_true",
+        default=False,
+        help="Only emit color changes between neighbouring cells. Looks identical, but greatly reduces the output size for images with large flat areas.",
+    )
+
+    arg_parser.add_argument(
+        "--animate",
+        action="store_true",
+        default=False,
+        help="Play all frames of an animated image (GIF, APNG, WebP) in place, rather than only converting the first.",
+    )
+
     arg_parser.add_argument(
         "--quiet", "-q", action="store_true", default=False, help="Disable warnings."
     )
@@ -323,15 +1306,130 @@ def main():
         default="-",
     )
 
-    arg_parser.add_argument("inputfile", help="The image file you wish to convert.")
+    arg_parser.add_argument(
+        "--output-dir",
+        metavar="dir",
+        help="Write each converted image into this directory, as the input's name with a .txt extension. Useful when converting many images.",
+    )
+
+    arg_parser.add_argument(
+        "--files-from",
+        metavar="listfile",
+        help="Read the names of images to convert from this file, one per line. Use - to read them from stdin.",
+    )
+
+    arg_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Number of processes used when converting many images (default the number of CPUs).",
+    )
+    arg_parser.add_argument(
+        "--threads",
+        type=_positive_int,
+        default=1,
+        metavar="N",
+        help="Number of threads converting each image, in bands of rows (default 1). Speeds up very wide output on several cores.",
+    )
+
+    arg_parser.add_argument(
+        "--cache-dir",
+        metavar="dir",
+        help="Keep converted images in this directory, and reuse them when the same image is converted again with the same options.",
+    )
+
+    arg_parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=256,
+        metavar="MB",
+        help="Maximum size of the --cache-dir directory in megabytes, least recently used renders are removed beyond this (default 256).",
+    )
+
+    arg_parser.add_argument(
+        "--connect",
+        metavar="address",
+        help="Have a server started with `climage serve` convert the images, rather than converting them here. The address is the server's Unix socket path, or [host:]port.",
+    )
+
+    arg_parser.add_argument(
+        "--max-memory",
+        type=int,
+        default=None,
+        metavar="MB",
+        help="Refuse to decode images that would take more than this many megabytes once decoded (large JPEGs are decoded at reduced scale, and count at that size).",
+    )
+
+    arg_parser.add_argument(
+        "--stats",
+        action="store_true",
+        default=False,
+        help="Print the time spent in each stage of converting each image (decoding, resizing, color lookup, output), and counts of the work done, to stderr.",
+    )
+
+    arg_parser.add_argument(
+        "--viewport",
+        type=float,
+        nargs=3,
+        metavar=("X", "Y", "ZOOM"),
+        help="Only show part of the image, centred on X and Y (fractions of the image width and height, 0.5 0.5 is the middle) and magnified ZOOM times. Only the detail that is shown is resampled, which is much faster for very large images.",
+    )
+
+    arg_parser.add_argument(
+        "--rows",
+        type=int,
+        default=None,
+        metavar="rows",
+        help="Limit the number of rows output, cropping the image to fit (default as many as the image needs).",
+    )
+
+    arg_parser.add_argument(
+        "--raw",
+        type=_parse_size,
+        metavar="WxH",
+        help="Read the input as raw 8 bit pixels of this size rather than as an image file, e.g. frames dumped by a camera. Files are memory mapped rather than read.",
+    )
+
+    arg_parser.add_argument(
+        "--channels",
+        choices=["RGB", "BGR", "RGBA", "RGBX", "BGRA", "BGRX", "ARGB", "XRGB", "ABGR", "XBGR"],
+        default="RGB",
+        help="Order of the channels of --raw pixels (default RGB).",
+    )
+
+    arg_parser.add_argument(
+        "--stride",
+        type=int,
+        default=None,
+        metavar="bytes",
+        help="Bytes from the start of one row of --raw pixels to the next, for padded rows (default the rows are packed).",
+    )
+
+    arg_parser.add_argument(
+        "inputfiles",
+        nargs="*",
+        metavar="inputfile",
+        help="The image files you wish to convert, or - to read one from stdin. Quoted glob patterns are expanded.",
+    )
 
     args = arg_parser.parse_args()
-    infile = args.inputfile
+    infiles = _expand_inputs(args.inputfiles)
+    if args.files_from == "-":
+        infiles.extend(_read_file_list(sys.stdin))
+    elif args.files_from:
+        with open(args.files_from) as listfile:
+            infiles.extend(_read_file_list(listfile))
+    if not infiles:
+        arg_parser.error("no input files given")
+    if "-" in infiles and (len(infiles) > 1 or args.files_from == "-"):
+        arg_parser.error("- can only be used to convert a single image from stdin")
     outfile = args.outfile
 
     # whether unicode characters can be used (default no. not all terminals support this)
     is_unicode = False
-    if args.unicode:
+    if args.unicode or args.glyphs != "half":
         is_unicode = True
 
     # what mode of color should be used
@@ -346,35 +1444,168 @@ def main():
     # width of the output image
     num_cols = args.cols
 
-    if args.palette and is_truecolor and not args.quiet:
+    if args.palette and args.palette_file:
+        arg_parser.error("--palette and --palette-file are mutually exclusive")
+    if (args.palette or args.palette_file) and is_truecolor and not args.quiet:
         print(
             "WARNING: Choosing palette with truecolor has no effect.", file=sys.stderr
         )
     palette = args.palette if args.palette else "default"
+    if args.palette_file:
+        try:
+            palette = load_palette(args.palette_file)
+        except (OSError, ValueError) as e:
+            arg_parser.error("can't load palette: {}".format(e))
+    if args.palette_cache:
+        from .climage import set_palette_cache
 
-    # print to file, or stdout?
-    if outfile != "-":
-        to_file(
-            infile,
-            outfile,
-            is_unicode=is_unicode,
-            is_truecolor=is_truecolor,
-            is_256color=is_256color,
-            is_16color=is_16color,
-            is_8color=is_8color,
-            width=num_cols,
-            palette=palette,
-        )
-    else:
-        print(
-            convert(
-                infile,
-                is_unicode=is_unicode,
-                is_truecolor=is_truecolor,
-                is_256color=is_256color,
-                is_16color=is_16color,
-                is_8color=is_8color,
-                width=num_cols,
-                palette=palette,
+        set_palette_cache(args.palette_cache)
+
+    options = dict(
+        is_unicode=is_unicode,
+        is_truecolor=is_truecolor,
+        is_256color=is_256color,
+        is_16color=is_16color,
+        is_8color=is_8color,
+        width=num_cols,
+        palette=palette,
+        is_compact=args.compact,
+        is_perceptual=args.perceptual,
+        dither=args.dither,
+        resample=args.resample,
+        graphics=args.graphics,
+        glyphs=args.glyphs,
+        threads=args.threads,
+    )
+
+    if args.connect:
+        if args.animate or args.output_dir or args.raw or args.viewport or args.rows:
+            arg_parser.error("--connect can only convert whole images")
+        if args.stats:
+            arg_parser.error("--stats can't be used with --connect")
+        if len(infiles) > 1 and outfile != "-":
+            arg_parser.error("--output can only be used with a single image")
+        from .client import render
+
+        if args.palette_file:
+            # the server only knows its own palettes, so send the colors instead
+            from .colors import _get_system_colors
+
+            options["palette_colors"] = _get_system_colors(options.pop("palette"))
+        for infile in infiles:
+            try:
+                if infile == "-":
+                    data = sys.stdin.buffer.read()
+                else:
+                    with open(infile, "rb") as f:
+                        data = f.read()
+                ansi_str = render(
+                    args.connect,
+                    data=data,
+                    max_memory=args.max_memory and args.max_memory * 1024 * 1024,
+                    **options,
+                )
+            except (OSError, RuntimeError) as e:
+                arg_parser.exit(1, "climage: {}: {}\n".format(infile, e))
+            _write_output([ansi_str], outfile)
+        return
+
+    if args.stats:
+        # stats are reported once each image is done, in the order given
+        names = iter(infiles)
+
+        def print_stats(stats):
+            print("{}:\n{}".format(next(names), stats.report()), file=sys.stderr)
+
+        options["on_stats"] = print_stats
+
+    if args.animate:
+        if outfile != "-" or args.output_dir or len(infiles) > 1:
+            arg_parser.error(
+                "--animate can only be used with a single image written to stdout"
             )
+        if args.stats:
+            arg_parser.error("--stats can't be used with --animate")
+        if args.graphics != "none":
+            arg_parser.error("--graphics can't be used with --animate")
+        try:
+            animate(infiles[0], **options)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    from .cache import RenderCache
+    from .output import write_rows
+
+    # options only applying to conversions of image files
+    file_options = dict(cache=None, max_memory=None)
+    if args.cache_dir:
+        file_options["cache"] = RenderCache(
+            args.cache_dir, max_size=args.cache_size * 1024 * 1024
+        )
+    if args.max_memory is not None:
+        file_options["max_memory"] = args.max_memory * 1024 * 1024
+
+    if args.raw:
+        if args.output_dir or len(infiles) > 1 or args.viewport or args.rows:
+            arg_parser.error("--raw can only be used with a single input")
+        if infiles[0] == "-":
+            buffer = sys.stdin.buffer.read()
+        else:
+            import mmap
+
+            with open(infiles[0], "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        rows = iter_convert_buffer(
+            buffer, args.raw, channels=args.channels, stride=args.stride, **options
         )
+        _write_output(rows, outfile)
+        return
+
+    if args.viewport or args.rows is not None:
+        if args.output_dir or len(infiles) > 1:
+            arg_parser.error("--viewport and --rows can only be used with a single image")
+        x, y, zoom = args.viewport or (0.5, 0.5, 1.0)
+        rows = iter_convert_viewport(
+            infiles[0],
+            x=x,
+            y=y,
+            zoom=zoom,
+            rows=args.rows,
+            max_memory=file_options["max_memory"],
+            **options,
+        )
+        _write_output(rows, outfile)
+        return
+
+    if args.output_dir:
+        if outfile != "-":
+            arg_parser.error("--output and --output-dir are mutually exclusive")
+        # the image written to each output file, which must be the only one
+        sources = {}
+        for f in infiles:
+            name = os.path.splitext(os.path.basename(f))[0] + ".txt"
+            path = os.path.join(args.output_dir, name)
+            other = sources.setdefault(path, f)
+            if os.path.realpath(other) != os.path.realpath(f):
+                arg_parser.error(
+                    "{} and {} would both be written to {}".format(other, f, path)
+                )
+        os.makedirs(args.output_dir, exist_ok=True)
+        # images given more than once are only converted once
+        infiles = list(sources.values())
+        outfiles = list(sources.keys())
+        to_files(infiles, outfiles, jobs=args.jobs, **file_options, **options)
+        return
+
+    if len(infiles) > 1:
+        if outfile != "-":
+            arg_parser.error("use --output-dir when converting several images")
+        # convert in parallel, but print in the order given
+        converted = convert_many(infiles, jobs=args.jobs, **file_options, **options)
+        write_rows(
+            itertools.chain.from_iterable((s, "\n") for s in converted), sys.stdout
+        )
+        return
+
+    _write_output(iter_convert(infiles[0], **file_options, **options), outfile)
@@ -0,0 +1,116 @@
+import queue
+import threading
+import time
+
+from PIL import ImageSequence
+
+
+# frame duration used when the image doesn't specify one, in milliseconds
+_default_duration = 100
+# marks the end of the frames put into the queue by the decoding thread
+_end = object()
+
+
+def _put(frames, item, stop):
+    """Put into the queue, giving up if the consumer has stopped listening."""
+    while not stop.is_set():
+        try:
+            frames.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _decode(img, convert, frames, stop):
+    try:
+        for frame in ImageSequence.Iterator(img):
+            duration = frame.info.get("duration") or _default_duration
+            # open the frame, but convert to rgb because this fails if grayscale
+            # or palette based, which is how most GIFs are stored
+            ansi = convert(frame.convert("RGB"))
+            if not _put(frames, (ansi, duration / 1000), stop):
+                return
+        _put(frames, _end, stop)
+    except BaseException as e:
+        _put(frames, e, stop)
+
+
+def iter_frames(img, convert, prefetch=8):
+    """
+    Yield an (ansi, duration) pair for each frame of an image, where duration is in
+    seconds. Frames are decoded and converted on a worker thread, which keeps up to
+    `prefetch` frames ready ahead of the consumer.
+
+    Arguments:
+    img         -- A Pillow image, possibly containing multiple frames.
+    convert     -- Function turning a single RGB frame into its ANSI string.
+    """
+    frames = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    worker = threading.Thread(
+        target=_decode, args=(img, convert, frames, stop), daemon=True
+    )
+    worker.start()
+    try:
+        while True:
+            item = frames.get()
+            if item is _end:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def play(frames, outfile, loops=1):
+    """
+    Display (ansi, duration) frames in place, keeping to the schedule given by the
+    frame durations. Frames that are already overdue by the time they would be
+    shown are dropped, so playback never drifts behind when the terminal is slow.
+
+    Arguments:
+    frames      -- Iterable of (ansi, duration) pairs, see iter_frames.
+    outfile     -- Text file object to draw onto, normally the terminal.
+
+    Keyword Arguments:
+    loops       -- Number of times to play the animation, 0 plays it forever.
+    """
+    played = []
+    source = frames
+    plays = 0
+    # the time the frame being considered is due to be replaced
+    deadline = None
+    drawn_rows = 0
+
+    # hide the cursor, it flickers when jumping back to redraw
+    outfile.write("\x1b[?25l")
+    try:
+        while True:
+            for ansi, duration in source:
+                if source is frames:
+                    played.append((ansi, duration))
+                if deadline is None:
+                    deadline = time.monotonic()
+                deadline += duration
+                if time.monotonic() >= deadline:
+                    # the next frame is already due, skip this one
+                    continue
+
+                if drawn_rows:
+                    # move back up to redraw over the previous frame
+                    outfile.write("\x1b[{}A".format(drawn_rows))
+                outfile.write(ansi)
+                outfile.flush()
+                drawn_rows = ansi.count("\n")
+                time.sleep(max(0, deadline - time.monotonic()))
+
+            plays += 1
+            if (loops and plays >= loops) or not played:
+                break
+            # converted frames are kept, so only the first pass decodes
+            source = played
+    finally:
+        outfile.write("\x1b[?25h")
+        outfile.flush()
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+from .__version__ import __version__
+
+
+class RenderCache:
+    """
+    A directory of converted images, keyed by a hash of the image file contents and
+    every conversion option. Once the entries take up more than max_size bytes, the
+    least recently used ones are removed.
+
+    Arguments:
+    directory   -- Where to store the cached renders, created if it doesn't exist.
+
+    Keyword Arguments:
+    max_size    -- Upper limit on the total size of the cached renders, in bytes.
+    """
+
+    def __init__(self, directory, max_size=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        # lookups that found a render, and that didn't
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def __getstate__(self):
+        # locks can't be pickled, which sending the cache to worker processes needs
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def key(self, data, options):
+        """Return the key for the image file contents converted with these options."""
+        digest = hashlib.sha256(data)
+        # include the version, as the output may change between releases
+        digest.update(repr((__version__, sorted(options.items()))).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".txt")
+
+    def get(self, key):
+        """Return the cached render for the key, or None if there isn't one."""
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                ansi_str = f.read()
+            # the modification time records when an entry was last used
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return ansi_str
+
+    def put(self, key, ansi_str):
+        """Store a render, evicting the least recently used ones if over the limit."""
+        # write then rename, so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with open(fd, "w", encoding="utf-8") as f:
+            f.write(ansi_str)
+        os.replace(tmp_path, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(".txt"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,237 @@
+import time
+
+import numpy as np
+
+from .climage import (
+    _cell_columns,
+    _cellRows,
+    _join_columns,
+    _resize,
+    default_tables,
+    get_reset_code,
+)
+from .renderer import Renderer
+
+
+class Canvas:
+    """
+    Draws an image that keeps changing (a chart, a camera feed) in place, sending
+    only what changed. The canvas remembers the cells it last drew, and each update
+    moves the cursor to the cells that differ in the new image and redraws just
+    those, which for mostly still images is far less output than a full frame.
+
+    The canvas is drawn where the cursor is when the first update is written, and
+    every update leaves the cursor on the line below it, as a full conversion does.
+    Anything else written to the terminal in between moves it out of place.
+
+    Keyword Arguments:
+    renderer        -- The Renderer whose options the images are drawn with. Default one with default options, using the palette tables shared by the module functions. Graphics protocols can't be used, as they don't draw cells.
+    refresh_every   -- Redraw every cell, rather than only those that changed, once this many updates have been drawn since the last full redraw, to repair anything else drawn over the canvas. Default 0 (never).
+    """
+
+    def __init__(self, renderer=None, refresh_every=0):
+        if renderer is None:
+            renderer = Renderer(tables=default_tables)
+        if renderer.graphics != "none":
+            raise ValueError("canvases draw cells, they can't use graphics")
+        self.renderer = renderer
+        self.refresh_every = refresh_every
+        # the columns each cell takes
+        self._cell_width = 1 if renderer.is_unicode else 2
+        # the (background, foreground, text) of the cells on screen, see _cellRows
+        self._cells = None
+        # the number of rows drawn, which the cursor is below
+        self._rows = 0
+        self._updates = 0
+
+    def update_pil(self, img):
+        """
+        Return the output redrawing the canvas with a Pillow image in RGB or RGBA
+        format, resized as by climage.convert_pil.
+        """
+        return self._update_pil(img, self.renderer._new_stats())
+
+    def update_array(self, arr):
+        """
+        Return the output redrawing the canvas with an array of RGB(A) pixels,
+        drawn without resizing as by climage.convert_array.
+        """
+        arr = np.asarray(arr)
+        assert arr.ndim == 3 and arr.shape[2] >= 3, "Expecting RGB or RGBA array"
+        return self._update(arr, self.renderer._new_stats())
+
+    def update(self, filename, max_memory=None):
+        """Return the output redrawing the canvas with an image file, see climage.convert."""
+        stats = self.renderer._new_stats()
+        return self._update_pil(self.renderer._load(filename, max_memory, stats), stats)
+
+    def invalidate(self):
+        """
+        Forget which cells are on screen, so the next update redraws every one of
+        them in place, e.g. after something else was drawn over the canvas.
+        """
+        if self._cells is not None:
+            self._cells = None
+            self._updates = 0
+
+    def _update_pil(self, img, stats):
+        if stats is not None:
+            start = time.perf_counter()
+            stats.count("source_pixels", img.width * img.height)
+        img = _resize(
+            img,
+            self.renderer.width,
+            self.renderer.is_unicode,
+            self.renderer.resample,
+            self.renderer.glyphs,
+        )
+        if stats is not None:
+            stats.add_time("resize", time.perf_counter() - start)
+        return self._update(np.asarray(img), stats)
+
+    def _update(self, arr, stats):
+        renderer = self.renderer
+        cell_rows = _cellRows(
+            arr,
+            renderer.is_unicode,
+            renderer.color_type,
+            renderer.palette,
+            renderer.is_perceptual,
+            renderer.dither,
+            renderer.tables,
+            stats,
+            renderer.glyphs,
+        )
+        cells = _stack_cells(list(cell_rows))
+        if stats is not None:
+            start = time.perf_counter()
+
+        full = (
+            self._cells is None
+            or self._cells[0].shape != cells[0].shape
+            or (self.refresh_every and self._updates >= self.refresh_every)
+        )
+        if full:
+            changed = np.ones(cells[0].shape[:2], dtype=bool)
+            output = self._redraw(cells)
+            self._updates = 0
+        else:
+            changed = _changed_cells(self._cells, cells)
+            output = self._draw_changes(cells, changed)
+            self._updates += 1
+        self._cells = cells
+        self._rows = len(changed)
+
+        if stats is not None:
+            stats.add_time("emit", time.perf_counter() - start)
+            stats.count("changed_cells", int(changed.sum()))
+            stats.count("rows", int(changed.any(axis=1).sum()))
+            stats.count("output_bytes", len(output.encode("utf-8")))
+            renderer.on_stats(stats)
+        return output
+
+    def _redraw(self, cells):
+        """Return the output drawing every cell, over anything drawn before."""
+        pieces = []
+        if self._cells is not None:
+            # move back up to the top of the canvas
+            pieces.append("\x1b[{}A".format(self._rows))
+            if self._cells[0].shape != cells[0].shape:
+                # clear what a larger image drew outside the new one
+                pieces.append("\r\x1b[J")
+        for bg_colors, fg_colors, text in _iter_cells(cells):
+            columns = _cell_columns(
+                bg_colors,
+                fg_colors,
+                text,
+                self.renderer.color_type,
+                self.renderer.is_compact,
+            )
+            pieces.append(_join_columns(columns, len(bg_colors)))
+            pieces.append(get_reset_code() + "\n")
+        return "".join(pieces)
+
+    def _draw_changes(self, cells, changed):
+        """Return the output redrawing the changed cells, moving the cursor between them."""
+        pieces = []
+        # the row the cursor is on, starting on the line below the canvas
+        cursor = len(changed)
+        for y, (bg_colors, fg_colors, text) in enumerate(_iter_cells(cells)):
+            starts, ends = _runs(changed[y])
+            if not len(starts):
+                continue
+            if y < cursor:
+                pieces.append("\x1b[{}A".format(cursor - y))
+            elif y > cursor:
+                pieces.append("\x1b[{}B".format(y - cursor))
+            pieces.append("\r")
+            cursor = y
+
+            column = 0
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                if start > column:
+                    skipped = (start - column) * self._cell_width
+                    pieces.append("\x1b[{}C".format(skipped))
+                columns = _cell_columns(
+                    bg_colors[start:end],
+                    None if fg_colors is None else fg_colors[start:end],
+                    text if isinstance(text, str) else text[start:end],
+                    self.renderer.color_type,
+                    self.renderer.is_compact,
+                )
+                pieces.append(_join_columns(columns, end - start))
+                column = end
+            pieces.append(get_reset_code())
+
+        if pieces:
+            # return to the line below the canvas
+            pieces.append("\x1b[{}B\r".format(len(changed) - cursor))
+        return "".join(pieces)
+
+
+def _stack_cells(cell_rows):
+    """Combine the rows of cells yielded by _cellRows into arrays for the whole image."""
+    bg_colors, fg_colors, text = zip(*cell_rows)
+    return (
+        np.stack(bg_colors),
+        None if fg_colors[0] is None else np.stack(fg_colors),
+        text[0] if isinstance(text[0], str) else np.stack(text),
+    )
+
+
+def _iter_cells(cells):
+    """Yield the rows of cells stacked by _stack_cells, as _cellRows yields them."""
+    bg_colors, fg_colors, text = cells
+    for y in range(len(bg_colors)):
+        yield (
+            bg_colors[y],
+            None if fg_colors is None else fg_colors[y],
+            text if isinstance(text, str) else text[y],
+        )
+
+
+def _differs(old, new):
+    """Return a mask of the cells whose colors differ, for codes or RGB components."""
+    differs = old != new
+    return differs.any(axis=2) if differs.ndim > 2 else differs
+
+
+def _changed_cells(old, new):
+    """Return a (rows, columns) mask of the cells that look different in new."""
+    old_bg, old_fg, old_text = old
+    bg_colors, fg_colors, text = new
+    changed = _differs(old_bg, bg_colors)
+    if isinstance(text, str):
+        if fg_colors is not None:
+            changed |= _differs(old_fg, fg_colors)
+        return changed
+    # a cell drawn with a space shows no foreground
+    changed |= text != old_text
+    changed |= _differs(old_fg, fg_colors) & (text != " ")
+    return changed
+
+
+def _runs(changed):
+    """Return the starts and ends of the runs of changed cells in a row."""
+    edges = np.diff(np.concatenate(([False], changed, [False])).astype(np.int8))
+    return np.nonzero(edges == 1)[0], np.nonzero(edges == -1)[0]
@@ -0,0 +1,119 @@
+import http.client
+import json
+import socket
+from urllib.parse import urlencode
+
+# options passed on to the server, with how they are read back from the query string
+render_options = {
+    "is_unicode": bool,
+    "is_truecolor": bool,
+    "is_256color": bool,
+    "is_16color": bool,
+    "is_8color": bool,
+    "width": int,
+    "palette": str,
+    # the system colors of a palette the server doesn't have, as a JSON list
+    "palette_colors": json.loads,
+    "is_compact": bool,
+    "is_perceptual": bool,
+    "dither": str,
+    "resample": str,
+    "graphics": str,
+    "glyphs": str,
+    "threads": int,
+    "max_memory": int,
+}
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def parse_address(address):
+    """
+    Split a server address into ("unix", path) for a Unix socket, or ("tcp", (host,
+    port)). Addresses containing a / are socket paths, otherwise they are [host:]port,
+    with the host defaulting to localhost.
+    """
+    if "/" in address:
+        return "unix", address
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+def _connect(address, timeout):
+    kind, where = parse_address(address)
+    if kind == "unix":
+        return _UnixHTTPConnection(where, timeout=timeout)
+    return http.client.HTTPConnection(*where, timeout=timeout)
+
+
+def render(address, data=None, path=None, timeout=None, **options):
+    """
+    Have a running `climage serve` convert an image, and return the resulting string.
+
+    Arguments:
+    address     -- Where the server listens, a Unix socket path or [host:]port.
+
+    Keyword Arguments:
+    data        -- The contents of the image file to convert.
+    path        -- Instead of data, the name of an image file for the server to read
+                   itself. Only accepted by servers started with --allow-paths.
+    timeout     -- Seconds to wait for the server, default None (forever).
+    options     -- Conversion options, as accepted by climage.convert (is_unicode,
+                   width, palette, ...). A custom palette is sent as palette_colors,
+                   its 16 system colors as accepted by register_palette.
+
+    Raises RuntimeError with the server's message if it couldn't convert the image.
+    """
+    query = {}
+    for name, value in options.items():
+        if name not in render_options:
+            raise TypeError("unknown option {}".format(name))
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = int(value)
+        elif name == "palette_colors":
+            value = json.dumps([list(color) for color in value])
+        query[name] = value
+    if path is not None:
+        query["path"] = path
+
+    conn = _connect(address, timeout)
+    try:
+        conn.request(
+            "POST",
+            "/render?" + urlencode(query),
+            body=data or b"",
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        response = conn.getresponse()
+        body = response.read()
+    finally:
+        conn.close()
+    if response.status != 200:
+        raise RuntimeError(body.decode("utf-8", "replace").strip())
+    return body.decode("utf-8")
+
+
+def stats(address, timeout=None):
+    """Return the counters reported by a running `climage serve`, as a dict."""
+    conn = _connect(address, timeout)
+    try:
+        conn.request("GET", "/stats")
+        response = conn.getresponse()
+        body = response.read()
+    finally:
+        conn.close()
+    if response.status != 200:
+        raise RuntimeError(body.decode("utf-8", "replace").strip())
+    return json.loads(body)
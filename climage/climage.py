@@ -1,6 +1,24 @@
-from io import StringIO
-import kdtree
 import functools
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from . import dither as _dither
+from .colors import (
+    color_types,
+    dither_modes,
+    _get_palette_colors,
+    _id_to_codepoint,
+)
+from .glyphs import fit_cells, glyph_shapes, glyph_tables
+from .stats import RenderStats, timed
 
 
 # for storing pixels within the kdtree
@@ -17,276 +35,310 @@ class PixelMapping:
 
 
 # get the best term colour
-@functools.lru_cache(maxsize=256)
-def _best(color_type, palette, source):
-    # lazily only generate palettes if necessary
-    if color_kdtrees[color_type][palette] is None:
-        populate_kdtree(color_type, palette)
-
-    tr = color_kdtrees[color_type][palette]
-    return tr.search_nn(source)[0].data.code
-
-
-class color_types:
-    truecolor = 0
-    color256 = 1
-    color16 = 2
-    color8 = 3
-
-
-def populate_kdtree(color_type, palette):
-    # TODO: add assert for color_type?
-    if color_type == color_types.color8:
-        colors = _get_system_colors(palette)[:8]
-    elif color_type == color_types.color16:
-        colors = _get_system_colors(palette)[:]
-    elif color_type == color_types.color256:
-        colors = _get_system_colors(palette)[:]
-        # credit: https://github.com/dom111/image-to-ansi/
-        # these colours can be found by running colortest-256
-        for r1 in [0, 95, 135, 175, 215, 255]:
-            for g1 in [0, 95, 135, 175, 215, 255]:
-                for b1 in [0, 95, 135, 175, 215, 255]:
-                    colors.append(
+def _best(color_type, palette, source, is_perceptual=False):
+    table = get_color_table(color_type, palette, is_perceptual)
+    return int(table.lookup_one(source))
+
+
+class PaletteTable:
+    """
+    Dense lookup table mapping every 24 bit RGB colour to its nearest palette code.
+
+    The table has one slot per colour, holding code + 1, or 0 if that colour has not
+    been looked up yet. Misses are resolved in bulk with a vectorised nearest-colour
+    search and written back, so each distinct colour is only ever searched once.
+    The table is allocated with zeros, so memory is only committed for the pages
+    that are actually touched. If a palette cache directory is set (see
+    set_palette_cache), the table is instead a memory mapped file in that directory,
+    shared by every process using the same palette, so colors looked up by earlier
+    runs are already filled in.
+
+    Distances are measured in RGB, or with is_perceptual, as the CIE76 colour
+    difference (euclidean distance in CIELAB), which better matches how different
+    colours look. The palette is converted to CIELAB once, when the table is built.
+
+    Tables may be used from several threads at once. Threads filling in the same
+    colors write the same codes, so at worst a color is searched for twice.
+    """
+
+    # bound the (colors x palette) distance matrix built when resolving misses
+    _chunk_size = 4096
+
+    def __init__(self, color_type, palette, is_perceptual=False, cache_dir=None):
+        self.color_type = color_type
+        self.palette = palette
+        self.is_perceptual = is_perceptual
+        self.cache_dir = cache_dir
+        colors = np.array(_get_palette_colors(color_type, palette), dtype=np.int32)
+        self.rgb = colors[:, :3]
+        self.codes = colors[:, 3]
+        if is_perceptual:
+            self.lab = rgb_to_lab(self.rgb)
+        self.code_rgb = np.zeros((self.codes.max() + 1, 3), dtype=np.int32)
+        self.code_rgb[self.codes] = self.rgb
+        # roughly how far apart neighbouring palette colors are, for dithering
+        self.spread = 256 / len(self.rgb) ** (1 / 3)
+        self._coarse = None
+        self._kdtree = None
+        self._lock = threading.Lock()
+        # pixels found already filled in, pixels that weren't, and the distinct
+        # colors that were searched for as a result
+        self.hits = 0
+        self.misses = 0
+        self.searched = 0
+        self.table = self._open_table()
+
+    def _open_table(self):
+        if self.cache_dir is None:
+            return np.zeros(1 << 24, dtype=np.uint16)
+        # named after the colors rather than the palette name, so a palette whose
+        # colors are changed doesn't pick up the old table
+        digest = hashlib.sha256(
+            repr(
+                (_table_format, self.is_perceptual, self.rgb.tolist(), self.codes.tolist())
+            ).encode()
+        ).hexdigest()
+        path = os.path.join(self.cache_dir, "palette-{}.u16".format(digest[:32]))
+        try:
+            if not os.path.exists(path):
+                os.makedirs(self.cache_dir, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+                try:
+                    with open(fd, "wb") as f:
+                        # sparse, so slots never looked up take no space on disk
+                        f.truncate(2 << 24)
+                    os.chmod(tmp_path, 0o644)
+                    # linking fails rather than replacing a table another process
+                    # has already created and started filling
+                    os.link(tmp_path, path)
+                except FileExistsError:
+                    pass
+                finally:
+                    os.remove(tmp_path)
+            try:
+                return np.memmap(path, dtype=np.uint16, mode="r+", shape=(1 << 24,))
+            except PermissionError:
+                # a read only cache, colors looked up only fill this process's copy
+                return np.memmap(path, dtype=np.uint16, mode="c", shape=(1 << 24,))
+        except OSError:
+            # the cache is only an optimisation, carry on without it
+            return np.zeros(1 << 24, dtype=np.uint16)
+
+    def lookup(self, keys, stats=None):
+        """
+        Map an integer array of packed 0xRRGGBB colours to an array of palette codes.
+        If stats (a RenderStats) is given, the hits and misses are also counted there.
+        """
+        found = self.table[keys]
+        missing = found == 0
+        misses = int(missing.sum())
+        searched = 0
+        if misses:
+            new_keys = np.unique(keys[missing])
+            self.table[new_keys] = self._nearest(new_keys) + 1
+            found[missing] = self.table[keys[missing]]
+            searched = len(new_keys)
+        with self._lock:
+            self.hits += found.size - misses
+            self.misses += misses
+            self.searched += searched
+        if stats is not None:
+            stats.count("lookup_hits", found.size - misses)
+            stats.count("lookup_misses", misses)
+            stats.count("colors_searched", searched)
+        return found.astype(np.intp) - 1
+
+    def lookup_one(self, pixel):
+        """Map a single (r,g,b) pixel to its palette code."""
+        key = (int(pixel[0]) << 16) | (int(pixel[1]) << 8) | int(pixel[2])
+        code = self.table[key]
+        if code:
+            with self._lock:
+                self.hits += 1
+            return code - 1
+        return self.lookup(np.array([key]))[0]
+
+    def coarse(self):
+        """
+        Return a list of the nearest palette code for each color with 5 bits per
+        channel, indexed by (r >> 3) << 10 | (g >> 3) << 5 | b >> 3. Each entry is
+        matched from the center of the colors it covers.
+        """
+        if self._coarse is None:
+            centers = np.arange(32) * 8 + 4
+            rgb = np.stack(np.meshgrid(centers, centers, centers, indexing="ij"), -1)
+            self._coarse = self.lookup(pack_rgb(rgb).ravel()).tolist()
+        return self._coarse
+
+    def _nearest(self, keys):
+        codes = np.empty(len(keys), dtype=np.uint16)
+        for start in range(0, len(keys), self._chunk_size):
+            chunk = keys[start : start + self._chunk_size]
+            rgb = unpack_rgb(chunk)
+            if self.is_perceptual:
+                lab = rgb_to_lab(rgb)
+                dists = ((lab[:, None, :] - self.lab[None, :, :]) ** 2).sum(axis=2)
+                codes[start : start + self._chunk_size] = self.codes[
+                    dists.argmin(axis=1)
+                ]
+                continue
+
+            dists = ((rgb[:, None, :] - self.rgb[None, :, :]) ** 2).sum(axis=2)
+            nearest = dists.argmin(axis=1)
+            codes[start : start + self._chunk_size] = self.codes[nearest]
+
+            # Several palette entries can be equally close (the 256 color palette
+            # even contains duplicate colors). Defer to the kd-tree for those so the
+            # chosen codes stay identical to what earlier versions produced.
+            is_tie = (dists == dists[np.arange(len(chunk)), nearest][:, None]).sum(
+                axis=1
+            ) > 1
+            for i in np.flatnonzero(is_tie):
+                codes[start + i] = self._kdtree_best(tuple(rgb[i].tolist()))
+        return codes
+
+    def _kdtree_best(self, source):
+        if self._kdtree is None:
+            with self._lock:
+                if self._kdtree is None:
+                    # only needed to break ties, so only imported then
+                    import kdtree
+
+                    self._kdtree = kdtree.create(
                         [
-                            r1,
-                            g1,
-                            b1,
-                            16
-                            + int(
-                                str(int(5 * r1 // 255))
-                                + str(int(5 * g1 // 255))
-                                + str(int(5 * b1 // 255)),
-                                6,
-                            ),
+                            PixelMapping(*col)
+                            for col in _get_palette_colors(self.color_type, self.palette)
                         ]
                     )
+        return self._kdtree.search_nn(source)[0].data.code
+
 
-        for s in [
-            8,
-            18,
-            28,
-            38,
-            48,
-            58,
-            68,
-            78,
-            88,
-            98,
-            108,
-            118,
-            128,
-            138,
-            148,
-            158,
-            168,
-            178,
-            188,
-            198,
-            208,
-            218,
-            228,
-            238,
-        ]:
-            colors.append([s, s, s, 232 + s // 10])
-
-    color_kdtrees[color_type][palette] = kdtree.create(
-        [PixelMapping(*col) for col in colors]
+def pack_rgb(arr):
+    """Pack the first three channels of an (..., >=3) array into 0xRRGGBB integers."""
+    arr = np.asarray(arr)
+    return (
+        (arr[..., 0].astype(np.int32) << 16)
+        | (arr[..., 1].astype(np.int32) << 8)
+        | arr[..., 2].astype(np.int32)
     )
 
 
-palettes = [
-    "default",
-    "xterm",
-    "linuxconsole",
-    "solarized",
-    "rxvt",
-    "tango",
-    "gruvbox",
-    "gruvboxdark",
-]
-# store the generated kdtrees for palettes
-color_kdtrees = {
-    color_types.color256: {pal: None for pal in palettes},
-    color_types.color16: {pal: None for pal in palettes},
-    color_types.color8: {pal: None for pal in palettes},
-}
+def unpack_rgb(keys):
+    """Inverse of pack_rgb, returning an (..., 3) int32 array."""
+    keys = np.asarray(keys, dtype=np.int32)
+    return np.stack([(keys >> 16) & 0xFF, (keys >> 8) & 0xFF, keys & 0xFF], axis=-1)
 
 
-def _get_system_colors(palette):
-    # see extras/colorextract.py for details on getting these values
-    if palette == "default":
-        return [
-            [0, 0, 0, 0],
-            [128, 0, 0, 1],
-            [0, 128, 0, 2],
-            [128, 128, 0, 3],
-            [0, 0, 128, 4],
-            [128, 0, 128, 5],
-            [0, 128, 128, 6],
-            [192, 192, 192, 7],
-            [128, 128, 128, 8],
-            [255, 0, 0, 9],
-            [0, 255, 0, 10],
-            [255, 255, 0, 11],
-            [0, 0, 255, 12],
-            [255, 0, 255, 13],
-            [0, 255, 255, 14],
-            [255, 255, 255, 15],
-        ]
-    if palette == "xterm":
-        return [
-            [0, 0, 0, 0],
-            [205, 0, 0, 1],
-            [0, 205, 0, 2],
-            [205, 205, 0, 3],
-            [0, 0, 238, 4],
-            [205, 0, 205, 5],
-            [0, 205, 205, 6],
-            [229, 229, 229, 7],
-            [127, 127, 127, 8],
-            [255, 0, 0, 9],
-            [0, 255, 0, 10],
-            [255, 255, 0, 11],
-            [92, 92, 255, 12],
-            [255, 0, 255, 13],
-            [0, 255, 255, 14],
-            [255, 255, 255, 15],
-        ]
-    elif palette == "linuxconsole":
-        return [
-            [0, 0, 0, 0],
-            [170, 0, 0, 1],
-            [0, 170, 0, 2],
-            [170, 85, 0, 3],
-            [0, 0, 170, 4],
-            [170, 0, 170, 5],
-            [0, 170, 170, 6],
-            [170, 170, 170, 7],
-            [85, 85, 85, 8],
-            [255, 85, 85, 9],
-            [85, 255, 85, 10],
-            [255, 255, 85, 11],
-            [85, 85, 255, 12],
-            [255, 85, 255, 13],
-            [85, 255, 255, 14],
-            [255, 255, 255, 15],
-        ]
-    elif palette == "solarized":
-        return [
-            [7, 54, 66, 0],
-            [220, 50, 47, 1],
-            [133, 153, 0, 2],
-            [181, 137, 0, 3],
-            [38, 139, 210, 4],
-            [211, 54, 130, 5],
-            [42, 161, 152, 6],
-            [238, 232, 213, 7],
-            [0, 43, 54, 8],
-            [203, 75, 22, 9],
-            [88, 110, 117, 10],
-            [101, 123, 131, 11],
-            [131, 148, 150, 12],
-            [108, 113, 196, 13],
-            [147, 161, 161, 14],
-            [253, 246, 227, 15],
-        ]
-    elif palette == "rxvt":
-        return [
-            [0, 0, 0, 0],
-            [205, 0, 0, 1],
-            [0, 205, 0, 2],
-            [205, 205, 0, 3],
-            [0, 0, 205, 4],
-            [205, 0, 205, 5],
-            [0, 205, 205, 6],
-            [250, 235, 215, 7],
-            [64, 64, 64, 8],
-            [255, 0, 0, 9],
-            [0, 255, 0, 10],
-            [255, 255, 0, 11],
-            [0, 0, 255, 12],
-            [255, 0, 255, 13],
-            [0, 255, 255, 14],
-            [255, 255, 255, 15],
-        ]
-    elif palette == "tango":
-        return [
-            [0, 0, 0, 0],
-            [204, 0, 0, 1],
-            [78, 154, 6, 2],
-            [196, 160, 0, 3],
-            [52, 101, 164, 4],
-            [117, 80, 123, 5],
-            [6, 152, 154, 6],
-            [211, 215, 207, 7],
-            [85, 87, 83, 8],
-            [239, 41, 41, 9],
-            [138, 226, 52, 10],
-            [252, 233, 79, 11],
-            [114, 159, 207, 12],
-            [173, 127, 168, 13],
-            [52, 226, 226, 14],
-            [238, 238, 236, 15],
-        ]
-    elif palette == "gruvbox":
-        return [
-            [251, 241, 199, 0],
-            [204, 36, 29, 1],
-            [152, 151, 26, 2],
-            [215, 153, 33, 3],
-            [69, 133, 136, 4],
-            [177, 98, 134, 5],
-            [104, 157, 106, 6],
-            [124, 111, 100, 7],
-            [146, 131, 116, 8],
-            [157, 0, 6, 9],
-            [121, 116, 14, 10],
-            [181, 118, 20, 11],
-            [7, 102, 120, 12],
-            [143, 63, 113, 13],
-            [66, 123, 88, 14],
-            [60, 56, 54, 15],
-        ]
-    elif palette == "gruvboxdark":
-        return [
-            [40, 40, 40, 0],
-            [204, 36, 29, 1],
-            [152, 151, 26, 2],
-            [215, 153, 33, 3],
-            [69, 133, 136, 4],
-            [177, 98, 134, 5],
-            [104, 157, 106, 6],
-            [168, 153, 132, 7],
-            [146, 131, 116, 8],
-            [251, 73, 52, 9],
-            [184, 187, 38, 10],
-            [250, 189, 47, 11],
-            [131, 165, 152, 12],
-            [211, 134, 155, 13],
-            [142, 192, 124, 14],
-            [235, 219, 178, 15],
-        ]
+# sRGB component value -> linear light, for each 8 bit value
+_srgb_linear = np.array(
+    [
+        c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+        for c in (i / 255 for i in range(256))
+    ]
+)
+# linear sRGB -> CIE XYZ, scaled so the D65 white point is (1, 1, 1)
+_srgb_to_xyz = np.array(
+    [
+        [0.4124564, 0.3575761, 0.1804375],
+        [0.2126729, 0.7151522, 0.0721750],
+        [0.0193339, 0.1191920, 0.9503041],
+    ]
+) / np.array([[0.95047], [1.0], [1.08883]])
 
-    else:
-        raise ValueError("invalid palette {}".format(palette))
 
+def rgb_to_lab(rgb):
+    """Convert an (..., 3) array of 8 bit sRGB colours into CIELAB (D65)."""
+    xyz = _srgb_linear[np.asarray(rgb)] @ _srgb_to_xyz.T
+    delta = 6 / 29
+    f = np.where(xyz > delta**3, np.cbrt(xyz), xyz / (3 * delta**2) + 4 / 29)
+    return np.stack(
+        [
+            116 * f[..., 1] - 16,
+            500 * (f[..., 0] - f[..., 1]),
+            200 * (f[..., 1] - f[..., 2]),
+        ],
+        axis=-1,
+    )
 
-# convert a 8 or 16bit id [0, 15] to the ansi number
-def _id_to_codepoint(in_id, is_bg):
-    if in_id >= 8:
-        if is_bg:
-            return "10" + str(in_id - 8)
-        else:
-            return "9" + str(in_id - 8)
-    else:
-        if is_bg:
-            return "4" + str(in_id)
-        else:
-            return "3" + str(in_id)
+
+class PaletteTables:
+    """
+    The lookup tables for each color type and palette, each created when first used.
+    Safe to share between threads, a table is only created once however many threads
+    ask for it at the same time.
+
+    Keyword Arguments:
+    cache_dir   -- Directory to keep the tables in as memory mapped files, see set_palette_cache. Default None (tables are kept in memory).
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def get(self, color_type, palette, is_perceptual=False):
+        """Return the lookup table for the color type and palette."""
+        key = (color_type, palette, bool(is_perceptual))
+        table = self._tables.get(key)
+        if table is None:
+            with self._lock:
+                table = self._tables.get(key)
+                if table is None:
+                    table = self._tables[key] = PaletteTable(
+                        color_type, palette, is_perceptual, cache_dir=self.cache_dir
+                    )
+        return table
+
+    def clear(self):
+        """Drop the tables, so they are created again when next used."""
+        with self._lock:
+            self._tables = {}
+
+    def stats(self):
+        """
+        Return a dict counting the tables created, the pixels looked up that were
+        already in a table (hits) and that weren't (misses), and the distinct colors
+        searched for because of those misses.
+        """
+        tables = list(self._tables.values())
+        return {
+            "tables": len(tables),
+            "hits": sum(table.hits for table in tables),
+            "misses": sum(table.misses for table in tables),
+            "searched": sum(table.searched for table in tables),
+        }
 
 
-def convert_pixel_color(pixel, ctype=color_types.color256, palette="default"):
+def get_color_table(color_type, palette, is_perceptual=False):
+    """Return the (lazily created) lookup table for the color type and palette."""
+    return default_tables.get(color_type, palette, is_perceptual)
+
+
+def set_palette_cache(directory):
+    """
+    Keep the palette lookup tables as files in a directory, memory mapped rather than
+    built in memory by every process. Tables are filled in as colors are looked up,
+    and are shared by all processes using the directory, so short lived processes
+    start with the colors earlier ones have already matched.
+
+    Arguments:
+    directory   -- Where to keep the tables, created if it doesn't exist. None goes back to building them in memory.
+    """
+    default_tables.cache_dir = directory
+    # tables already built are replaced on next use
+    default_tables.clear()
+
+
+# changed whenever the tables would be filled differently, so old files aren't used
+_table_format = 1
+
+# the lookup tables used unless a Renderer brings its own
+default_tables = PaletteTables()
+
+
+def convert_pixel_color(
+    pixel, ctype=color_types.color256, palette="default", is_perceptual=False
+):
     """
     Convert an RGB triple into the color used by the ANSI colour sequence,
     depending on the color mode.
@@ -297,6 +349,7 @@ def convert_pixel_color(pixel, ctype=color_types.color256, palette="default"):
     Keyword Arguments:
         ctype   -- the color depth to use, default color_types.color256
         palette -- if not using the truecolor depth, adjust how pixels map to the desired colourspace to match the colourscheme better.
+        is_perceptual -- if not using the truecolor depth, pick the palette color that looks most similar (smallest CIELAB difference), rather than the nearest RGB value.
     """
     # The ANSI sequence for a truecolor color is simply the RGB colours.
     if ctype == color_types.truecolor:
@@ -304,10 +357,12 @@ def convert_pixel_color(pixel, ctype=color_types.color256, palette="default"):
 
     # Whereas the 8, 16, or 256 color value depends on the palette. We find the
     # closest visually similar color.
-    return _best(ctype, palette, pixel)
+    return _best(ctype, palette, pixel, is_perceptual)
 
 
-def get_ansi_pixel(pixel, ctype=color_types.color256, palette="default"):
+def get_ansi_pixel(
+    pixel, ctype=color_types.color256, palette="default", is_perceptual=False
+):
     """
     Convert a single RGB pixel into an ANSI escape sequence representing that pixel.
 
@@ -317,18 +372,16 @@ def get_ansi_pixel(pixel, ctype=color_types.color256, palette="default"):
     Keyword Arguments:
         ctype   -- the color depth to use, default color_types.color256
         palette -- if not using the truecolor depth, adjust how pixels map to the desired colourspace to match the colourscheme better.
+        is_perceptual -- if not using the truecolor depth, pick the palette color that looks most similar (smallest CIELAB difference), rather than the nearest RGB value.
     """
     # Convert a single pixel into the ANSI escape sequence.
     color = convert_pixel_color(
         pixel,
         ctype=ctype,
         palette=palette,
+        is_perceptual=is_perceptual,
     )
-    if ctype == color_types.truecolor:
-        return "\x1b[48;2;{};{};{}m  ".format(*color)
-    if ctype == color_types.color256:
-        return "\x1b[48;5;{}m  ".format(color)
-    return "\x1b[{}m  ".format(_id_to_codepoint(color, is_bg=True))
+    return _sgr(color, ctype, is_bg=True, end="  ")
 
 
 def get_reset_code():
@@ -339,7 +392,11 @@ def get_reset_code():
 
 
 def get_dual_unicode_ansi_pixels(
-    top_pixel, bottom_pixel, ctype=color_types.color256, palette="default"
+    top_pixel,
+    bottom_pixel,
+    ctype=color_types.color256,
+    palette="default",
+    is_perceptual=False,
 ):
     """
     Convert two RGB pixels into an ANSI escape sequence representing those pixel using unicode.
@@ -351,71 +408,661 @@ def get_dual_unicode_ansi_pixels(
     Keyword Arguments:
         ctype   -- the color depth to use, default color_types.color256
         palette -- if not using the truecolor depth, adjust how pixels map to the desired colourspace to match the colourscheme better.
+        is_perceptual -- if not using the truecolor depth, pick the palette color that looks most similar (smallest CIELAB difference), rather than the nearest RGB value.
     """
     color_top = convert_pixel_color(
         top_pixel,
         ctype=ctype,
         palette=palette,
+        is_perceptual=is_perceptual,
     )
     color_bottom = convert_pixel_color(
         bottom_pixel,
         ctype=ctype,
         palette=palette,
+        is_perceptual=is_perceptual,
     )
 
-    if ctype == color_types.truecolor:
-        return "\x1b[48;2;{};{};{}m\x1b[38;2;{};{};{}m▄".format(
-            *color_top, *color_bottom
+    return _sgr(color_top, ctype, is_bg=True) + _sgr(
+        color_bottom, ctype, is_bg=False, end="▄"
+    )
+
+
+def _toAnsi(
+    img,
+    oWidth,
+    is_unicode,
+    color_type,
+    palette,
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    tables=None,
+    stats=None,
+    resample="default",
+    glyphs="half",
+    threads=1,
+):
+    return "".join(
+        _toAnsiRows(
+            img,
+            oWidth,
+            is_unicode,
+            color_type,
+            palette,
+            is_compact,
+            is_perceptual,
+            dither,
+            tables,
+            stats,
+            resample,
+            glyphs,
+            threads,
         )
-    if ctype == color_types.color256:
-        return "\x1b[48;5;{}m\x1b[38;5;{}m▄".format(color_top, color_bottom)
+    )
+
 
-    bg_codepoint = _id_to_codepoint(color_top, is_bg=True)
-    fg_codepoint = _id_to_codepoint(color_bottom, is_bg=False)
-    return "\x1b[{}m\x1b[{}m▄".format(bg_codepoint, fg_codepoint)
+def _toAnsiRows(
+    img,
+    oWidth,
+    is_unicode,
+    color_type,
+    palette,
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    tables=None,
+    stats=None,
+    resample="default",
+    glyphs="half",
+    threads=1,
+):
+    """Generator version of _toAnsi, yielding one terminal row at a time."""
+    if stats is not None:
+        start = time.perf_counter()
+        stats.count("source_pixels", img.width * img.height)
+    img = _resize(img, oWidth, is_unicode, resample, glyphs)
+    if stats is not None:
+        stats.add_time("resize", time.perf_counter() - start)
+    return _arrayToAnsiRows(
+        np.asarray(img),
+        is_unicode,
+        color_type,
+        palette,
+        is_compact=is_compact,
+        is_perceptual=is_perceptual,
+        dither=dither,
+        tables=tables,
+        stats=stats,
+        glyphs=glyphs,
+        threads=threads,
+    )
 
 
-def _toAnsi(img, oWidth, is_unicode, color_type, palette):
-    destWidth = img.width
-    destHeight = img.height
+def _target_size(width, height, oWidth, is_unicode, glyphs="half"):
+    """Return the size in pixels an image is resized to, to fill oWidth columns."""
+    destWidth = width
+    destHeight = height
     scale = destWidth / oWidth
     destWidth = oWidth
     destHeight = int(destHeight // scale)
 
-    # trim the height to an even number of pixels
+    # trim the height to a whole number of rows of glyphs
     # (we draw two rows at a time in the unicode version)
     if is_unicode:
-        destHeight -= destHeight % 2
+        # cells are twice as tall as they are wide, so keep the pixels' aspect
+        # ratio by fitting the glyph's rows into two cell widths
+        cell_width, cell_height = glyph_shapes[glyphs]
+        destWidth *= cell_width
+        destHeight = int(height * cell_height // (2 * scale))
+        destHeight -= destHeight % cell_height
     else:
         # for ascii, we need two columns to have square pixels (rows are twice the size
         # of  columns).
         destWidth //= 2
         destHeight //= 2
+    return destWidth, destHeight
 
-    # resize to new size
-    img = img.resize((destWidth, destHeight))
-    # where the converted string will be put in
-    ansi_build = StringIO()
-
-    yit = iter(range(destHeight))
-    for y in yit:
-        for x in range(destWidth):
-            pix = img.getpixel((x, y))
-            if is_unicode:
-                # the next row's pixel
-                bottom_pix = img.getpixel((x, y + 1))
-                ansi_build.write(
-                    get_dual_unicode_ansi_pixels(
-                        pix, bottom_pix, ctype=color_type, palette=palette
-                    )
+
+# JPEGs are decoded at a reduced scale, down to at least this many times the output
+# size, before the final resampling
+_reducing_gap = 3.0
+
+# the Pillow filter used by each resampling mode, and the reducing gap JPEGs are
+# decoded down to. A reducing gap of None decodes the whole image. The resize itself
+# always reads every decoded pixel, so images that aren't drafted look as they always
+# have with the default mode.
+resample_modes = {
+    "fast": (Image.NEAREST, 1.0),
+    "default": (Image.BICUBIC, _reducing_gap),
+    "quality": (Image.LANCZOS, None),
+}
+
+
+def _resize(img, oWidth, is_unicode, resample="default", glyphs="half"):
+    """Resize the image to the pixels that will be drawn for oWidth columns."""
+    return img.resize(
+        _target_size(img.width, img.height, oWidth, is_unicode, glyphs),
+        resample_modes[resample][0],
+    )
+
+
+def _open_input(filename):
+    """Return stdin's binary stream for the name "-", otherwise the name unchanged."""
+    if isinstance(filename, str) and filename == "-":
+        return sys.stdin.buffer
+    return filename
+
+
+def _pixel_bytes(mode):
+    """
+    Return the bytes Pillow stores each pixel of an image mode in: one for 8 bit
+    single band modes, two for 16 bit ones, and four for everything else, RGB
+    included.
+    """
+    if mode in ("1", "L", "P"):
+        return 1
+    if mode.startswith("I;16"):
+        return 2
+    return 4
+
+
+def _load(fp, oWidth, is_unicode, max_memory=None, resample="default", glyphs="half"):
+    """
+    Open an image file as RGB, decoding it at the lowest resolution that still
+    leaves enough detail for rendering it oWidth columns wide.
+
+    JPEGs are decoded directly at 1/2, 1/4 or 1/8 scale where possible, down to
+    the reducing gap of the resample mode, and at full size for "quality". If
+    max_memory is given, images whose decoded pixels would take more bytes than
+    that are refused before decoding.
+    """
+    img = Image.open(fp)
+    reducing_gap = resample_modes[resample][1]
+    if reducing_gap is not None:
+        target = _target_size(img.width, img.height, oWidth, is_unicode, glyphs)
+        img.draft(
+            "RGB",
+            (
+                max(1, int(target[0] * reducing_gap)),
+                max(1, int(target[1] * reducing_gap)),
+            ),
+        )
+
+    if max_memory is not None:
+        # the RGB image, and the decoded image it's converted from if that differs
+        needed = img.width * img.height * _pixel_bytes("RGB")
+        if img.mode != "RGB":
+            needed += img.width * img.height * _pixel_bytes(img.mode)
+        if needed > max_memory:
+            raise ValueError(
+                "decoding {}x{} image needs {} bytes, over the limit of {}".format(
+                    img.width, img.height, needed, max_memory
                 )
-            else:
-                ansi_build.write(get_ansi_pixel(pix, ctype=color_type, palette=palette))
+            )
+
+    # convert to rgb because this fails if grayscale
+    # (assumes pixels are at least triplets)
+    if img.mode != "RGB":
+        return img.convert("RGB")
+    img.load()
+    return img
+
+
+# channel orders accepted for raw pixel buffers, and the Pillow mode and raw mode
+# they are read with. Any alpha channel is ignored, as with other inputs.
+_raw_modes = {
+    "RGB": ("RGB", "RGB"),
+    "BGR": ("RGB", "BGR"),
+    # mapped straight onto the buffer, without copying
+    "RGBA": ("RGBX", "RGBX"),
+    "RGBX": ("RGBX", "RGBX"),
+    "BGRA": ("RGB", "BGRX"),
+    "BGRX": ("RGB", "BGRX"),
+    "ARGB": ("RGB", "XRGB"),
+    "XRGB": ("RGB", "XRGB"),
+    "ABGR": ("RGB", "XBGR"),
+    "XBGR": ("RGB", "XBGR"),
+}
+
+
+def _from_buffer(buffer, size, channels="RGB", stride=None):
+    """
+    Wrap raw 8 bit pixels in any object supporting the buffer protocol as an image.
+    RGBA and RGBX pixels are used in place, other channel orders are unpacked into
+    RGB in a single pass, so nothing is copied through python.
+
+    stride is the number of bytes from the start of one row to the next, by default
+    the rows are packed together.
+    """
+    if channels not in _raw_modes:
+        raise ValueError("invalid channel order {}".format(channels))
+    width, height = size
+    if stride is None:
+        stride = width * len(channels)
+    data = memoryview(buffer).cast("B")
+    needed = stride * (height - 1) + width * len(channels)
+    if stride < width * len(channels) or len(data) < needed:
+        raise ValueError(
+            "buffer of {} bytes is too small for {}x{} {} pixels with stride {}".format(
+                len(data), width, height, channels, stride
+            )
+        )
+    mode, rawmode = _raw_modes[channels]
+    return Image.frombuffer(mode, size, data, "raw", rawmode, stride, 1)
+
+
+# decimal strings for every 8 bit value, for assembling SGR parameters
+_numbers = np.array([str(i) for i in range(256)], dtype=object)
+# SGR parameters for the 8/16 system colors, indexed by color id
+_system_codepoints = {
+    is_bg: np.array([_id_to_codepoint(i, is_bg) for i in range(16)], dtype=object)
+    for is_bg in (True, False)
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _sgr_params_table(color_type, is_bg):
+    """
+    Return the SGR parameters selecting each color, indexed by palette code. For
+    truecolor, which has too many colors to tabulate, return a table for each
+    component instead, whose entries are concatenated.
+    """
+    if color_type == color_types.truecolor:
+        return (
+            ("48;2;" if is_bg else "38;2;") + _numbers + ";",
+            _numbers + ";",
+            _numbers,
+        )
+    if color_type == color_types.color256:
+        return (("48;5;" if is_bg else "38;5;") + _numbers,)
+    return (_system_codepoints[is_bg],)
+
+
+@functools.lru_cache(maxsize=None)
+def _sgr_table(color_type, is_bg, end=""):
+    """
+    Return the complete SGR sequences selecting each color, followed by end (the
+    text drawn in the cell), as _sgr_params_table does. Rows are assembled by
+    indexing these with arrays of colors, rather than formatting each cell.
+    """
+    tables = list(_sgr_params_table(color_type, is_bg))
+    tables[0] = "\x1b[" + tables[0]
+    tables[-1] = tables[-1] + "m" + end
+    return tuple(tables)
+
+
+def _sgr(color, color_type, is_bg, end=""):
+    """Return the SGR sequence selecting a single quantized color, followed by end."""
+    tables = _sgr_table(color_type, is_bg, end)
+    if color_type == color_types.truecolor:
+        return "".join(table[c] for table, c in zip(tables, color))
+    return tables[0][color]
+
+
+def _quantize(arr, color_type, palette, is_perceptual=False, tables=None, stats=None):
+    """
+    Map an (h, w, >=3) array of RGB(A) pixels to the colors used in the ANSI
+    sequences. This is an (h, w, 3) array of components for truecolor, otherwise an
+    (h, w) array of palette codes. Lookup tables come from tables, a PaletteTables,
+    or default_tables if None. Lookups are counted in stats, if given.
+    """
+    if color_type == color_types.truecolor:
+        return arr[..., :3].astype(np.intp)
+    if tables is None:
+        tables = default_tables
+    table = tables.get(color_type, palette, is_perceptual)
+    return table.lookup(pack_rgb(arr), stats)
+
+
+def _quantize_rows(
+    arr,
+    step,
+    color_type,
+    palette,
+    is_perceptual=False,
+    dither="none",
+    tables=None,
+    stats=None,
+):
+    """
+    Quantize the image `step` rows at a time, yielding each band's colors as
+    _quantize does. Dithering only applies to the 8/16/256 color modes.
+    """
+    if dither not in dither_modes:
+        raise ValueError("invalid dither mode {}".format(dither))
+    height, width = arr.shape[:2]
+
+    if color_type == color_types.truecolor or dither == "none":
+        for y in range(0, height, step):
+            # only quantize the pixels for these rows, so the first row is ready sooner
+            yield _quantize(
+                arr[y : y + step], color_type, palette, is_perceptual, tables, stats
+            )
+        return
+
+    if tables is None:
+        tables = default_tables
+    table = tables.get(color_type, palette, is_perceptual)
+    if dither == "bayer":
+        for y in range(0, height, step):
+            band = _dither.ordered(arr[y : y + step], y, table.spread)
+            yield table.lookup(pack_rgb(band), stats)
+    else:
+        diffusion = _dither.FloydSteinberg(
+            width, table.coarse(), table.code_rgb.tolist()
+        )
+        for y in range(0, height, step):
+            yield np.array(
+                [diffusion.row(row) for row in arr[y : y + step]], dtype=np.intp
+            ).reshape(-1, width)
+
+
+def _sgr_columns(colors, color_type, is_bg, end=""):
+    """
+    Return the columns of string pieces that, joined cell by cell, form the SGR
+    sequence selecting each color in a row of quantized colors, followed by end.
+    """
+    tables = _sgr_table(color_type, is_bg, end)
+    if color_type == color_types.truecolor:
+        return [table[colors[:, i]] for i, table in enumerate(tables)]
+    return [tables[0][colors]]
+
+
+def _sgr_params(colors, color_type, is_bg):
+    """Return the SGR parameter string selecting each color in a row."""
+    tables = _sgr_params_table(color_type, is_bg)
+    if color_type == color_types.truecolor:
+        red, green, blue = tables
+        return red[colors[:, 0]] + green[colors[:, 1]] + blue[colors[:, 2]]
+    return tables[0][colors]
+
+
+def _color_changes(colors):
+    """Return a mask of the cells in a row whose color differs from the cell before."""
+    changed = np.ones(len(colors), dtype=bool)
+    differs = colors[1:] != colors[:-1]
+    changed[1:] = differs.any(axis=1) if differs.ndim > 1 else differs
+    return changed
+
+
+def _compact_columns(bg_colors, fg_colors, color_type):
+    """
+    Return the columns of string pieces for a row that only switches color when
+    it changes from the previous cell, setting background and foreground in a
+    single SGR sequence.
+    """
+    bg_changed = _color_changes(bg_colors)
+    bg_params = np.where(bg_changed, _sgr_params(bg_colors, color_type, True), "")
+    if fg_colors is None:
+        fg_changed = np.zeros_like(bg_changed)
+        fg_params = ""
+    else:
+        fg_changed = _color_changes(fg_colors)
+        fg_params = np.where(
+            fg_changed, _sgr_params(fg_colors, color_type, False), ""
+        )
+    any_changed = bg_changed | fg_changed
+    return [
+        np.where(any_changed, "\x1b[", ""),
+        bg_params,
+        np.where(bg_changed & fg_changed, ";", ""),
+        fg_params,
+        np.where(any_changed, "m", ""),
+    ]
+
+
+def _join_columns(columns, width):
+    """Interleave the columns of a row into a single string."""
+    if len(columns) == 1:
+        return "".join(columns[0].tolist())
+    cells = np.empty((width, len(columns)), dtype=object)
+    for i, column in enumerate(columns):
+        cells[:, i] = column
+    return "".join(cells.ravel().tolist())
+
+
+def _arrayToAnsi(
+    arr,
+    is_unicode,
+    color_type,
+    palette,
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    tables=None,
+    stats=None,
+    glyphs="half",
+    threads=1,
+):
+    return "".join(
+        _arrayToAnsiRows(
+            arr,
+            is_unicode,
+            color_type,
+            palette,
+            is_compact,
+            is_perceptual,
+            dither,
+            tables,
+            stats,
+            glyphs,
+            threads,
+        )
+    )
+
+
+def _arrayToAnsiRows(
+    arr,
+    is_unicode,
+    color_type,
+    palette,
+    is_compact=False,
+    is_perceptual=False,
+    dither="none",
+    tables=None,
+    stats=None,
+    glyphs="half",
+    threads=1,
+):
+    """Generator version of _arrayToAnsi, yielding one terminal row at a time."""
+    arr = np.asarray(arr)
+    assert arr.ndim == 3 and arr.shape[2] >= 3, "Expecting RGB or RGBA array"
+    # error diffusion carries from each row to the next, so can't be split up
+    if threads > 1 and dither != "floyd-steinberg":
+        yield from _bandedRows(
+            arr,
+            is_unicode,
+            color_type,
+            palette,
+            is_compact,
+            is_perceptual,
+            dither,
+            tables,
+            stats,
+            glyphs,
+            threads,
+        )
+        return
+    cell_rows = _cellRows(
+        arr,
+        is_unicode,
+        color_type,
+        palette,
+        is_perceptual,
+        dither,
+        tables,
+        stats,
+        glyphs,
+    )
+    for bg_colors, fg_colors, text in cell_rows:
+        if stats is not None:
+            start = time.perf_counter()
+        columns = _cell_columns(bg_colors, fg_colors, text, color_type, is_compact)
         # Line ending, reset colours
         # We do this not to affect the surrounding terminal content.
-        ansi_build.write("{}\n".format(get_reset_code()))
+        row = "{}{}\n".format(
+            _join_columns(columns, len(bg_colors)), get_reset_code()
+        )
+        if stats is not None:
+            stats.add_time("emit", time.perf_counter() - start)
+            stats.count("rows")
+            if isinstance(text, str):
+                # everything but the half block is ASCII, and it takes 3 bytes in UTF-8
+                stats.count("output_bytes", len(row) + 2 * row.count("▄"))
+            else:
+                stats.count("output_bytes", len(row.encode("utf-8")))
+        yield row
+
+
+# bands of rows given to threads are a multiple of this many terminal rows, the
+# Bayer matrix size, so they are dithered as the whole image would be
+_band_rows = 8
+
+
+def _bandedRows(
+    arr,
+    is_unicode,
+    color_type,
+    palette,
+    is_compact,
+    is_perceptual,
+    dither,
+    tables,
+    stats,
+    glyphs,
+    threads,
+):
+    """
+    _arrayToAnsiRows converting bands of rows on a pool of threads, yielding the
+    rows in order. Lookups and glyph fitting are numpy work, which runs in parallel.
+    """
+    cell_height = glyph_shapes[glyphs][1] if is_unicode else 1
+    # a band per thread, as each one has some overhead
+    rows = -(-len(arr) // cell_height)
+    band_rows = -(-rows // (threads * _band_rows)) * _band_rows
+    band_height = band_rows * cell_height
+    bands = [arr[y : y + band_height] for y in range(0, len(arr), band_height)]
+
+    def convert(band):
+        # each band records its own stats, as they aren't thread safe
+        band_stats = RenderStats() if stats is not None else None
+        rows = list(
+            _arrayToAnsiRows(
+                band,
+                is_unicode,
+                color_type,
+                palette,
+                is_compact,
+                is_perceptual,
+                dither,
+                tables,
+                band_stats,
+                glyphs,
+            )
+        )
+        return rows, band_stats
+
+    with ThreadPoolExecutor(max_workers=min(threads, len(bands))) as pool:
+        for rows, band_stats in pool.map(convert, bands):
+            if stats is not None:
+                stats.merge(band_stats)
+            yield from rows
+
+
+def _cellRows(
+    arr,
+    is_unicode,
+    color_type,
+    palette,
+    is_perceptual=False,
+    dither="none",
+    tables=None,
+    stats=None,
+    glyphs="half",
+):
+    """
+    Yield the cells of each terminal row drawing an image, as a tuple of their
+    background colors, their foreground colors (None for ASCII, which only draws
+    backgrounds), and their text: either a string drawn in every cell, or an array
+    of each cell's glyph. Colors are quantized as _quantize does.
+    """
+    if is_unicode and glyphs != "half":
+        yield from _glyphCells(
+            arr, glyphs, color_type, palette, is_perceptual, dither, tables, stats
+        )
+        return
+    height, width = arr.shape[:2]
+    step = 2 if is_unicode else 1
+
+    bands = _quantize_rows(
+        arr, step, color_type, palette, is_perceptual, dither, tables, stats
+    )
+    if stats is not None:
+        stats.count("pixels", height * width)
+        bands = timed(bands, stats, "quantize")
+    for colors in bands:
         if is_unicode:
-            # skip a row because we do two rows at once
-            next(yit, None)
+            # the top pixel is the background, the next row's pixel the foreground
+            yield colors[0], colors[1], "▄"
+        else:
+            yield colors[0], None, "  "
+
 
-    return ansi_build.getvalue()
+def _glyphCells(
+    arr,
+    glyphs,
+    color_type,
+    palette,
+    is_perceptual=False,
+    dither="none",
+    tables=None,
+    stats=None,
+):
+    """
+    _cellRows for the quadrant and sextant glyph modes, drawing each cell with the
+    two colors and glyph that fit its pixels best.
+    """
+    if stats is not None:
+        stats.count("pixels", arr.shape[0] * arr.shape[1])
+        start = time.perf_counter()
+    colors, masks = fit_cells(arr, glyphs)
+    if stats is not None:
+        stats.add_time("fit", time.perf_counter() - start)
+    width = colors.shape[1]
+    glyph_table = glyph_tables[glyphs]
+    cells = np.arange(width)
+
+    # the background and foreground colors are quantized (and dithered) separately
+    bg_bands = _quantize_rows(
+        colors[0::2], 1, color_type, palette, is_perceptual, dither, tables, stats
+    )
+    fg_bands = _quantize_rows(
+        colors[1::2], 1, color_type, palette, is_perceptual, dither, tables, stats
+    )
+    bands = zip(bg_bands, fg_bands)
+    if stats is not None:
+        bands = timed(bands, stats, "quantize")
+    for row_masks, (bg_colors, fg_colors) in zip(masks, bands):
+        # cells drawn with a space keep the foreground of the cell before, so
+        # compact rows don't switch it for nothing
+        fg_colors = fg_colors[0][np.maximum.accumulate(np.where(row_masks, cells, 0))]
+        yield bg_colors[0], fg_colors, glyph_table[row_masks]
+
+
+def _cell_columns(bg_colors, fg_colors, text, color_type, is_compact=False):
+    """
+    Return the columns of string pieces drawing a row of cells, given as _cellRows
+    yields them.
+    """
+    if is_compact:
+        return _compact_columns(bg_colors, fg_colors, color_type) + [text]
+    if not isinstance(text, str):
+        columns = _sgr_columns(bg_colors, color_type, is_bg=True)
+        return columns + _sgr_columns(fg_colors, color_type, is_bg=False) + [text]
+    # text drawn in every cell is part of the last table, saving a column
+    if fg_colors is None:
+        return _sgr_columns(bg_colors, color_type, is_bg=True, end=text)
+    return _sgr_columns(bg_colors, color_type, is_bg=True) + _sgr_columns(
+        fg_colors, color_type, is_bg=False, end=text
+    )
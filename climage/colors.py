@@ -0,0 +1,342 @@
+"""Palette definitions and color modes, which don't need numpy or Pillow."""
+
+
+class color_types:
+    truecolor = 0
+    color256 = 1
+    color16 = 2
+    color8 = 3
+
+
+def _get_color_type(is_truecolor, is_256color, is_16color, is_8color):
+    """Return an enum depending on which color is toggled. Exactly one must be toggled"""
+    assert (
+        int(bool(is_8color))
+        + int(bool(is_16color))
+        + int(bool(is_256color))
+        + int(bool(is_truecolor))
+        == 1
+        and "only pick one colormode"
+    )
+
+    if is_truecolor:
+        return color_types.truecolor
+    if is_256color:
+        return color_types.color256
+    if is_16color:
+        return color_types.color16
+    if is_8color:
+        return color_types.color8
+
+
+palettes = [
+    "default",
+    "xterm",
+    "linuxconsole",
+    "solarized",
+    "rxvt",
+    "tango",
+    "gruvbox",
+    "gruvboxdark",
+]
+dither_modes = ["none", "bayer", "floyd-steinberg"]
+# how images are drawn, "none" meaning with colored character cells
+graphics_modes = ["none", "kitty", "sixel"]
+# the characters unicode output is drawn with, see glyphs.py
+glyph_modes = ["half", "quadrant", "sextant"]
+
+# system colors of palettes added with register_palette, by name
+_custom_palettes = {}
+
+
+def register_palette(name, colors):
+    """
+    Add a palette of system colors, which can then be used by name like the built in
+    ones. Registering the same name again with the same colors has no effect.
+
+    Arguments:
+    name        -- Name to refer to the palette by.
+    colors      -- The 16 system colors, in order, as [r, g, b] or [r, g, b, code]
+                   (as output by extra/colorextract.py) entries.
+    """
+    entries = _palette_entries(colors, name)
+    if name in palettes and _custom_palettes.get(name) != entries:
+        raise ValueError("palette {} already exists".format(name))
+    if name not in palettes:
+        palettes.append(name)
+    _custom_palettes[name] = entries
+
+
+def _palette_entries(colors, name):
+    """Check the 16 system colors of a palette, returning them as [r, g, b, code] entries."""
+    if len(colors) != 16:
+        raise ValueError("palettes need 16 colors, got {}".format(len(colors)))
+    entries = []
+    for i, color in enumerate(colors):
+        r, g, b = (int(c) for c in color[:3])
+        if not all(0 <= c <= 255 for c in (r, g, b)):
+            raise ValueError("invalid color {} in palette {}".format(color, name))
+        entries.append([r, g, b, i])
+    return entries
+
+
+def load_palette(path, name=None):
+    """
+    Register a palette read from a file, returning its name.
+
+    The file either holds a JSON list of the 16 colors, as [r, g, b] or [r, g, b, code]
+    entries (the format printed by extra/colorextract.py), or has one color per line
+    written as #rrggbb. Blank lines and lines starting with // or ; are ignored.
+
+    Arguments:
+    path        -- The file to read.
+
+    Keyword Arguments:
+    name        -- Name to register the palette as, default the file name without extension.
+    """
+    import json
+    import os
+
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        colors = json.loads(text)
+    else:
+        colors = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line.startswith(("//", ";")):
+                continue
+            value = line.lstrip("#")
+            if len(value) != 6:
+                raise ValueError("invalid color {!r} in {}".format(line, path))
+            colors.append([int(value[i : i + 2], 16) for i in (0, 2, 4)])
+
+    if name is None:
+        name = os.path.splitext(os.path.basename(path))[0]
+    register_palette(name, colors)
+    return name
+
+
+def _get_system_colors(palette):
+    # a palette that isn't registered, given as a tuple of its [r, g, b, code] entries
+    if isinstance(palette, tuple):
+        return [list(color) for color in palette]
+    # see extras/colorextract.py for details on getting these values
+    if palette == "default":
+        return [
+            [0, 0, 0, 0],
+            [128, 0, 0, 1],
+            [0, 128, 0, 2],
+            [128, 128, 0, 3],
+            [0, 0, 128, 4],
+            [128, 0, 128, 5],
+            [0, 128, 128, 6],
+            [192, 192, 192, 7],
+            [128, 128, 128, 8],
+            [255, 0, 0, 9],
+            [0, 255, 0, 10],
+            [255, 255, 0, 11],
+            [0, 0, 255, 12],
+            [255, 0, 255, 13],
+            [0, 255, 255, 14],
+            [255, 255, 255, 15],
+        ]
+    if palette == "xterm":
+        return [
+            [0, 0, 0, 0],
+            [205, 0, 0, 1],
+            [0, 205, 0, 2],
+            [205, 205, 0, 3],
+            [0, 0, 238, 4],
+            [205, 0, 205, 5],
+            [0, 205, 205, 6],
+            [229, 229, 229, 7],
+            [127, 127, 127, 8],
+            [255, 0, 0, 9],
+            [0, 255, 0, 10],
+            [255, 255, 0, 11],
+            [92, 92, 255, 12],
+            [255, 0, 255, 13],
+            [0, 255, 255, 14],
+            [255, 255, 255, 15],
+        ]
+    elif palette == "linuxconsole":
+        return [
+            [0, 0, 0, 0],
+            [170, 0, 0, 1],
+            [0, 170, 0, 2],
+            [170, 85, 0, 3],
+            [0, 0, 170, 4],
+            [170, 0, 170, 5],
+            [0, 170, 170, 6],
+            [170, 170, 170, 7],
+            [85, 85, 85, 8],
+            [255, 85, 85, 9],
+            [85, 255, 85, 10],
+            [255, 255, 85, 11],
+            [85, 85, 255, 12],
+            [255, 85, 255, 13],
+            [85, 255, 255, 14],
+            [255, 255, 255, 15],
+        ]
+    elif palette == "solarized":
+        return [
+            [7, 54, 66, 0],
+            [220, 50, 47, 1],
+            [133, 153, 0, 2],
+            [181, 137, 0, 3],
+            [38, 139, 210, 4],
+            [211, 54, 130, 5],
+            [42, 161, 152, 6],
+            [238, 232, 213, 7],
+            [0, 43, 54, 8],
+            [203, 75, 22, 9],
+            [88, 110, 117, 10],
+            [101, 123, 131, 11],
+            [131, 148, 150, 12],
+            [108, 113, 196, 13],
+            [147, 161, 161, 14],
+            [253, 246, 227, 15],
+        ]
+    elif palette == "rxvt":
+        return [
+            [0, 0, 0, 0],
+            [205, 0, 0, 1],
+            [0, 205, 0, 2],
+            [205, 205, 0, 3],
+            [0, 0, 205, 4],
+            [205, 0, 205, 5],
+            [0, 205, 205, 6],
+            [250, 235, 215, 7],
+            [64, 64, 64, 8],
+            [255, 0, 0, 9],
+            [0, 255, 0, 10],
+            [255, 255, 0, 11],
+            [0, 0, 255, 12],
+            [255, 0, 255, 13],
+            [0, 255, 255, 14],
+            [255, 255, 255, 15],
+        ]
+    elif palette == "tango":
+        return [
+            [0, 0, 0, 0],
+            [204, 0, 0, 1],
+            [78, 154, 6, 2],
+            [196, 160, 0, 3],
+            [52, 101, 164, 4],
+            [117, 80, 123, 5],
+            [6, 152, 154, 6],
+            [211, 215, 207, 7],
+            [85, 87, 83, 8],
+            [239, 41, 41, 9],
+            [138, 226, 52, 10],
+            [252, 233, 79, 11],
+            [114, 159, 207, 12],
+            [173, 127, 168, 13],
+            [52, 226, 226, 14],
+            [238, 238, 236, 15],
+        ]
+    elif palette == "gruvbox":
+        return [
+            [251, 241, 199, 0],
+            [204, 36, 29, 1],
+            [152, 151, 26, 2],
+            [215, 153, 33, 3],
+            [69, 133, 136, 4],
+            [177, 98, 134, 5],
+            [104, 157, 106, 6],
+            [124, 111, 100, 7],
+            [146, 131, 116, 8],
+            [157, 0, 6, 9],
+            [121, 116, 14, 10],
+            [181, 118, 20, 11],
+            [7, 102, 120, 12],
+            [143, 63, 113, 13],
+            [66, 123, 88, 14],
+            [60, 56, 54, 15],
+        ]
+    elif palette == "gruvboxdark":
+        return [
+            [40, 40, 40, 0],
+            [204, 36, 29, 1],
+            [152, 151, 26, 2],
+            [215, 153, 33, 3],
+            [69, 133, 136, 4],
+            [177, 98, 134, 5],
+            [104, 157, 106, 6],
+            [168, 153, 132, 7],
+            [146, 131, 116, 8],
+            [251, 73, 52, 9],
+            [184, 187, 38, 10],
+            [250, 189, 47, 11],
+            [131, 165, 152, 12],
+            [211, 134, 155, 13],
+            [142, 192, 124, 14],
+            [235, 219, 178, 15],
+        ]
+
+    elif palette in _custom_palettes:
+        return [color[:] for color in _custom_palettes[palette]]
+
+    else:
+        raise ValueError("invalid palette {}".format(palette))
+
+
+def _get_palette_colors(color_type, palette):
+    """Return the [r, g, b, code] entries a color type may pick from."""
+    # TODO: add assert for color_type?
+    if color_type == color_types.color8:
+        colors = _get_system_colors(palette)[:8]
+    elif color_type == color_types.color16:
+        colors = _get_system_colors(palette)[:]
+    elif color_type == color_types.color256:
+        colors = _get_system_colors(palette)[:]
+        # credit: https://github.com/dom111/image-to-ansi/
+        # these colours can be found by running colortest-256
+        levels = [0, 95, 135, 175, 215, 255]
+        for r, r1 in enumerate(levels):
+            for g, g1 in enumerate(levels):
+                for b, b1 in enumerate(levels):
+                    colors.append([r1, g1, b1, 16 + 36 * r + 6 * g + b])
+
+        for s in [
+            8,
+            18,
+            28,
+            38,
+            48,
+            58,
+            68,
+            78,
+            88,
+            98,
+            108,
+            118,
+            128,
+            138,
+            148,
+            158,
+            168,
+            178,
+            188,
+            198,
+            208,
+            218,
+            228,
+            238,
+        ]:
+            colors.append([s, s, s, 232 + s // 10])
+    return colors
+
+
+# the ansi numbers of the 8 and 16 bit ids [0, 15], as backgrounds and foregrounds
+_codepoints = {
+    True: ["4" + str(i) for i in range(8)] + ["10" + str(i) for i in range(8)],
+    False: ["3" + str(i) for i in range(8)] + ["9" + str(i) for i in range(8)],
+}
+
+
+# convert a 8 or 16bit id [0, 15] to the ansi number
+def _id_to_codepoint(in_id, is_bg):
+    return _codepoints[is_bg][in_id]
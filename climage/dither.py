@@ -0,0 +1,92 @@
+import numpy as np
+
+
+def _bayer_matrix(size):
+    """Return the size x size Bayer threshold matrix, with values [0, size*size)."""
+    matrix = np.zeros((1, 1), dtype=np.intp)
+    while len(matrix) < size:
+        matrix = np.block(
+            [[4 * matrix, 4 * matrix + 2], [4 * matrix + 3, 4 * matrix + 1]]
+        )
+    return matrix
+
+
+# threshold offsets in [-0.5, 0.5), tiled over the image
+_bayer = (_bayer_matrix(8) + 0.5) / 64 - 0.5
+
+
+def ordered(pixels, y, spread):
+    """
+    Apply ordered (Bayer) dithering to a band of rows, returning RGB values offset
+    by the threshold map and ready to be matched to the nearest palette color.
+
+    Arguments:
+    pixels  -- (h, w, >=3) array of RGB(A) pixels.
+    y       -- The row of the image the band starts on, to line up the threshold map.
+    spread  -- How far apart the palette colors are, scales the offsets.
+    """
+    height, width = pixels.shape[:2]
+    thresholds = _bayer[
+        (np.arange(y, y + height) % len(_bayer))[:, None],
+        (np.arange(width) % len(_bayer))[None, :],
+    ]
+    dithered = pixels[..., :3] + (thresholds * spread)[..., None]
+    return np.clip(dithered + 0.5, 0, 255).astype(np.uint8)
+
+
+class FloydSteinberg:
+    """
+    Floyd-Steinberg error diffusion, fed one image row at a time.
+
+    Each pixel's quantization error is spread onto its unvisited neighbours, which
+    makes every pixel depend on the one before it. So rather than searching the
+    palette, pixels are matched with a 32x32x32 table of nearest colors, and the
+    loop runs over plain python lists.
+
+    Arguments:
+    width       -- Width of the image in pixels.
+    coarse      -- Palette code of the nearest color for each 5 bit per channel
+                   color, indexed by (r >> 3) << 10 | (g >> 3) << 5 | b >> 3.
+    code_rgb    -- (r, g, b) of each palette code.
+    """
+
+    def __init__(self, width, coarse, code_rgb):
+        self.width = width
+        self.coarse = coarse
+        self.code_rgb = code_rgb
+        # error carried to the row below, padded by a pixel on each side
+        self.errors = [[0.0] * (width + 2) for _ in range(3)]
+
+    def row(self, pixels):
+        """Quantize the next (w, >=3) row of pixels, returning its palette codes."""
+        coarse = self.coarse
+        code_rgb = self.code_rgb
+        err_r, err_g, err_b = self.errors
+        next_r, next_g, next_b = [[0.0] * (self.width + 2) for _ in range(3)]
+        codes = [0] * self.width
+        # error carried to the pixel on the right
+        right_r = right_g = right_b = 0.0
+
+        for x, pixel in enumerate(pixels[:, :3].tolist()):
+            r = min(255.0, max(0.0, pixel[0] + err_r[x + 1] + right_r))
+            g = min(255.0, max(0.0, pixel[1] + err_g[x + 1] + right_g))
+            b = min(255.0, max(0.0, pixel[2] + err_b[x + 1] + right_b))
+            code = coarse[(int(r) >> 3) << 10 | (int(g) >> 3) << 5 | int(b) >> 3]
+            codes[x] = code
+            pr, pg, pb = code_rgb[code]
+            dr, dg, db = r - pr, g - pg, b - pb
+
+            right_r, right_g, right_b = dr * 0.4375, dg * 0.4375, db * 0.4375
+            # below left, below, and below right
+            next_r[x] += dr * 0.1875
+            next_g[x] += dg * 0.1875
+            next_b[x] += db * 0.1875
+            next_r[x + 1] += dr * 0.3125
+            next_g[x + 1] += dg * 0.3125
+            next_b[x + 1] += db * 0.3125
+            next_r[x + 2] += dr * 0.0625
+            next_g[x + 2] += dg * 0.0625
+            next_b[x + 2] += db * 0.0625
+
+        self.errors = [next_r, next_g, next_b]
+        return codes
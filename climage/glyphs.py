@@ -0,0 +1,102 @@
+import numpy as np
+
+# the pixels (width, height) drawn by each character of a unicode glyph mode
+glyph_shapes = {"half": (1, 2), "quadrant": (2, 2), "sextant": (2, 3)}
+
+
+def _quadrant_glyphs():
+    # bits 0-3 are the top left, top right, bottom left and bottom right pixels
+    return np.array(list(" ▘▝▀▖▌▞▛▗▚▐▜▄▙▟█"), dtype=object)
+
+
+def _sextant_glyphs():
+    # bits 0-5 are the pixels left to right, top to bottom. Unicode encodes the
+    # sextants in order, apart from the four that already had block elements.
+    special = {0: " ", 21: "▌", 42: "▐", 63: "█"}
+    glyphs = []
+    for bits in range(64):
+        if bits in special:
+            glyphs.append(special[bits])
+        else:
+            glyphs.append(chr(0x1FB00 + bits - 1 - (bits > 21) - (bits > 42)))
+    return np.array(glyphs, dtype=object)
+
+
+# the character drawing each pattern of foreground pixels in a cell
+glyph_tables = {"quadrant": _quadrant_glyphs(), "sextant": _sextant_glyphs()}
+
+
+def _partitions(n):
+    """
+    Return the ways of splitting n pixels into foreground and background, as an
+    array of masks and a (masks, n) array of which pixels are in the foreground.
+    The last pixel is always in the background, as swapping the colors of a split
+    draws the same cell.
+    """
+    masks = np.arange(1 << (n - 1))
+    members = (masks[:, None] >> np.arange(n)) & 1
+    return masks, members.astype(np.float32)
+
+
+# cells fitted at once, bounding the (cells, 3, splits) arrays used
+_chunk_size = 4096
+
+
+def fit_cells(arr, glyphs):
+    """
+    Pick the two colors and the glyph that best draw each cell of an image, as the
+    split of the cell's pixels into two groups leaving the least squared error when
+    each group is drawn in its mean color. Every split is tried, for many cells at
+    once.
+
+    Arguments:
+    arr         -- (h, w, >=3) array of pixels, whose width and height are multiples
+                   of the glyph's shape.
+    glyphs      -- The glyph mode, "quadrant" or "sextant".
+
+    Returns an (2 * rows, columns, 3) array holding for each row of cells a row of
+    background colors followed by a row of foreground colors, and a (rows, columns)
+    array of the mask of foreground pixels of each cell.
+    """
+    cell_width, cell_height = glyph_shapes[glyphs]
+    height, width = arr.shape[:2]
+    rows, columns = height // cell_height, width // cell_width
+    n = cell_width * cell_height
+    masks, members = _partitions(n)
+    sizes = members.sum(axis=1)
+    # one over the number of pixels in each group, zero for empty groups
+    inverse_fg = np.where(sizes > 0, 1 / np.maximum(sizes, 1), 0).astype(np.float32)
+    inverse_bg = (1 / (n - sizes)).astype(np.float32)
+
+    # (cells, 3, n) pixels of each cell, in the order of the mask bits
+    cells = (
+        np.asarray(arr)[: rows * cell_height, : columns * cell_width, :3]
+        .reshape(rows, cell_height, columns, cell_width, 3)
+        .transpose(0, 2, 4, 1, 3)
+        .reshape(rows * columns, 3, n)
+    )
+    colors = np.empty((rows * columns, 2, 3), dtype=np.uint8)
+    cell_masks = np.empty(rows * columns, dtype=np.intp)
+    for start in range(0, len(cells), _chunk_size):
+        pixels = cells[start : start + _chunk_size].astype(np.float32)
+        fg_sums = pixels @ members.T
+        bg_sums = pixels.sum(axis=2, keepdims=True) - fg_sums
+        # minimising the squared error is maximising the groups' sum squared over size
+        score = (
+            np.einsum("ckp,ckp->cp", fg_sums, fg_sums) * inverse_fg
+            + np.einsum("ckp,ckp->cp", bg_sums, bg_sums) * inverse_bg
+        )
+        best = np.argmax(score, axis=1)
+
+        chunk = np.arange(len(pixels))
+        bg = bg_sums[chunk, :, best] * inverse_bg[best, None]
+        fg = fg_sums[chunk, :, best] * inverse_fg[best, None]
+        # cells of a single color draw a space, so use its color for both
+        uniform = sizes[best] == 0
+        fg[uniform] = bg[uniform]
+        colors[start : start + _chunk_size, 0] = np.rint(bg)
+        colors[start : start + _chunk_size, 1] = np.rint(fg)
+        cell_masks[start : start + _chunk_size] = masks[best]
+
+    colors = colors.reshape(rows, columns, 2, 3).transpose(0, 2, 1, 3)
+    return colors.reshape(2 * rows, columns, 3), cell_masks.reshape(rows, columns)
@@ -0,0 +1,237 @@
+import base64
+import time
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from .climage import _quantize_rows, _resize, color_types, default_tables
+from .stats import timed
+
+# images drawn with graphics are sized assuming terminal cells of this many pixels
+# (width, height), a common size for terminal fonts
+cell_size = (10, 20)
+
+# kitty limits each escape sequence to this much base64 data
+_kitty_chunk_size = 4096
+# zlib's fastest level, as repeated frames must encode quickly, and it already
+# shrinks photos and flat areas a lot
+_kitty_compression = 1
+
+
+def _toGraphicsRows(
+    img,
+    oWidth,
+    graphics,
+    color_type,
+    palette,
+    is_perceptual=False,
+    dither="none",
+    tables=None,
+    stats=None,
+    resample="default",
+):
+    """
+    Resize the image to fill oWidth columns, and encode it with the graphics
+    protocol, yielding the output a piece at a time.
+    """
+    if stats is not None:
+        start = time.perf_counter()
+        stats.count("source_pixels", img.width * img.height)
+    if graphics != "kitty" or img.width > oWidth * cell_size[0]:
+        # kitty scales images up to fill the columns itself, so they are only shrunk
+        img = _resize_graphics(img, oWidth, resample)
+    if stats is not None:
+        stats.add_time("resize", time.perf_counter() - start)
+    return _arrayToGraphicsRows(
+        np.asarray(img),
+        graphics,
+        color_type,
+        palette,
+        is_perceptual=is_perceptual,
+        dither=dither,
+        tables=tables,
+        stats=stats,
+        columns=oWidth,
+    )
+
+
+def _resize_graphics(img, oWidth, resample="default"):
+    # the unicode size keeps the aspect ratio, at one pixel per column
+    return _resize(img, oWidth * cell_size[0], True, resample)
+
+
+def _arrayToGraphicsRows(
+    arr,
+    graphics,
+    color_type,
+    palette,
+    is_perceptual=False,
+    dither="none",
+    tables=None,
+    stats=None,
+    columns=None,
+):
+    """
+    Encode an array of RGB(A) pixels with the graphics protocol, yielding the output
+    a piece at a time. columns is the width the image is scaled to fill, for
+    protocols that can scale, None draws it at its size in pixels.
+    """
+    arr = np.asarray(arr)
+    assert arr.ndim == 3 and arr.shape[2] >= 3, "Expecting RGB or RGBA array"
+    if stats is not None:
+        stats.count("pixels", arr.shape[0] * arr.shape[1])
+
+    if graphics == "kitty":
+        pieces = kitty_rows(arr, columns=columns)
+    elif graphics == "sixel":
+        codes, colors = _sixel_colors(
+            arr, color_type, palette, is_perceptual, dither, tables, stats
+        )
+        pieces = sixel_rows(codes, colors)
+    else:
+        raise ValueError("invalid graphics mode {}".format(graphics))
+
+    if stats is not None:
+        pieces = timed(pieces, stats, "emit")
+    for piece in pieces:
+        if stats is not None:
+            # the protocols only use ASCII
+            stats.count("output_bytes", len(piece))
+        yield piece
+
+
+def kitty_rows(arr, columns=None):
+    """
+    Yield the escape sequences drawing an (h, w, >=3) array of pixels with the kitty
+    graphics protocol: the pixels zlib compressed, base64 encoded, and split into
+    chunks. Any alpha channel is ignored, as with the other output. If columns is
+    given, the terminal scales the image to that many columns.
+    """
+    height, width = arr.shape[:2]
+    pixels = np.ascontiguousarray(arr[..., :3], dtype=np.uint8)
+    payload = base64.standard_b64encode(
+        zlib.compress(pixels.tobytes(), _kitty_compression)
+    )
+    control = "a=T,f=24,o=z,s={},v={}".format(width, height)
+    if columns is not None:
+        control += ",c={}".format(columns)
+
+    for start in range(0, len(payload), _kitty_chunk_size):
+        chunk = payload[start : start + _kitty_chunk_size].decode("ascii")
+        more = int(start + _kitty_chunk_size < len(payload))
+        if start:
+            yield "\x1b_Gm={};{}\x1b\\".format(more, chunk)
+        else:
+            yield "\x1b_G{},m={};{}\x1b\\".format(control, more, chunk)
+    # the cursor is left on the image's last row
+    yield "\n"
+
+
+def _sixel_colors(arr, color_type, palette, is_perceptual, dither, tables, stats):
+    """
+    Return the (h, w) array of sixel color registers for the pixels, and the RGB
+    color of each register. In 8/16/256 color modes these are the palette codes,
+    looked up (and dithered) as for cells. Truecolor picks the 256 colors best
+    suited to the image instead, as that is all sixel terminals hold.
+    """
+    if stats is not None:
+        start = time.perf_counter()
+    if color_type == color_types.truecolor:
+        quantized = Image.fromarray(np.ascontiguousarray(arr[..., :3])).quantize(
+            256,
+            method=Image.Quantize.FASTOCTREE,
+            dither=(
+                Image.Dither.FLOYDSTEINBERG if dither != "none" else Image.Dither.NONE
+            ),
+        )
+        codes = np.asarray(quantized, dtype=np.intp)
+        colors = np.array(quantized.getpalette(), dtype=np.int32).reshape(-1, 3)
+    else:
+        if tables is None:
+            tables = default_tables
+        codes = np.concatenate(
+            list(
+                _quantize_rows(
+                    arr,
+                    max(1, len(arr)),
+                    color_type,
+                    palette,
+                    is_perceptual,
+                    dither,
+                    tables,
+                    stats,
+                )
+            )
+        )
+        colors = tables.get(color_type, palette, is_perceptual).code_rgb
+    if stats is not None:
+        stats.add_time("quantize", time.perf_counter() - start)
+    return codes, colors
+
+
+def sixel_rows(codes, colors):
+    """
+    Yield the sixel sequence drawing an image, a band of 6 pixel rows at a time.
+
+    Arguments:
+    codes       -- (h, w) array of the color register of each pixel.
+    colors      -- The RGB color of each register, as rows of 8 bit components.
+    """
+    height, width = codes.shape
+    used = np.unique(codes)
+    # registers take percentages
+    percents = (np.asarray(colors)[used] * 100 + 127) // 255
+    yield '\x1bP0;1;0q"1;1;{};{}'.format(width, height) + "".join(
+        "#{};2;{};{};{}".format(code, *rgb)
+        for code, rgb in zip(used.tolist(), percents.tolist())
+    )
+
+    # the pieces runs are made of: a repeat count for runs of 4 or more, then the
+    # character, or the character repeated for shorter runs
+    counts = np.array(
+        ["!{}".format(n) if n >= 4 else "" for n in range(width + 1)], dtype=object
+    )
+    repeats = np.minimum(np.arange(width + 1), 4) % 4
+    repeats[repeats == 0] = 1
+    characters = np.array(
+        [[chr(c) * n for c in range(63, 127)] for n in range(4)], dtype=object
+    )
+    # runs of columns without any pixels of the color
+    gaps = counts + characters[repeats, 0]
+    gaps[0] = ""
+    selects = np.array(
+        ["$#{}".format(code) for code in range(len(colors))], dtype=object
+    )
+
+    columns = np.arange(width)
+    for y in range(0, height, 6):
+        band = codes[y : y + 6]
+        # the columns each color has pixels in, in order, and those pixels as bits
+        cells, index = np.unique((band * width + columns).ravel(), return_inverse=True)
+        bits = np.bincount(
+            index.ravel(), weights=np.repeat(1 << np.arange(len(band)), width)
+        ).astype(np.intp)
+        color, column = np.divmod(cells, width)
+
+        # split each color's line into runs of the same character, skipping over
+        # the columns it has no pixels in
+        first = np.ones(len(cells), dtype=bool)
+        first[1:] = color[1:] != color[:-1]
+        gap = np.empty(len(cells), dtype=np.intp)
+        gap[1:] = column[1:] - column[:-1] - 1
+        gap[first] = column[first]
+        starts = first | (gap > 0)
+        starts[1:] |= bits[1:] != bits[:-1]
+        start = np.nonzero(starts)[0]
+        lengths = np.diff(np.append(start, len(cells)))
+
+        pieces = (
+            gaps[gap[start]]
+            + counts[lengths]
+            + characters[repeats[lengths], bits[start]]
+        )
+        new_color = first[start]
+        pieces[new_color] = selects[color[start[new_color]]] + pieces[new_color]
+        yield "".join(pieces.tolist())[1:] + "-"
+    yield "\x1b\\\n"
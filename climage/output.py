@@ -0,0 +1,82 @@
+import io
+
+# rows are gathered into chunks of about this many characters before being encoded
+# and written, so a large render takes a handful of writes rather than one per row.
+# Terminals are instead written to a row at a time, so images appear as they are
+# converted.
+_chunk_size = 1 << 16
+
+
+def _binary_stream(outfile):
+    """Return the binary stream under outfile, or None if it only accepts text."""
+    if isinstance(outfile, io.TextIOBase):
+        buffer = getattr(outfile, "buffer", None)
+        if buffer is not None:
+            # text already written has to come out before anything written below it
+            outfile.flush()
+        return buffer
+    return outfile
+
+
+def _is_terminal(stream):
+    isatty = getattr(stream, "isatty", None)
+    try:
+        return isatty is not None and isatty()
+    except ValueError:
+        # closed
+        return False
+
+
+def write_rows(rows, outfile, chunk_size=None):
+    """
+    Write rows of output to a file object, encoding them as UTF-8 in large chunks
+    directly onto the underlying binary stream. Terminals are written to, and
+    flushed, after every row instead. The whole output is never held in
+    memory at once. Returns the number of bytes written (or characters, for text
+    streams with no binary buffer, such as io.StringIO).
+
+    Arguments:
+    rows        -- Iterable of strings, e.g. from iter_convert.
+    outfile     -- A writable file object. Binary streams (files opened with "wb",
+                   sys.stdout.buffer, pipes, socket.makefile("wb")) are written to
+                   directly, and for text streams their binary buffer is used.
+
+    Keyword Arguments:
+    chunk_size  -- Roughly how many characters to gather before each write. Default
+                   None (64K characters, or a row at a time for terminals).
+    """
+    stream = _binary_stream(outfile)
+    is_text = stream is None
+    if is_text:
+        stream = outfile
+    interactive = _is_terminal(stream)
+    if chunk_size is None:
+        chunk_size = 1 if interactive else _chunk_size
+
+    written = 0
+    chunk = []
+    size = 0
+    for row in rows:
+        chunk.append(row)
+        size += len(row)
+        if size >= chunk_size:
+            written += _write_chunk(stream, chunk, is_text)
+            if interactive:
+                stream.flush()
+            chunk = []
+            size = 0
+    if chunk:
+        written += _write_chunk(stream, chunk, is_text)
+
+    flush = getattr(stream, "flush", None)
+    if flush is not None:
+        flush()
+    return written
+
+
+def _write_chunk(stream, chunk, is_text):
+    data = "".join(chunk)
+    if not is_text:
+        data = data.encode("utf-8")
+    stream.write(data)
+    return len(data)
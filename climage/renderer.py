@@ -0,0 +1,300 @@
+import time
+from io import BytesIO
+
+from .cache import RenderCache
+from .climage import (
+    PaletteTables,
+    _arrayToAnsiRows,
+    _from_buffer,
+    _load,
+    _open_input,
+    _toAnsiRows,
+    resample_modes,
+)
+from .colors import (
+    _get_color_type,
+    _get_system_colors,
+    dither_modes,
+    glyph_modes,
+    graphics_modes,
+)
+from .graphics import _arrayToGraphicsRows, _toGraphicsRows, cell_size
+from .stats import RenderStats
+
+
+class Renderer:
+    """
+    Converts images with a fixed set of options, using palette lookup tables and a
+    render cache of its own rather than ones shared by the whole process. Renderers
+    are safe to share between threads.
+
+    The conversion functions of the climage module use renderers sharing a single
+    set of palette tables.
+
+    Keyword Arguments:
+    is_unicode      -- whether to use unicode in generating output (default False, ASCII will be used)
+    is_truecolor    -- whether to use RGB colors in generation (few terminals support this). Exactly one color option must only be selected. Default False.
+    is_256color     -- whether to use 256 colors (16 system colors, 6x6x6 color cube, and 24 grayscale colors) for generating the output. This is the default color setting. Please run colortest-256 for a demonstration of colors. Default True.
+    is_16color      -- Whether to use only the 16 System colors. Default False
+    is_8color       -- Whether to use only the first 8 of the System colors. Default False.
+    width           -- Number of columns the output will use
+    palette         -- Determines which RGB colors the System colors map to. This only is relevant when using 8/16/256 color modes. This may be one of ["default", "xterm", "linuxconsole", "solarized", "rxvt", "tango", "gruvbox", "gruvboxdark"], or a palette added with register_palette or load_palette.
+    is_compact      -- Whether to only emit color changes between neighbouring cells, combining background and foreground into a single sequence. Looks identical, but produces much smaller output. Default False.
+    is_perceptual   -- Whether to pick the palette color that looks most similar (smallest CIELAB difference), rather than the nearest RGB value. Only relevant for 8/16/256 color modes. Default False.
+    dither          -- Dithering to apply in 8/16/256 color modes, to reduce banding in gradients. One of ["none", "bayer", "floyd-steinberg"]. Bayer (ordered) dithering is fastest, Floyd-Steinberg (error diffusion) gives smoother results. Default "none".
+    resample        -- Speed/quality trade off when resizing images, one of ["fast", "default", "quality"], see climage.convert. Default "default".
+    graphics        -- Draw images with a terminal graphics protocol rather than colored character cells, one of ["none", "kitty", "sixel"], see climage.convert. Default "none".
+    glyphs          -- The characters unicode output is drawn with, one of ["half", "quadrant", "sextant"], see climage.convert. Default "half".
+    threads         -- Number of threads converting each image, each taking a band of rows, see climage.convert. Default 1.
+    cache           -- A RenderCache, or the path of a directory, used by convert to reuse earlier conversions of the same image file. Default None (no caching).
+    tables          -- The PaletteTables to look colors up in, to share them with other renderers. Default None (the renderer creates its own).
+    on_stats        -- Function called with a RenderStats after each conversion, once its whole output has been produced. Default None.
+    """
+
+    def __init__(
+        self,
+        is_unicode=False,
+        is_truecolor=False,
+        is_256color=True,
+        is_16color=False,
+        is_8color=False,
+        width=80,
+        palette="default",
+        is_compact=False,
+        is_perceptual=False,
+        dither="none",
+        resample="default",
+        graphics="none",
+        glyphs="half",
+        threads=1,
+        cache=None,
+        tables=None,
+        on_stats=None,
+    ):
+        self.color_type = _get_color_type(
+            is_truecolor=is_truecolor,
+            is_256color=is_256color,
+            is_16color=is_16color,
+            is_8color=is_8color,
+        )
+        if dither not in dither_modes:
+            raise ValueError("invalid dither mode {}".format(dither))
+        if resample not in resample_modes:
+            raise ValueError("invalid resample mode {}".format(resample))
+        if graphics not in graphics_modes:
+            raise ValueError("invalid graphics mode {}".format(graphics))
+        if glyphs not in glyph_modes:
+            raise ValueError("invalid glyph mode {}".format(glyphs))
+        if glyphs != "half" and not is_unicode:
+            raise ValueError("{} glyphs need is_unicode".format(glyphs))
+        if width < 1:
+            raise ValueError("width must be at least 1")
+        if threads < 1:
+            raise ValueError("threads must be at least 1")
+        self.is_unicode = is_unicode
+        self.width = width
+        self.palette = palette
+        self.is_compact = is_compact
+        self.is_perceptual = is_perceptual
+        self.dither = dither
+        self.resample = resample
+        self.graphics = graphics
+        self.glyphs = glyphs
+        self.threads = threads
+        # the options as given, which cached renders are keyed on (threads is left
+        # out, as it doesn't change the output)
+        self.options = dict(
+            is_unicode=is_unicode,
+            is_truecolor=is_truecolor,
+            is_256color=is_256color,
+            is_16color=is_16color,
+            is_8color=is_8color,
+            width=width,
+            palette=palette,
+            is_compact=is_compact,
+            is_perceptual=is_perceptual,
+            dither=dither,
+            resample=resample,
+            graphics=graphics,
+            glyphs=glyphs,
+        )
+        if cache is not None and not isinstance(cache, RenderCache):
+            cache = RenderCache(cache)
+        self.cache = cache
+        self.tables = tables if tables is not None else PaletteTables()
+        self.on_stats = on_stats
+
+    def convert_pil(self, img):
+        """Convert a Pillow image in RGB or RGBA format, and return the resulting string."""
+        return "".join(self.iter_convert_pil(img))
+
+    def iter_convert_pil(self, img):
+        """Convert a Pillow image, yielding the result one terminal row at a time."""
+        stats = self._new_stats()
+        return self._report(self._iter_pil(img, stats), stats)
+
+    def _iter_pil(self, img, stats):
+        if self.graphics != "none":
+            return _toGraphicsRows(
+                img,
+                self.width,
+                self.graphics,
+                self.color_type,
+                self.palette,
+                self.is_perceptual,
+                self.dither,
+                self.tables,
+                stats,
+                self.resample,
+            )
+        return _toAnsiRows(
+            img,
+            self.width,
+            self.is_unicode,
+            self.color_type,
+            self.palette,
+            self.is_compact,
+            self.is_perceptual,
+            self.dither,
+            self.tables,
+            stats,
+            self.resample,
+            self.glyphs,
+            self.threads,
+        )
+
+    def convert_array(self, arr):
+        """Convert an array of RGB(A) pixels without resizing it, see climage.convert_array."""
+        return "".join(self.iter_convert_array(arr))
+
+    def iter_convert_array(self, arr):
+        """Convert an array of pixels, yielding the result one terminal row at a time."""
+        # quadrants and sextants leave out any rows or columns that don't fill a cell
+        assert (
+            (not self.is_unicode)
+            or self.graphics != "none"
+            or self.glyphs != "half"
+            or len(arr) % 2 == 0
+        ), "Expecting even number of rows in array for unicode conversion"
+
+        stats = self._new_stats()
+        return self._report(self._iter_array(arr, stats), stats)
+
+    def _iter_array(self, arr, stats, columns=None):
+        if self.graphics != "none":
+            return _arrayToGraphicsRows(
+                arr,
+                self.graphics,
+                self.color_type,
+                self.palette,
+                self.is_perceptual,
+                self.dither,
+                self.tables,
+                stats,
+                columns,
+            )
+        return _arrayToAnsiRows(
+            arr,
+            self.is_unicode,
+            self.color_type,
+            self.palette,
+            self.is_compact,
+            self.is_perceptual,
+            self.dither,
+            self.tables,
+            stats,
+            self.glyphs,
+            self.threads,
+        )
+
+    def convert_buffer(self, buffer, size, channels="RGB", stride=None):
+        """Convert raw pixels held in memory, see climage.convert_buffer."""
+        return "".join(self.iter_convert_buffer(buffer, size, channels, stride))
+
+    def iter_convert_buffer(self, buffer, size, channels="RGB", stride=None):
+        """Convert raw pixels, yielding the result one terminal row at a time."""
+        return self.iter_convert_pil(
+            _from_buffer(buffer, size, channels=channels, stride=stride)
+        )
+
+    def convert(self, filename, max_memory=None):
+        """Convert an image file, see climage.convert."""
+        return "".join(self.iter_convert(filename, max_memory=max_memory))
+
+    def iter_convert(self, filename, max_memory=None):
+        """Convert an image file, yielding the result one terminal row at a time."""
+        filename = _open_input(filename)
+        stats = self._new_stats()
+        if self.cache is None:
+            img = self._load(filename, max_memory, stats)
+            return self._report(self._iter_pil(img, stats), stats)
+        return self._report(self._iter_cached(filename, max_memory, stats), stats)
+
+    def _load(self, fp, max_memory, stats=None):
+        start = time.perf_counter()
+        width, is_unicode, glyphs = self.width, self.is_unicode, self.glyphs
+        if self.graphics != "none":
+            # graphics are drawn at cell_size pixels per column
+            width, is_unicode, glyphs = self.width * cell_size[0], True, "half"
+        img = _load(
+            fp,
+            oWidth=width,
+            is_unicode=is_unicode,
+            max_memory=max_memory,
+            resample=self.resample,
+            glyphs=glyphs,
+        )
+        if stats is not None:
+            stats.add_time("decode", time.perf_counter() - start)
+        return img
+
+    def _iter_cached(self, filename, max_memory, stats):
+        if hasattr(filename, "read"):
+            data = filename.read()
+        else:
+            with open(filename, "rb") as f:
+                data = f.read()
+        # key on the palette's colors rather than its name, as the same name may
+        # be registered with other colors, by another process using the cache
+        options = dict(self.options, palette=_get_system_colors(self.palette))
+        key = self.cache.key(data, options)
+        ansi_str = self.cache.get(key)
+        if ansi_str is not None:
+            if stats is not None:
+                stats.count("cache_hits")
+            yield from ansi_str.splitlines(keepends=True)
+            return
+
+        rows = []
+        img = self._load(BytesIO(data), max_memory, stats)
+        for row in self._iter_pil(img, stats):
+            rows.append(row)
+            yield row
+        self.cache.put(key, "".join(rows))
+
+    def _new_stats(self):
+        """Return a RenderStats to record a conversion in, or None if nobody is listening."""
+        return RenderStats() if self.on_stats is not None else None
+
+    def _report(self, rows, stats):
+        """Yield rows, then pass the stats recorded while producing them to on_stats."""
+        if stats is None:
+            return rows
+        return self._yield_and_report(rows, stats)
+
+    def _yield_and_report(self, rows, stats):
+        yield from rows
+        self.on_stats(stats)
+
+    def stats(self):
+        """
+        Return a dict of counters for the renderer's caches: the palette tables
+        created, pixels whose color was already in a table (hits) or wasn't (misses),
+        distinct colors searched for, and if there is a render cache, its hits and
+        misses.
+        """
+        stats = self.tables.stats()
+        if self.cache is not None:
+            stats["cache_hits"] = self.cache.hits
+            stats["cache_misses"] = self.cache.misses
+        return stats
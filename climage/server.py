@@ -0,0 +1,382 @@
+import argparse
+import hashlib
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image
+
+from .__version__ import __version__
+from .climage import PaletteTables
+from .client import parse_address, render_options
+from .colors import _palette_entries, load_palette
+from .renderer import Renderer
+
+
+class RenderService:
+    """
+    Converts images for the requests made to a server, keeping what can be reused
+    between requests: the palette lookup tables stay filled in, and recently decoded
+    images are kept so converting them again skips decoding. Palettes sent by clients
+    are kept apart from those of the process, with lookup tables of their own, and
+    only the most recently used are kept.
+
+    Keyword Arguments:
+    jobs            -- Number of conversions run at once, default as many as the thread pool allows for the number of CPUs.
+    max_images      -- Number of decoded images kept, least recently used beyond this are dropped.
+    max_palettes    -- Number of palettes sent by clients kept, along with their lookup tables, least recently used beyond this are dropped.
+    palette_cache   -- Directory to keep the palette lookup tables in, see set_palette_cache. Default None (kept in memory).
+    allow_paths     -- Whether requests may name an image file for the server to read, rather than sending its contents. Default False.
+    """
+
+    def __init__(
+        self,
+        jobs=None,
+        max_images=32,
+        max_palettes=16,
+        palette_cache=None,
+        allow_paths=False,
+    ):
+        self.pool = ThreadPoolExecutor(max_workers=jobs)
+        self.tables = PaletteTables(cache_dir=palette_cache)
+        self.max_images = max_images
+        self.max_palettes = max_palettes
+        self.allow_paths = allow_paths
+        self._images = OrderedDict()
+        # the palettes sent by clients, and their tables, by their entries
+        self._palettes = OrderedDict()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.image_hits = 0
+        self.image_misses = 0
+
+    def render(self, options, data=None, path=None):
+        """
+        Convert an image given either its file contents, or the path of its file, on
+        the worker pool. options are those accepted by climage.convert, plus
+        palette_colors, the system colors of a palette to use that the server
+        doesn't have.
+        """
+        if path is not None and not self.allow_paths:
+            raise ValueError("this server doesn't accept paths, send the image instead")
+        if path is None and not data:
+            raise ValueError("no image given")
+        with self._lock:
+            self.requests += 1
+        return self.pool.submit(self._render, dict(options), data, path).result()
+
+    def _render(self, options, data, path):
+        max_memory = options.pop("max_memory", None)
+        colors = options.pop("palette_colors", None)
+        tables = self.tables
+        if colors is not None:
+            options["palette"], tables = self._palette(colors)
+        renderer = Renderer(tables=tables, **options)
+        img = self._image(renderer, max_memory, data, path)
+        return renderer.convert_pil(img)
+
+    def _palette(self, colors):
+        """
+        Return a client's palette, as the tuple of its entries renderers accept in
+        place of a name, along with the tables to look its colors up in. Palettes
+        aren't registered, as clients may use the same name for different ones.
+        """
+        if not isinstance(colors, list):
+            raise ValueError("palette_colors must be a list of colors")
+        palette = tuple(tuple(entry) for entry in _palette_entries(colors, "sent"))
+        with self._lock:
+            tables = self._palettes.get(palette)
+            if tables is not None:
+                self._palettes.move_to_end(palette)
+                return palette, tables
+            tables = self._palettes[palette] = PaletteTables(
+                cache_dir=self.tables.cache_dir
+            )
+            # conversions already using a dropped palette keep its tables until done
+            while len(self._palettes) > self.max_palettes:
+                self._palettes.popitem(last=False)
+        return palette, tables
+
+    def _image(self, renderer, max_memory, data, path):
+        if path is not None:
+            info = os.stat(path)
+            source = (os.path.abspath(path), info.st_mtime_ns, info.st_size)
+        else:
+            source = (hashlib.sha256(data).digest(),)
+        # images are decoded at a scale depending on the output size
+        key = source + (
+            renderer.width,
+            renderer.is_unicode,
+            renderer.resample,
+            renderer.graphics,
+            renderer.glyphs,
+            max_memory,
+        )
+        with self._lock:
+            img = self._images.get(key)
+            if img is not None:
+                self._images.move_to_end(key)
+                self.image_hits += 1
+                return img
+            self.image_misses += 1
+
+        img = renderer._load(path if path is not None else BytesIO(data), max_memory)
+        with self._lock:
+            self._images[key] = img
+            while len(self._images) > self.max_images:
+                self._images.popitem(last=False)
+        return img
+
+    def stats(self):
+        """Return a dict of the requests served, and how well the caches are doing."""
+        stats = self.tables.stats()
+        with self._lock:
+            client_tables = list(self._palettes.values())
+        for tables in client_tables:
+            for name, count in tables.stats().items():
+                stats[name] += count
+        stats.update(
+            client_palettes=len(client_tables),
+            requests=self.requests,
+            image_hits=self.image_hits,
+            image_misses=self.image_misses,
+        )
+        return stats
+
+    def close(self):
+        self.pool.shutdown()
+
+
+def _parse_query(query):
+    """Return the conversion options and image path given in a request's query string."""
+    options = {}
+    path = None
+    for name, values in parse_qs(query).items():
+        value = values[-1]
+        if name == "path":
+            path = value
+            continue
+        kind = render_options.get(name)
+        if kind is None:
+            raise ValueError("unknown option {}".format(name))
+        if kind is bool:
+            if value.lower() not in ("0", "1", "true", "false"):
+                raise ValueError("invalid value {!r} for {}".format(value, name))
+            options[name] = value.lower() in ("1", "true")
+        elif kind is int:
+            # sizes and counts, none of which can be zero
+            options[name] = int(value)
+            if options[name] < 1:
+                raise ValueError("{} must be at least 1".format(name))
+        else:
+            options[name] = kind(value)
+    # choosing another color mode turns off the default of 256 colors
+    if any(options.get(name) for name in ("is_truecolor", "is_16color", "is_8color")):
+        options.setdefault("is_256color", False)
+    return options, path
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "climage/" + __version__
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/render":
+            self._reply(404, "not found\n")
+            return
+        data = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        try:
+            options, path = _parse_query(url.query)
+            ansi_str = self.server.service.render(options, data=data, path=path)
+        except (
+            ValueError,
+            TypeError,
+            AssertionError,
+            OSError,
+            Image.DecompressionBombError,
+        ) as e:
+            # OSError includes images Pillow can't read
+            self._reply(400, "{}\n".format(e or "invalid options"))
+            return
+        except Exception as e:
+            # reply rather than dropping the connection
+            self.log_error("error converting image: %r", e)
+            self._reply(500, "error converting image: {}\n".format(e))
+            return
+        self._reply(200, ansi_str)
+
+    def do_GET(self):
+        if urlsplit(self.path).path != "/stats":
+            self._reply(404, "not found\n")
+            return
+        self._reply(200, json.dumps(self.server.service.stats()), "application/json")
+
+    def _reply(self, status, text, content_type="text/plain; charset=utf-8"):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # clients connecting over a Unix socket have no address
+        return self.client_address[0] if self.client_address else "local"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class _TCPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        _remove_stale_socket(self.server_address)
+        super().server_bind()
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+
+
+def _remove_stale_socket(path):
+    """Remove a socket left behind by a server that is no longer running."""
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(info.st_mode):
+        raise OSError("{} exists and isn't a socket".format(path))
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise OSError("a server is already listening on {}".format(path))
+
+
+def make_server(address, service=None, verbose=False):
+    """
+    Return a server converting images sent to address, ready to serve_forever().
+
+    Arguments:
+    address     -- Where to listen, a Unix socket path (containing a /) or [host:]port.
+
+    Keyword Arguments:
+    service     -- The RenderService converting the images, default one with default settings.
+    verbose     -- Whether to log each request to stderr.
+    """
+    kind, where = parse_address(address)
+    if kind == "unix":
+        server = _UnixServer(where, _Handler)
+    else:
+        server = _TCPServer(where, _Handler)
+    server.service = service if service is not None else RenderService()
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="climage serve",
+        description="Convert images for clients (climage --connect) over a Unix socket or local HTTP, keeping palettes and decoded images ready between requests.",
+    )
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument("--socket", metavar="path", help="Listen on this Unix socket.")
+    where.add_argument("--port", type=int, help="Listen for HTTP on this TCP port.")
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address to listen on with --port (default 127.0.0.1, only this machine).",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Number of images converted at once (default based on the number of CPUs).",
+    )
+    parser.add_argument(
+        "--max-images",
+        type=int,
+        default=32,
+        metavar="N",
+        help="Number of decoded images kept for reuse (default 32).",
+    )
+    parser.add_argument(
+        "--max-palettes",
+        type=int,
+        default=16,
+        metavar="N",
+        help="Number of palettes sent by clients kept, with their lookup tables (default 16).",
+    )
+    parser.add_argument(
+        "--palette-file",
+        action="append",
+        default=[],
+        metavar="file",
+        help="Make the palette in this file available to clients, by its file name without extension. May be repeated.",
+    )
+    parser.add_argument(
+        "--palette-cache",
+        metavar="dir",
+        help="Keep the palette lookup tables in this directory.",
+    )
+    parser.add_argument(
+        "--allow-paths",
+        action="store_true",
+        help="Let clients name image files for the server to read, rather than sending them. Only use this if every client may read every file the server can.",
+    )
+    parser.add_argument(
+        "--verbose", "-v", action="store_true", help="Log each request to stderr."
+    )
+    args = parser.parse_args(argv)
+
+    for palette_file in args.palette_file:
+        load_palette(palette_file)
+    if args.socket:
+        address = os.path.abspath(args.socket)
+    else:
+        address = "{}:{}".format(args.host, args.port)
+
+    service = RenderService(
+        jobs=args.jobs,
+        max_images=args.max_images,
+        max_palettes=args.max_palettes,
+        palette_cache=args.palette_cache,
+        allow_paths=args.allow_paths,
+    )
+    server = make_server(address, service, verbose=args.verbose)
+    # stop cleanly when terminated, removing the socket
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if args.verbose:
+        print("climage serving on {}".format(address), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
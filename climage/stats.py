@@ -0,0 +1,86 @@
+import time
+
+# the order stages happen in, for reports
+_stages = ["decode", "resize", "fit", "quantize", "emit"]
+
+
+class RenderStats:
+    """
+    Where the time went while converting an image, and how much work there was.
+
+    times holds the seconds spent in each stage of the conversion:
+        decode      -- Opening and decoding the image file.
+        resize      -- Resampling the image to the output size.
+        fit         -- Picking the colors and glyph of each cell, for quadrant and sextant glyphs.
+        quantize    -- Looking up the palette color of each pixel (including dithering).
+        emit        -- Building the escape sequences of each row.
+
+    counts holds:
+        source_pixels   -- Pixels in the image before it was resized.
+        pixels          -- Pixels drawn in the output.
+        lookup_hits     -- Pixels whose palette color was already in the lookup table.
+        lookup_misses   -- Pixels whose palette color had to be searched for.
+        colors_searched -- Distinct colors searched for because of those misses.
+        rows            -- Terminal rows output (for a Canvas, those with cells redrawn).
+        changed_cells   -- Cells a Canvas redrew, all of them for a full redraw.
+        output_bytes    -- Size of the output, encoded as UTF-8.
+        cache_hits      -- 1 if the output came from a RenderCache, without converting.
+
+    Stages and counts that didn't apply to a conversion are left out. When an image
+    is converted by several threads, their times are added up, so can be more than
+    the time the conversion took.
+    """
+
+    def __init__(self):
+        self.times = {}
+        self.counts = {}
+
+    def add_time(self, stage, seconds):
+        self.times[stage] = self.times.get(stage, 0.0) + seconds
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def merge(self, other):
+        """Add the times and counts recorded in another RenderStats to these."""
+        for stage, seconds in other.times.items():
+            self.add_time(stage, seconds)
+        for name, n in other.counts.items():
+            self.count(name, n)
+
+    @property
+    def total_time(self):
+        return sum(self.times.values())
+
+    def as_dict(self):
+        """Return the stats as a dict of plain values, e.g. for a metrics system."""
+        return {"times": dict(self.times), "counts": dict(self.counts)}
+
+    def report(self):
+        """Return a human readable summary, one line per stage or count."""
+        lines = []
+        stages = [s for s in _stages if s in self.times]
+        stages += [s for s in self.times if s not in _stages]
+        for stage in stages + ["total"]:
+            seconds = self.total_time if stage == "total" else self.times[stage]
+            lines.append("{:<16} {:10.2f} ms".format(stage, seconds * 1000))
+        for name, value in self.counts.items():
+            lines.append("{:<16} {:10d}".format(name, value))
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "RenderStats({!r})".format(self.as_dict())
+
+
+def timed(iterable, stats, stage):
+    """Yield from iterable, adding the time spent producing each item to a stage."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            stats.add_time(stage, time.perf_counter() - start)
+            return
+        stats.add_time(stage, time.perf_counter() - start)
+        yield item
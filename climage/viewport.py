@@ -0,0 +1,164 @@
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from .climage import _reducing_gap, resample_modes
+
+
+class TilePyramid:
+    """
+    Tiles of an image at a series of halving resolutions, for rendering viewports
+    of very large images while panning and zooming around them.
+
+    Level 0 is the image itself, and each level after it is half the size of the
+    one before. Levels are split into square tiles, which are only resampled from
+    the image when a viewport first needs them, and kept in a least recently used
+    cache. Moving the viewport then only resamples tiles that haven't been seen.
+
+    Arguments:
+    img         -- The Pillow image to view, converted to RGB if it isn't already.
+
+    Keyword Arguments:
+    tile_size   -- Width and height of the tiles, in pixels of their level.
+    max_tiles   -- Number of tiles kept in the cache, least recently used beyond this are dropped.
+    """
+
+    def __init__(self, img, tile_size=256, max_tiles=1024):
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        self.img = img
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def size(self):
+        return self.img.size
+
+    def level_size(self, level):
+        """Return the (width, height) of a level in pixels."""
+        factor = 1 << level
+        return (-(-self.img.width // factor), -(-self.img.height // factor))
+
+    def level_for(self, scale):
+        """
+        Return the smallest level that still has a pixel for every output pixel, when
+        each output pixel covers `scale` pixels of the image.
+        """
+        level = 0
+        while (2 << level) <= scale and min(self.level_size(level + 1)) > 1:
+            level += 1
+        return level
+
+    def tile(self, level, tx, ty):
+        """Return the (h, w, 3) pixels of a tile, at most tile_size on each side."""
+        key = (level, tx, ty)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return tile
+        self.misses += 1
+
+        factor = 1 << level
+        size = self.tile_size
+        level_width, level_height = self.level_size(level)
+        x0, y0 = tx * size, ty * size
+        x1, y1 = min(level_width, x0 + size), min(level_height, y0 + size)
+        box = (
+            x0 * factor,
+            y0 * factor,
+            min(self.img.width, x1 * factor),
+            min(self.img.height, y1 * factor),
+        )
+        if level == 0:
+            tile = np.asarray(self.img.crop(box))
+        else:
+            tile = np.asarray(
+                self.img.resize((x1 - x0, y1 - y0), box=box, reducing_gap=_reducing_gap)
+            )
+
+        self._tiles[key] = tile
+        if len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+        return tile
+
+    def region(self, level, box):
+        """Return the (h, w, 3) pixels of a level inside box (left, upper, right, lower)."""
+        left, upper, right, lower = box
+        size = self.tile_size
+        out = np.empty((lower - upper, right - left, 3), dtype=np.uint8)
+        for ty in range(upper // size, (lower - 1) // size + 1):
+            for tx in range(left // size, (right - 1) // size + 1):
+                tile = self.tile(level, tx, ty)
+                # the part of the box covered by this tile, in level pixels
+                x0 = max(left, tx * size)
+                y0 = max(upper, ty * size)
+                x1 = min(right, tx * size + tile.shape[1])
+                y1 = min(lower, ty * size + tile.shape[0])
+                out[y0 - upper : y1 - upper, x0 - left : x1 - left] = tile[
+                    y0 - ty * size : y1 - ty * size, x0 - tx * size : x1 - tx * size
+                ]
+        return out
+
+    def view(
+        self, x, y, zoom, out_width, out_height=None, resample="default", aspect=1.0
+    ):
+        """
+        Return the pixels drawn for a viewport as an (h, w, 3) array. The viewport is
+        kept inside the image, so is smaller than requested if the image doesn't fill it.
+
+        Arguments:
+        x, y        -- Centre of the viewport, as a fraction of the image width and height.
+        zoom        -- Magnification, where 1 fits the image width to out_width.
+        out_width   -- Width of the viewport, in output pixels.
+        out_height  -- Height of the viewport in output pixels, None shows the whole image height.
+        resample    -- The resampling mode used from the tiles to the output, see climage.convert.
+        aspect      -- How many times taller than wide the output pixels are drawn.
+        """
+        width, height = self.img.size
+        # image pixels covered by each output pixel
+        scale = width / (out_width * zoom)
+        view_width = min(width, out_width * scale)
+        view_height = (
+            height if out_height is None else min(height, out_height * scale * aspect)
+        )
+        left = min(max(0.0, x * width - view_width / 2), width - view_width)
+        upper = min(max(0.0, y * height - view_height / 2), height - view_height)
+        size = (
+            max(1, round(view_width / scale)),
+            max(1, round(view_height / (scale * aspect))),
+        )
+
+        level = self.level_for(scale)
+        factor = 1 << level
+        level_width, level_height = self.level_size(level)
+        # the viewport in level pixels, and the whole pixels enclosing it
+        fbox = (
+            left / factor,
+            upper / factor,
+            (left + view_width) / factor,
+            (upper + view_height) / factor,
+        )
+        box = (
+            int(fbox[0]),
+            int(fbox[1]),
+            min(level_width, -int(-fbox[2] // 1)),
+            min(level_height, -int(-fbox[3] // 1)),
+        )
+        region = Image.fromarray(self.region(level, box))
+        return np.asarray(
+            region.resize(
+                size,
+                resample_modes[resample][0],
+                box=(
+                    fbox[0] - box[0],
+                    fbox[1] - box[1],
+                    min(region.width, fbox[2] - box[0]),
+                    min(region.height, fbox[3] - box[1]),
+                ),
+            )
+        )
@@ -0,0 +1,353 @@
+"""
+Benchmarks the conversion pipeline across color modes, palettes, glyph modes and
+input types.
+
+Each case converts a test image and reports the time taken by each stage, the
+throughput in source pixels per second, the size of the output, and the peak
+Python and numpy heap memory allocated. The heap is traced by tracemalloc, which
+doesn't see the buffers Pillow allocates itself, so the memory reported for "pil"
+inputs leaves out resizing them. The test images are generated (gradients, noise, a flat logo),
+plus the screenshots in this folder, so no network access is needed. The time taken
+for a new interpreter to import climage and run the CLI is measured too.
+
+Run from the repository root:
+
+    python extra/benchmark.py                     # print a table
+    python extra/benchmark.py --json new.json     # also save the results
+    python extra/benchmark.py --compare old.json  # show speedups over old results
+
+Results are keyed by case name, so files saved by different versions of climage can
+be compared with --compare. Conversions go through the public API, which every
+version has; the breakdown into stages uses internals, and is left out for versions
+that don't have them.
+"""
+
+import argparse
+import importlib
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import climage  # noqa: E402
+
+# the conversion internals, used for the breakdown into stages where they exist
+core = importlib.import_module("climage.climage")
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# the characters drawn: ascii, unicode (half blocks), and where the installed
+# version has glyph modes, quadrants and sextants
+glyph_modes = ["ascii", "unicode"]
+if "glyphs" in inspect.signature(climage.convert_array).parameters:
+    glyph_modes += ["quadrant", "sextant"]
+
+color_modes = {
+    "truecolor": climage.color_types.truecolor,
+    "256": climage.color_types.color256,
+    "16": climage.color_types.color16,
+    "8": climage.color_types.color8,
+}
+
+
+def make_images(size):
+    """Return a dict of name -> RGB Pillow image."""
+    width, height = size
+    x = np.linspace(0, 255, width)[None, :].repeat(height, axis=0)
+    y = np.linspace(0, 255, height)[:, None].repeat(width, axis=1)
+    gradient = np.stack([x, y, 255 - x], axis=2).astype(np.uint8)
+
+    noise = np.random.default_rng(0).integers(0, 256, (height, width, 3), np.uint8)
+
+    # a handful of flat colored shapes, like a logo or a chart
+    logo = np.full((height, width, 3), (255, 255, 255), np.uint8)
+    logo[height // 8 : height // 2, width // 8 : width // 2] = (220, 50, 47)
+    logo[height // 2 :, width // 2 :] = (38, 139, 210)
+    logo[height // 3 : 2 * height // 3, width // 3 : 2 * width // 3] = (0, 0, 0)
+
+    images = {
+        "gradient": Image.fromarray(gradient),
+        "noise": Image.fromarray(noise),
+        "logo": Image.fromarray(logo),
+    }
+    for name in ("demo.png", "warholtruecolorunicode.png"):
+        photo = Image.open(os.path.join(here, name)).convert("RGB")
+        images["photo-" + os.path.splitext(name)[0]] = photo.resize(size)
+    return images
+
+
+def reset_tables():
+    """Drop the palette lookup tables, so the next conversion builds them again."""
+    tables = getattr(core, "default_tables", None)
+    if tables is not None:
+        tables.clear()
+
+
+def resize(img, width, glyph_mode):
+    """
+    Resize an image to the pixels drawn for width columns, as climage does before
+    converting, so the array inputs are the same for every version.
+    """
+    scale = img.width / width
+    if glyph_mode != "ascii":
+        # one pixel per column and two rows per cell for half blocks, 2x2 pixels
+        # per cell for quadrants and 2x3 for sextants, trimmed to whole cells
+        cell_width, cell_height = {"unicode": (1, 2), "quadrant": (2, 2)}.get(
+            glyph_mode, (2, 3)
+        )
+        height = int(img.height // scale) * cell_width
+        size = (width * cell_width, height - height % cell_height)
+    else:
+        # two columns per pixel
+        size = (width // 2, int(img.height // scale) // 2)
+    return img.resize(size, Image.BICUBIC)
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def peak_heap(func):
+    """
+    Return the peak Python and numpy memory allocated while running func, leaving
+    out Pillow's own buffers.
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_case(img, input_type, color_type, palette, glyph_mode, width, repeat):
+    """Time the stages of a single conversion, returning a dict of measurements."""
+    options = dict(is_unicode=glyph_mode != "ascii", palette=palette)
+    if glyph_mode in ("quadrant", "sextant"):
+        options["glyphs"] = glyph_mode
+    options.update(climage.color_to_flags(color_type))
+    stages = {}
+    resized, stages["resize"] = timed(resize, img, width, glyph_mode)
+    arr = np.asarray(resized)
+    if input_type == "list":
+        # convert_array also accepts nested python lists
+        arr = arr.tolist()
+
+    reset_tables()
+    quantize = getattr(core, "_quantize", None)
+    if glyph_mode in ("quadrant", "sextant"):
+        # the colors looked up are those fitted to each cell, not the pixels
+        quantize = None
+    if quantize is not None:
+        pixels = np.asarray(resized)
+        _, stages["quantize_cold"] = timed(quantize, pixels, color_type, palette)
+        _, stages["quantize"] = timed(quantize, pixels, color_type, palette)
+
+    if input_type == "pil":
+        convert = lambda: climage.convert_pil(img, width=width, **options)  # noqa: E731
+    else:
+        convert = lambda: climage.convert_array(arr, **options)  # noqa: E731
+    totals = []
+    for _ in range(repeat):
+        ansi_str, total = timed(convert)
+        totals.append(total)
+    stages["total"] = min(totals)
+    if quantize is not None:
+        # what's left after resizing and looking up colors is building the string
+        stages["emit"] = max(
+            0.0,
+            stages["total"]
+            - stages["quantize"]
+            - (stages["resize"] if input_type == "pil" else 0.0),
+        )
+
+    heap = peak_heap(convert)
+
+    if input_type == "pil":
+        # the whole source image is processed, not just the resized pixels
+        source_pixels = img.width * img.height
+    else:
+        source_pixels = resized.width * resized.height
+    return {
+        "stages": stages,
+        "pixels": source_pixels,
+        "pixels_per_sec": source_pixels / stages["total"],
+        "output_bytes": len(ansi_str.encode("utf-8")),
+        "peak_heap_bytes": heap,
+    }
+
+
+def bench_decode(repeat):
+    """Time decoding the screenshots in this folder from their encoded files."""
+    results = {}
+    for name in ("demo.png", "warholtruecolorunicode.png"):
+        path = os.path.join(here, name)
+        times = [
+            timed(lambda: Image.open(path).convert("RGB"))[1] for _ in range(repeat)
+        ]
+        results["decode/" + name] = {"stages": {"total": min(times)}}
+    return results
+
+
+def bench_startup(repeat):
+    """Time fresh interpreters importing climage, and running the CLI."""
+    root = os.path.join(here, "..")
+    commands = {
+        "startup/import": "import climage",
+        "startup/cli-version": "import sys, climage; sys.argv = ['climage', '--version']; climage.main()",
+        "startup/cli-convert": "import sys, climage; sys.argv = ['climage', '-w', '40', {!r}]; climage.main()".format(
+            os.path.join(here, "demo.png")
+        ),
+    }
+    results = {}
+    for name, code in commands.items():
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run(
+                [sys.executable, "-c", code],
+                cwd=root,
+                check=True,
+                stdout=subprocess.DEVNULL,
+            )
+            times.append(time.perf_counter() - start)
+        results[name] = {"stages": {"total": min(times)}}
+        report(name, results[name])
+    return results
+
+
+def bench_pixel_functions(repeat, count=20000):
+    """Time the single pixel helpers exposed by the library."""
+    rng = np.random.default_rng(1)
+    pixels = [tuple(p) for p in rng.integers(0, 256, (count, 3)).tolist()]
+    results = {}
+    for mode, color_type in color_modes.items():
+        for name, func in (
+            ("get_ansi_pixel", lambda p: climage.get_ansi_pixel(p, ctype=color_type)),
+            (
+                "get_dual_unicode_ansi_pixels",
+                lambda p: climage.get_dual_unicode_ansi_pixels(p, p, ctype=color_type),
+            ),
+        ):
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                for p in pixels:
+                    func(p)
+                times.append(time.perf_counter() - start)
+            results["{}/{}".format(name, mode)] = {
+                "stages": {"total": min(times)},
+                "pixels_per_sec": count / min(times),
+            }
+    return results
+
+
+def run(args):
+    images = make_images((args.size, args.size * 3 // 4))
+    palettes = ["default"] if args.quick else ["default", "solarized"]
+    results = {}
+    results.update(bench_startup(args.repeat))
+    results.update(bench_decode(args.repeat))
+    for image_name, img in images.items():
+        for mode, color_type in color_modes.items():
+            # palettes don't apply to truecolor
+            mode_palettes = palettes if mode != "truecolor" else ["default"]
+            for palette in mode_palettes:
+                for glyph_mode in glyph_modes:
+                    for input_type in ("pil", "array", "list"):
+                        name = "/".join(
+                            [image_name, mode, palette, glyph_mode, input_type]
+                        )
+                        results[name] = bench_case(
+                            img,
+                            input_type,
+                            color_type,
+                            palette,
+                            glyph_mode,
+                            args.cols,
+                            args.repeat,
+                        )
+                        report(name, results[name])
+    results.update(bench_pixel_functions(args.repeat))
+    return results
+
+
+def report(name, result, baseline=None):
+    stages = result["stages"]
+    line = "{:<60} {:>9.2f}ms".format(name, stages["total"] * 1000)
+    if "resize" in stages:
+        line += "  resize {:7.2f}ms".format(stages["resize"] * 1000)
+    if "quantize" in stages:
+        line += "  quantize {:7.2f}ms (cold {:7.2f}ms)  emit {:7.2f}ms".format(
+            stages["quantize"] * 1000,
+            stages["quantize_cold"] * 1000,
+            stages["emit"] * 1000,
+        )
+    if "pixels_per_sec" in result:
+        line += "  {:8.2f} Mpx/s".format(result["pixels_per_sec"] / 1e6)
+    if "output_bytes" in result:
+        line += "  {:9d} B out  {:7.1f} MiB heap".format(
+            result["output_bytes"], result["peak_heap_bytes"] / 2**20
+        )
+    if baseline is not None:
+        line += "  x{:.2f}".format(baseline["stages"]["total"] / stages["total"])
+    print(line)
+
+
+def main():
+    # the first paragraph of the docstring, as a single line
+    parser = argparse.ArgumentParser(description=" ".join(__doc__.split("\n\n")[0].split()))
+    parser.add_argument("--cols", type=int, default=200, help="output columns")
+    parser.add_argument(
+        "--size", type=int, default=1920, help="width of the generated test images"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case")
+    parser.add_argument(
+        "--quick", action="store_true", help="only benchmark the default palette"
+    )
+    parser.add_argument("--json", metavar="file", help="save the results as JSON")
+    parser.add_argument(
+        "--compare", metavar="file", help="JSON results to report speedups against"
+    )
+    args = parser.parse_args()
+
+    results = run(args)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        print("\nspeedup over {}".format(args.compare))
+        for name, result in results.items():
+            if name in baseline:
+                report(name, result, baseline[name])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "climage": climage.__version__,
+                    "python": platform.python_version(),
+                    "numpy": np.__version__,
+                    "pillow": Image.__version__,
+                    "platform": platform.platform(),
+                    "args": vars(args),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""A minimal terminal, recording the colors and text drawn in each cell."""
+import re
+
+_sequence = re.compile(r"\x1b\[([0-9;]*)([A-Za-z])|(.)", re.S)
+
+
+class Terminal:
+    def __init__(self):
+        # (row, column) -> (background, foreground, character)
+        self.cells = {}
+        self.row = 0
+        self.column = 0
+        self.bg = None
+        self.fg = None
+
+    def feed(self, text):
+        for match in _sequence.finditer(text):
+            params, command, char = match.groups()
+            if char is not None:
+                self._draw(char)
+            elif command == "m":
+                self._sgr([int(p) if p else 0 for p in params.split(";")])
+            else:
+                self._move(command, int(params or 1))
+
+    def _draw(self, char):
+        if char == "\n":
+            self.row += 1
+            self.column = 0
+        elif char == "\r":
+            self.column = 0
+        else:
+            # the foreground of a space can't be seen
+            fg = self.fg if char != " " else None
+            self.cells[self.row, self.column] = (self.bg, fg, char)
+            self.column += 1
+
+    def _sgr(self, params):
+        i = 0
+        while i < len(params):
+            p = params[i]
+            if p == 0:
+                self.bg = self.fg = None
+            elif p in (38, 48):
+                if params[i + 1] == 5:
+                    color = ("256", params[i + 2])
+                    i += 2
+                else:
+                    color = tuple(params[i + 2 : i + 5])
+                    i += 4
+                if p == 48:
+                    self.bg = color
+                else:
+                    self.fg = color
+            elif 40 <= p <= 47 or 100 <= p <= 107:
+                self.bg = p
+            elif 30 <= p <= 37 or 90 <= p <= 97:
+                self.fg = p
+            else:
+                raise ValueError("unexpected SGR parameter {}".format(p))
+            i += 1
+
+    def _move(self, command, n):
+        if command == "A":
+            self.row = max(0, self.row - n)
+        elif command == "B":
+            self.row += n
+        elif command == "C":
+            self.column += n
+        elif command == "J":
+            # clear from the cursor to the end of the screen
+            self.cells = {
+                (row, column): cell
+                for (row, column), cell in self.cells.items()
+                if (row, column) < (self.row, self.column)
+            }
+        else:
+            raise ValueError("unexpected sequence {}".format(command))
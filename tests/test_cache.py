@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+image = os.path.join(root, "extra", "demo.png")
+
+
+def _run_cli(*args):
+    code = "import sys, climage; sys.argv = ['climage'] + sys.argv[1:]; climage.main()"
+    return subprocess.run(
+        [sys.executable, "-c", code] + list(args),
+        cwd=root,
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout
+
+
+def _palette_file(directory, colors):
+    os.makedirs(directory)
+    path = os.path.join(directory, "mytheme.txt")
+    with open(path, "w") as f:
+        f.write("".join("#{:02x}{:02x}{:02x}\n".format(*color) for color in colors))
+    return path
+
+
+def test_cache_keyed_on_palette_colors(tmp_path):
+    # two themes registered under the same name, in separate processes
+    first = _palette_file(str(tmp_path / "a"), [(i * 16, 0, 0) for i in range(16)])
+    second = _palette_file(str(tmp_path / "b"), [(0, i * 16, 255) for i in range(16)])
+    cache = str(tmp_path / "cache")
+    for path in (first, second):
+        options = ("--16color", "--palette-file", path, "-w", "20", image)
+        uncached = _run_cli(*options)
+        assert _run_cli("--cache-dir", cache, *options) == uncached
+
+
+def test_cache_shared_with_workers(tmp_path):
+    import climage
+
+    cache = climage.RenderCache(str(tmp_path / "cache"))
+    files = [image, os.path.join(root, "extra", "demo8color.png")]
+    expected = [climage.convert(f, is_unicode=True, width=20) for f in files]
+    for _ in range(2):
+        # the second round is read back from the cache
+        converted = climage.convert_many(
+            files, jobs=2, is_unicode=True, width=20, cache=cache
+        )
+        assert list(converted) == expected
+    assert len(os.listdir(str(tmp_path / "cache"))) == len(files)
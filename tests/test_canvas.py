@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import climage
+from terminal import Terminal
+
+rng = np.random.default_rng(0)
+# a mostly still image, so most updates only redraw a few cells
+base = np.repeat(rng.integers(0, 256, size=(24, 10, 3), dtype=np.uint8), 4, axis=1)
+
+
+def _frames():
+    frame = base
+    for i in range(12):
+        frame = frame.copy()
+        y, x = rng.integers(0, 20), rng.integers(0, 36)
+        frame[y : y + rng.integers(1, 6), x : x + rng.integers(1, 6)] = rng.integers(
+            0, 256, 3
+        )
+        if i == 8:
+            # drawn smaller, so the canvas is cleared
+            frame = frame[:18]
+        yield frame
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        dict(),
+        dict(is_unicode=True),
+        dict(is_unicode=True, is_compact=True),
+        dict(is_16color=True, is_256color=False, dither="bayer"),
+        dict(is_truecolor=True, is_256color=False, is_compact=True),
+        dict(is_unicode=True, glyphs="quadrant", is_compact=True),
+        dict(is_unicode=True, glyphs="sextant", is_truecolor=True, is_256color=False),
+    ],
+)
+def test_updates_draw_full_frames(options):
+    renderer = climage.Renderer(**options)
+    canvas = climage.Canvas(renderer, refresh_every=5)
+    screen = Terminal()
+    screen.feed("above\n")
+    for frame in _frames():
+        update = canvas.update_array(frame)
+        screen.feed(update)
+        expected = Terminal()
+        expected.feed("above\n")
+        expected.feed(renderer.convert_array(frame))
+        assert screen.cells == expected.cells
+        # the cursor is left below the image, as after a full conversion
+        assert (screen.row, screen.column) == (expected.row, expected.column)
+
+
+def test_unchanged_frame_draws_nothing():
+    canvas = climage.Canvas()
+    canvas.update_array(base)
+    assert canvas.update_array(base.copy()) == ""
+
+
+def test_differential_update_smaller():
+    renderer = climage.Renderer(is_unicode=True)
+    canvas = climage.Canvas(renderer)
+    canvas.update_array(base)
+    frame = base.copy()
+    frame[4:6, 8:12] = 0
+    update = canvas.update_array(frame)
+    assert 0 < len(update) < len(renderer.convert_array(frame)) // 10
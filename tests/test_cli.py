@@ -0,0 +1,38 @@
+import os
+import shutil
+import subprocess
+import sys
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+image = os.path.join(root, "extra", "demo.png")
+
+
+def _run_cli(*args):
+    code = "import sys, climage; sys.argv = ['climage'] + sys.argv[1:]; climage.main()"
+    return subprocess.run(
+        [sys.executable, "-c", code] + list(args),
+        cwd=root,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+
+def test_output_dir_clashing_names(tmp_path):
+    for directory in ("d1", "d2"):
+        os.makedirs(str(tmp_path / directory))
+        shutil.copy(image, str(tmp_path / directory / "x.png"))
+    out = tmp_path / "out"
+    first = str(tmp_path / "d1" / "x.png")
+    second = str(tmp_path / "d2" / "x.png")
+    result = _run_cli("--output-dir", str(out), first, second)
+    assert result.returncode == 2
+    assert b"would both be written to" in result.stderr
+    assert not out.exists()
+
+
+def test_threads_must_be_positive():
+    for threads in ("0", "-2", "many"):
+        result = _run_cli("--threads", threads, image)
+        assert result.returncode == 2
+        assert b"argument --threads" in result.stderr
+    assert _run_cli("--threads", "2", "-w", "20", image).returncode == 0
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import climage
+from terminal import Terminal
+
+rng = np.random.default_rng(0)
+# runs of repeated colors, as compact output only elides colors repeated by neighbours
+noise = np.repeat(rng.integers(0, 256, size=(24, 12, 3), dtype=np.uint8), 3, axis=1)
+
+
+def _cells(ansi_str):
+    terminal = Terminal()
+    terminal.feed(ansi_str)
+    return terminal.cells
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        dict(),
+        dict(is_unicode=True),
+        dict(is_truecolor=True, is_256color=False),
+        dict(is_unicode=True, is_truecolor=True, is_256color=False),
+        dict(is_unicode=True, is_16color=True, is_256color=False),
+        dict(is_8color=True, is_256color=False, dither="bayer"),
+        dict(is_unicode=True, glyphs="quadrant"),
+        dict(is_unicode=True, glyphs="sextant", is_truecolor=True, is_256color=False),
+    ],
+)
+def test_compact_draws_same_cells(options):
+    full = climage.convert_array(noise, **options)
+    compact = climage.convert_array(noise, is_compact=True, **options)
+    assert len(compact) < len(full)
+    assert _cells(compact) == _cells(full)
@@ -0,0 +1,99 @@
+import unicodedata
+
+import numpy as np
+import pytest
+
+import climage
+from climage.glyphs import fit_cells, glyph_shapes, glyph_tables
+
+# the pixels, numbered as by the glyph tables' bits, named in glyphs' Unicode names
+_quadrant_names = {
+    "UPPER LEFT": {0},
+    "UPPER RIGHT": {1},
+    "LOWER LEFT": {2},
+    "LOWER RIGHT": {3},
+}
+# half blocks as quadrants, the only glyph mode with them
+_block_names = {
+    "SPACE": set(),
+    "FULL BLOCK": {0, 1, 2, 3, 4, 5},
+    "UPPER HALF BLOCK": {0, 1},
+    "LOWER HALF BLOCK": {2, 3},
+}
+
+
+def _pixel_count(glyphs):
+    cell_width, cell_height = glyph_shapes[glyphs]
+    return cell_width * cell_height
+
+
+def _pixels_drawn(glyphs, char):
+    """Return the set of pixels a glyph draws in the foreground color, by its name."""
+    name = unicodedata.name(char)
+    if name.startswith("BLOCK SEXTANT-"):
+        return {int(n) - 1 for n in name[len("BLOCK SEXTANT-") :]}
+    if name.startswith("QUADRANT "):
+        parts = name[len("QUADRANT ") :].split(" AND ")
+        return set().union(*(_quadrant_names[part] for part in parts))
+    if name in ("LEFT HALF BLOCK", "RIGHT HALF BLOCK"):
+        cell_width, cell_height = glyph_shapes[glyphs]
+        column = 0 if name.startswith("LEFT") else 1
+        return {row * cell_width + column for row in range(cell_height)}
+    return {p for p in _block_names[name] if p < _pixel_count(glyphs)}
+
+
+@pytest.mark.parametrize("glyphs", ["quadrant", "sextant"])
+def test_glyph_tables(glyphs):
+    table = glyph_tables[glyphs]
+    assert len(set(table.tolist())) == len(table)
+    for bits, char in enumerate(table.tolist()):
+        drawn = {p for p in range(_pixel_count(glyphs)) if bits >> p & 1}
+        assert _pixels_drawn(glyphs, char) == drawn, (bits, char)
+
+
+def _block(glyphs, bits, fg, bg):
+    """Return a single cell's pixels, drawing the pixels set in bits in fg."""
+    cell_width, cell_height = glyph_shapes[glyphs]
+    pixels = [fg if bits >> p & 1 else bg for p in range(_pixel_count(glyphs))]
+    return np.array(pixels, dtype=np.uint8).reshape(cell_height, cell_width, 3)
+
+
+@pytest.mark.parametrize("glyphs", ["quadrant", "sextant"])
+def test_two_color_cells_fitted_exactly(glyphs):
+    n = _pixel_count(glyphs)
+    fg, bg = (250, 40, 10), (5, 60, 200)
+    for bits in range(1, (1 << n) - 1):
+        colors, masks = fit_cells(_block(glyphs, bits, fg, bg), glyphs)
+        mask = int(masks[0, 0])
+        fitted_bg, fitted_fg = (tuple(c) for c in colors[:, 0].tolist())
+        # the last pixel is kept in the background, swapping the colors if need be
+        if bits >> (n - 1) & 1:
+            assert (mask, fitted_fg, fitted_bg) == (~bits & ((1 << n) - 1), bg, fg)
+        else:
+            assert (mask, fitted_fg, fitted_bg) == (bits, fg, bg)
+
+
+@pytest.mark.parametrize("glyphs", ["quadrant", "sextant"])
+def test_uniform_cell_fitted_as_space(glyphs):
+    colors, masks = fit_cells(_block(glyphs, 0, (0, 0, 0), (30, 90, 150)), glyphs)
+    assert masks[0, 0] == 0
+    assert colors[:, 0].tolist() == [[30, 90, 150], [30, 90, 150]]
+
+
+@pytest.mark.parametrize("glyphs", ["quadrant", "sextant"])
+def test_noisy_cell_split_by_color(glyphs):
+    # two groups of slightly different pixels are still told apart
+    n = _pixel_count(glyphs)
+    bits = 0b0110 if glyphs == "quadrant" else 0b011010
+    block = _block(glyphs, bits, (200, 200, 200), (20, 20, 20)).astype(np.int32)
+    block += np.arange(n).reshape(block.shape[:2])[..., None] % 3
+    masks = fit_cells(block.astype(np.uint8), glyphs)[1]
+    assert masks[0, 0] == bits
+
+
+def test_glyph_in_output():
+    # a 2x2 image, dark in the top right and bottom left
+    arr = _block("quadrant", 0b0110, (0, 0, 0), (255, 255, 255))
+    output = climage.convert_array(arr, is_unicode=True, glyphs="quadrant")
+    assert glyph_tables["quadrant"][0b0110] == "▞"
+    assert "▞" in output
@@ -0,0 +1,147 @@
+import base64
+import re
+import zlib
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import climage
+from climage.graphics import _kitty_chunk_size, cell_size, kitty_rows, sixel_rows
+
+rng = np.random.default_rng(0)
+noise = rng.integers(0, 256, size=(45, 70, 3), dtype=np.uint8)
+
+_kitty_sequence = re.compile(r"\x1b_G([^;\x1b]*);([A-Za-z0-9+/=]*)\x1b\\")
+_sixel_header = re.compile(r'\x1bP0;1;0q"1;1;(\d+);(\d+)(.*)\x1b\\\n', re.S)
+# a color definition or selection, a repeated character, a character, $ (back to
+# the start of the band) or - (on to the next band)
+_sixel_token = re.compile(
+    r"#(\d+)(?:;2;(\d+);(\d+);(\d+))?|!(\d+)([?-~])|([?-~])|(\$)|(-)"
+)
+
+
+def _decode_kitty(output):
+    """Return the control data of a kitty image, and its decompressed pixels."""
+    assert output.endswith("\n")
+    sequences = []
+    position = 0
+    while position < len(output) - 1:
+        match = _kitty_sequence.match(output, position)
+        assert match, "malformed sequence at {}".format(position)
+        sequences.append(match.groups())
+        position = match.end()
+
+    controls = [dict(p.split("=") for p in c.split(",")) for c, _ in sequences]
+    # every chunk but the last says more follow
+    assert [c.pop("m") for c in controls] == ["1"] * (len(controls) - 1) + ["0"]
+    assert all(not c for c in controls[1:])
+    # chunks hold whole groups of 4 base64 characters, and only the last may be short
+    assert all(len(payload) == _kitty_chunk_size for _, payload in sequences[:-1])
+    assert len(sequences[-1][1]) <= _kitty_chunk_size
+    assert len(sequences[-1][1]) % 4 == 0
+    payload = "".join(payload for _, payload in sequences)
+    return controls[0], zlib.decompress(base64.standard_b64decode(payload))
+
+
+def _decode_sixel(output):
+    """Return the colors of the registers defined, and the (h, w) registers drawn."""
+    header = _sixel_header.fullmatch(output)
+    assert header, "not a sixel sequence"
+    width, height, data = int(header[1]), int(header[2]), header[3]
+    colors = {}
+    codes = np.full((height, width), -1)
+    color = y = x = 0
+    position = 0
+    while position < len(data):
+        token = _sixel_token.match(data, position)
+        assert token, "malformed sixel data at {}".format(position)
+        position = token.end()
+        register, r, g, b, count, repeated, char, back, down = token.groups()
+        if r is not None:
+            colors[int(register)] = (int(r), int(g), int(b))
+        elif register is not None:
+            color = int(register)
+            assert color in colors, "register used before being defined"
+        elif back:
+            x = 0
+        elif down:
+            x = 0
+            y += 6
+        else:
+            n = int(count) if count else 1
+            bits = ord(repeated or char) - 63
+            assert x + n <= width
+            for dy in range(6):
+                if bits >> dy & 1:
+                    assert (codes[y + dy, x : x + n] == -1).all(), "pixel drawn twice"
+                    codes[y + dy, x : x + n] = color
+            x += n
+    return colors, codes
+
+
+@pytest.mark.parametrize("columns", [None, 12])
+def test_kitty_sequences(columns):
+    control, pixels = _decode_kitty("".join(kitty_rows(noise, columns=columns)))
+    expected = dict(a="T", f="24", o="z", s="70", v="45")
+    if columns is not None:
+        expected["c"] = str(columns)
+    assert control == expected
+    assert pixels == noise.tobytes()
+
+
+def test_kitty_split_into_chunks():
+    # incompressible, so the payload takes several chunks
+    big = rng.integers(0, 256, size=(80, 120, 4), dtype=np.uint8)
+    output = "".join(kitty_rows(big))
+    assert output.count("\x1b_G") > 1
+    control, pixels = _decode_kitty(output)
+    assert (control["s"], control["v"]) == ("120", "80")
+    # the alpha channel is dropped
+    assert pixels == np.ascontiguousarray(big[..., :3]).tobytes()
+
+
+@pytest.mark.parametrize("height", [1, 6, 13, 45])
+def test_sixel_sequences(height):
+    codes = rng.integers(0, 16, size=(height, 70))
+    palette = rng.integers(0, 256, size=(16, 3))
+    colors, drawn = _decode_sixel("".join(sixel_rows(codes, palette)))
+    assert (drawn == codes).all()
+    used = np.unique(codes).tolist()
+    assert sorted(colors) == used
+    for code in used:
+        assert colors[code] == tuple(((palette[code] * 100 + 127) // 255).tolist())
+
+
+def test_sixel_runs():
+    # long runs of one color are written with repeat counts
+    codes = np.zeros((6, 70), dtype=np.intp)
+    codes[:, 30:] = 1
+    output = "".join(sixel_rows(codes, [[0, 0, 0], [255, 255, 255]]))
+    assert "!30~" in output and "!40~" in output
+    assert (_decode_sixel(output)[1] == codes).all()
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        dict(is_16color=True, is_256color=False),
+        dict(),
+        dict(is_truecolor=True, is_256color=False, dither="floyd-steinberg"),
+    ],
+)
+def test_sixel_conversion(options):
+    output = climage.convert_array(noise, graphics="sixel", **options)
+    drawn = _decode_sixel(output)[1]
+    assert drawn.shape == noise.shape[:2]
+    assert (drawn >= 0).all(), "every pixel is drawn"
+
+
+def test_kitty_conversion_size():
+    # images are shrunk to about cell_size pixels per column
+    big = np.zeros((300, 1000, 3), dtype=np.uint8)
+    output = climage.convert_pil(Image.fromarray(big), width=20, graphics="kitty")
+    control, pixels = _decode_kitty(output)
+    assert int(control["s"]) == 20 * cell_size[0]
+    assert control["c"] == "20"
+    assert len(pixels) == int(control["s"]) * int(control["v"]) * 3
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import climage
+
+# 400x300 pixels, which Pillow stores in 480000 bytes once converted to RGB
+size = (400, 300)
+
+
+def _save(tmp_path, mode):
+    pixels = np.random.default_rng(0).integers(0, 256, size[::-1] + (3,), np.uint8)
+    img = Image.fromarray(pixels)
+    img = img.quantize(64) if mode == "P" else img.convert(mode)
+    path = tmp_path / "image-{}.png".format(mode)
+    img.save(path)
+    return str(path)
+
+
+def test_max_memory_counts_rgb_padding(tmp_path):
+    # RGB takes four bytes per pixel in Pillow, not three
+    path = _save(tmp_path, "RGB")
+    with pytest.raises(ValueError):
+        climage.convert(path, max_memory=400000)
+    assert climage.convert(path, max_memory=480000)
+
+
+@pytest.mark.parametrize("mode", ["P", "L"])
+def test_max_memory_counts_source_of_conversion(tmp_path, mode):
+    # the decoded image is still held while it's converted to RGB
+    path = _save(tmp_path, mode)
+    with pytest.raises(ValueError):
+        climage.convert(path, max_memory=500000)
+    assert climage.convert(path, max_memory=600000)
@@ -0,0 +1,33 @@
+import io
+
+from climage.output import write_rows
+
+
+class _Recorder(io.BytesIO):
+    def __init__(self, is_tty):
+        super().__init__()
+        self.is_tty = is_tty
+        self.flushed = []
+
+    def isatty(self):
+        return self.is_tty
+
+    def flush(self):
+        self.flushed.append(self.getvalue())
+
+
+rows = ["row {}\n".format(i) for i in range(100)]
+
+
+def test_terminal_written_every_row():
+    out = _Recorder(is_tty=True)
+    write_rows(iter(rows), out)
+    # each row reaches the terminal before the next is converted
+    assert out.flushed[:3] == [b"row 0\n", b"row 0\nrow 1\n", b"row 0\nrow 1\nrow 2\n"]
+    assert out.getvalue() == "".join(rows).encode()
+
+
+def test_file_written_in_chunks():
+    out = _Recorder(is_tty=False)
+    write_rows(iter(rows), out)
+    assert out.flushed == ["".join(rows).encode()]
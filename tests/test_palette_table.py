@@ -0,0 +1,48 @@
+import kdtree
+import numpy as np
+import pytest
+
+from climage.climage import PaletteTable, PixelMapping, pack_rgb
+from climage.colors import _get_palette_colors, color_types
+
+
+def _kdtree_nearest(color_type, palette, colors):
+    tree = kdtree.create(
+        [PixelMapping(*col) for col in _get_palette_colors(color_type, palette)]
+    )
+    return [tree.search_nn(tuple(color))[0].data.code for color in colors.tolist()]
+
+
+def _test_colors(color_type, palette):
+    rng = np.random.default_rng(0)
+    colors = [rng.integers(0, 256, size=(2000, 3))]
+    # the palette's own colors, and the midpoints between pairs of them, which are
+    # equally close to both (the 256 color palette also has duplicate colors)
+    entries = np.array(_get_palette_colors(color_type, palette))[:, :3]
+    pairs = rng.integers(0, len(entries), size=(2000, 2))
+    colors.append(entries)
+    colors.append((entries[pairs[:, 0]] + entries[pairs[:, 1]]) // 2)
+    return np.concatenate(colors)
+
+
+@pytest.mark.parametrize(
+    "color_type", [color_types.color256, color_types.color16, color_types.color8]
+)
+@pytest.mark.parametrize("palette", ["default", "solarized", "gruvboxdark"])
+def test_lookup_matches_kdtree(color_type, palette):
+    colors = _test_colors(color_type, palette)
+    table = PaletteTable(color_type, palette)
+    codes = table.lookup(pack_rgb(colors))
+    assert codes.tolist() == _kdtree_nearest(color_type, palette, colors)
+    # and once filled in, looking them up again gives the same codes
+    assert table.lookup(pack_rgb(colors)).tolist() == codes.tolist()
+    assert [table.lookup_one(c) for c in colors[:50]] == codes[:50].tolist()
+
+
+def test_ties_broken_as_kdtree():
+    # black is in the 256 color palette twice, as system color 0 and in the cube,
+    # and (64, 0, 0) is halfway between black and the default palette's dark red
+    colors = np.array([[0, 0, 0], [64, 0, 0], [255, 255, 255]])
+    table = PaletteTable(color_types.color256, "default")
+    codes = table.lookup(pack_rgb(colors)).tolist()
+    assert codes == _kdtree_nearest(color_types.color256, "default", colors)
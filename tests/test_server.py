@@ -0,0 +1,88 @@
+import os
+import threading
+
+import pytest
+
+import climage
+from climage.colors import palettes
+from climage.client import render
+from climage.server import RenderService, make_server
+
+image = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "extra", "demo.png")
+
+
+@pytest.fixture
+def address(tmp_path):
+    address = str(tmp_path / "climage.sock")
+    server = make_server(address)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield address
+    server.shutdown()
+    server.server_close()
+    server.service.close()
+
+
+def test_palette_colors_sent_to_server(address):
+    colors = [[i * 16, 255 - i * 16, 64] for i in range(16)]
+    climage.register_palette("test-server-theme", colors)
+    expected = climage.convert(
+        image,
+        width=20,
+        is_16color=True,
+        is_256color=False,
+        palette="test-server-theme",
+    )
+    with open(image, "rb") as f:
+        data = f.read()
+    ansi_str = render(
+        address,
+        data=data,
+        width=20,
+        is_16color=True,
+        is_256color=False,
+        palette_colors=colors,
+    )
+    assert ansi_str == expected
+
+
+def test_invalid_palette_colors_rejected(address):
+    with open(image, "rb") as f:
+        data = f.read()
+    with pytest.raises(RuntimeError, match="16 colors"):
+        render(address, data=data, palette_colors=[[0, 0, 0]])
+
+
+def test_invalid_width_rejected(address):
+    with open(image, "rb") as f:
+        data = f.read()
+    with pytest.raises(RuntimeError, match="width must be at least 1"):
+        render(address, data=data, width=0)
+
+
+def test_unexpected_error_replied(address, monkeypatch):
+    def fail(self, options, data, path):
+        raise ZeroDivisionError("division by zero")
+
+    monkeypatch.setattr(RenderService, "_render", fail)
+    with open(image, "rb") as f:
+        data = f.read()
+    with pytest.raises(RuntimeError, match="error converting image: division by zero"):
+        render(address, data=data)
+
+
+def test_client_palettes_bounded():
+    service = RenderService(max_palettes=2)
+    registered = list(palettes)
+    with open(image, "rb") as f:
+        data = f.read()
+    options = dict(width=10, is_16color=True, is_256color=False)
+    try:
+        for shade in range(4):
+            sent = [[i * 16, shade * 60, 0] for i in range(16)]
+            service.render(dict(options, palette_colors=sent), data=data)
+        assert service.stats()["client_palettes"] == 2
+    finally:
+        service.close()
+    # the palettes are kept by the service, not added to the process's
+    assert palettes == registered
@@ -0,0 +1,35 @@
+import os
+
+import numpy as np
+import pytest
+
+import climage
+
+image = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "extra", "demo.png")
+rng = np.random.default_rng(0)
+# tall enough for several bands, which don't divide the rows of cells evenly
+noise = rng.integers(0, 256, size=(210, 90, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        dict(),
+        dict(is_unicode=True, is_compact=True),
+        dict(is_truecolor=True, is_256color=False),
+        dict(is_16color=True, is_256color=False, is_perceptual=True),
+        dict(is_8color=True, is_256color=False, dither="bayer"),
+        dict(is_unicode=True, dither="floyd-steinberg"),
+        dict(is_unicode=True, glyphs="quadrant"),
+        dict(is_unicode=True, glyphs="sextant", is_truecolor=True, is_256color=False),
+    ],
+)
+@pytest.mark.parametrize("threads", [2, 3, 8])
+def test_threads_same_output(options, threads):
+    expected = climage.convert_array(noise, **options)
+    assert climage.convert_array(noise, threads=threads, **options) == expected
+
+
+def test_threads_same_output_for_files():
+    expected = climage.convert(image, is_unicode=True, width=120)
+    assert climage.convert(image, is_unicode=True, width=120, threads=4) == expected